@@ -4,13 +4,23 @@ from datetime import datetime
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 
 
 from jinja2 import Environment, FileSystemLoader
-from modelo_divida import rodar_modelo
-from cenarios import CENARIO_BASE, CENARIO_ESTRESSE, CENARIO_OTIMISTA
-from mercado import pegar_cdi, pegar_ipca, pegar_selic, pegar_sofr, pegar_cambio
+from modelo_divida import ErroValidacao, fluxo_do_contrato, indexar_fluxo, passos_rodada, rodar_cenarios
+from cenarios import CENARIOS_PADRAO, CenarioMercado
+from curvas import CurvaDesconto, carregar_cambios, carregar_projecoes
+from graficos import grafico_barras, grafico_linha
+from matrizes import ATRIBUTOS, montar_matrizes
+from cubo import DIMENSOES, MEDIDAS_CUBO, montar_cubo
+from otimizador import otimizar_reestruturacao
+from equilibrio import METRICAS_ALVO, VARIAVEIS, resolver_equilibrio
+from mercado import foto_mercado, pegar_cdi, pegar_ipca, pegar_selic, pegar_sofr, pegar_cambio, situacao_fontes
+from armazem_rodadas import ArmazemRodadas, chave_rodada, hash_conteudo
+from comparacao import METRICAS, comparar_rodadas, fluxo_anual_cenarios, tabela_cenarios
+from risco import COLUNAS_RISCO
+from simulacao_historica import var_historico
+from tarefas import CANCELADA, ERRO, NA_FILA, FilaTarefas, formatar_duracao
 
 
 # =========================================================
@@ -42,6 +52,20 @@ st.markdown(
 """
 )
 
+# Fontes fora do ar: o disjuntor serve cache ou valor padrão sem esperar
+# e tenta a fonte de novo em segundo plano
+fontes_defasadas = {nome: info for nome, info in situacao_fontes().items() if info["origem"] != "api"}
+if fontes_defasadas:
+    linhas_fontes = [
+        f"- {nome}: " + (
+            f"cache de {info['atualizado_em'].replace('T', ' ')}" if info["origem"] == "cache" and info["atualizado_em"]
+            else "cache local" if info["origem"] == "cache"
+            else "valor padrão do modelo"
+        ) + (f" (nova tentativa às {info['proxima_tentativa'][11:16]})" if info["proxima_tentativa"] else "")
+        for nome, info in fontes_defasadas.items()
+    ]
+    st.warning("⚠️ Fontes de mercado indisponíveis; usando dados defasados:\n" + "\n".join(linhas_fontes))
+
 
 # =========================================================
 # 📂 UPLOAD DA PLANILHA (FUNCIONA LOCAL E NA NUVEM)
@@ -54,43 +78,225 @@ arquivo = st.sidebar.file_uploader(
     type=["xlsx"]
 )
 
+# Todos os cenários são rodados juntos ao enviar a planilha; trocar de
+# cenário só consulta os resultados já calculados
+cenarios_rodada = list(CENARIOS_PADRAO)
+
+with st.sidebar.expander("Cenário personalizado"):
+    usar_personalizado = st.checkbox("Incluir cenário personalizado")
+    if usar_personalizado:
+        cenarios_rodada.append(
+            CenarioMercado(
+                nome="Personalizado",
+                choque_cdi_bps=st.number_input("Choque CDI (bps)", value=0.0, step=25.0),
+                choque_ipca_bps=st.number_input("Choque IPCA (bps)", value=0.0, step=25.0),
+                choque_cambio_pct=st.number_input("Choque câmbio (%)", value=0.0, step=5.0) / 100,
+                choque_spread_bps=st.number_input("Choque spread (bps)", value=0.0, step=25.0),
+            )
+        )
+
+mapa_cenarios = {c.nome: c for c in cenarios_rodada}
+
 cenario_opcao = st.sidebar.selectbox(
     "Cenário de Mercado",
-    ["Base", "Estresse", "Otimista"]
+    list(mapa_cenarios)
 )
 
-mapa_cenarios = {
-    "Base": CENARIO_BASE,
-    "Estresse": CENARIO_ESTRESSE,
-    "Otimista": CENARIO_OTIMISTA,
-}
-
 cenario_escolhido = mapa_cenarios[cenario_opcao]
 
-if arquivo is None:
-    st.warning("Envie a planilha para iniciar a simulação.")
-    st.stop()
+arquivo_curva = st.sidebar.file_uploader(
+    "Curva de desconto (opcional: DI futuro / pré, colunas DU ou Data e Taxa)",
+    type=["csv", "xlsx"]
+)
+
+if arquivo_curva is None:
+    curva_desconto = CurvaDesconto.plana(cdi)
+else:
+    try:
+        curva_desconto = CurvaDesconto.de_arquivo(arquivo_curva)
+    except Exception as e:
+        st.sidebar.error(f"Erro ao ler a curva de desconto: {e}")
+        curva_desconto = CurvaDesconto.plana(cdi)
+
+arquivo_projecoes = st.sidebar.file_uploader(
+    "Projeções de indexadores (opcional: Focus / interna, colunas Indexador, Data e Taxa)",
+    type=["csv", "xlsx"]
+)
+
+projecoes = None
+if arquivo_projecoes is not None:
+    try:
+        projecoes = carregar_projecoes(arquivo_projecoes)
+    except Exception as e:
+        st.sidebar.error(f"Erro ao ler as projeções: {e}")
+
+cambio_paridade = st.sidebar.checkbox(
+    "Projetar câmbio a termo por paridade de juros (CDI × SOFR / juros externos)",
+    value=True,
+)
+
+arquivo_cambios = st.sidebar.file_uploader(
+    "Câmbio a termo (opcional: colunas Moeda, Data e Cambio; prevalece sobre a paridade)",
+    type=["csv", "xlsx"]
+)
+
+cambios = None
+if arquivo_cambios is not None:
+    try:
+        cambios = carregar_cambios(arquivo_cambios)
+    except Exception as e:
+        st.sidebar.error(f"Erro ao ler o câmbio a termo: {e}")
+
+arquivo_historico = st.sidebar.file_uploader(
+    "Modo backtest (opcional): séries diárias realizadas (Data, CDI, SELIC, IPCA, SOFR, USD...)",
+    type=["csv", "xlsx"]
+)
 
-try:
-    contratos = pd.read_excel(arquivo, engine="openpyxl")
+armazem = ArmazemRodadas()
+rodadas_salvas = armazem.rodadas()
+opcoes_rodadas = ["(nova simulação)"] + [
+    f"{r.Descricao} — {str(r.Criada)[:16].replace('T', ' ')}" for r in rodadas_salvas.itertuples()
+]
+rodada_escolhida = st.sidebar.selectbox("Reabrir rodada salva", range(len(opcoes_rodadas)), format_func=lambda i: opcoes_rodadas[i])
 
-except Exception as e:
-    st.error(f"Erro ao ler a planilha: {e}")
+if rodada_escolhida == 0 and arquivo is None:
+    st.warning("Envie a planilha para iniciar a simulação.")
     st.stop()
 
 
 # =========================================================
-# 🔹 RODAR MODELO
+# 🔹 RODAR MODELO (OU REABRIR DO ARMAZÉM)
 # =========================================================
 
-try:
-    resumo, fluxo, carteira, fluxo_anual, fluxo_mensal, ranking = rodar_modelo(
-        contratos,
-        cenario=cenario_escolhido,
+@st.cache_resource
+def fila_de_tarefas():
+    """Fila de rodadas do processo: sobrevive a reruns, sessões e troca de página."""
+    return FilaTarefas()
+
+
+def rodar_e_salvar(contratos, cenarios, chaves, nome_arquivo, progresso=None, cancelar=None, **opcoes):
+    """Tarefa em segundo plano: roda os cenários e guarda cada um no armazém."""
+    novas = rodar_cenarios(contratos, cenarios, progresso=progresso, cancelar=cancelar, **opcoes)
+    for nome, saidas in novas.items():
+        ArmazemRodadas().salvar(chaves[nome], saidas, descricao=f"{nome_arquivo} · {nome}")
+    return {chaves[nome]: saidas for nome, saidas in novas.items()}
+
+
+@st.fragment(run_every=1.0)
+def acompanhar_tarefa(id_tarefa):
+    """Progresso da rodada em segundo plano, atualizado a cada segundo."""
+    tarefa = fila_de_tarefas().tarefa(id_tarefa)
+    if tarefa is None or tarefa.terminada:
+        st.rerun()
+
+    if tarefa.estado == NA_FILA:
+        st.info(f"Na fila: {tarefa.descricao}")
+    else:
+        st.progress(
+            tarefa.fracao,
+            text=(
+                f"Rodando {tarefa.descricao}: {tarefa.fracao:.0%} · "
+                f"{formatar_duracao(tarefa.decorrido)} decorridos · faltam ~{formatar_duracao(tarefa.eta)}"
+            ),
+        )
+    st.caption("A rodada continua se você sair desta página; o resultado fica salvo no armazém.")
+    if st.button("⏹️ Cancelar rodada"):
+        fila_de_tarefas().cancelar(id_tarefa)
+        st.rerun()
+
+
+if rodada_escolhida > 0:
+    chave_resultados = rodadas_salvas["Chave"].iloc[rodada_escolhida - 1]
+    resultados = armazem.abrir(chave_resultados)
+    if resultados is None:
+        st.error("Rodada não encontrada no armazém (pode ter sido removida pelo limite de espaço).")
+        st.stop()
+    contratos = pd.DataFrame()
+    rodadas_cenarios = {}
+    st.caption(f"Rodada reaberta do armazém: {opcoes_rodadas[rodada_escolhida]}")
+else:
+    try:
+        contratos = pd.read_excel(arquivo, engine="openpyxl")
+
+    except Exception as e:
+        st.error(f"Erro ao ler a planilha: {e}")
+        st.stop()
+
+    # Uma leitura do mercado por rodada: a mesma foto entra na chave e no modelo
+    mercado_rodada = foto_mercado(contratos["Moeda"].astype(str).str.upper().unique() if "Moeda" in contratos.columns else [])
+    hash_planilha = hash_conteudo(arquivo)
+    opcoes_chave = dict(
+        curva=hash_conteudo(arquivo_curva),
+        data_base=curva_desconto.data_base,
+        projecoes=hash_conteudo(arquivo_projecoes),
+        cambios=hash_conteudo(arquivo_cambios),
+        historico=hash_conteudo(arquivo_historico),
+        cambio_paridade=cambio_paridade,
     )
-except Exception as e:
-    st.error(f"Erro ao rodar o modelo de dívida: {e}")
-    st.stop()
+    chaves = {c.nome: chave_rodada(hash_planilha, c, mercado_rodada, **opcoes_chave) for c in cenarios_rodada}
+
+    # Resultados por chave na sessão: trocar de cenário é só uma consulta
+    rodadas_sessao = st.session_state.setdefault("rodadas_cenarios", {})
+    for nome, chave in chaves.items():
+        if chave not in rodadas_sessao:
+            salva = armazem.abrir(chave)
+            if salva is not None:
+                rodadas_sessao[chave] = salva
+
+    faltando = [c for c in cenarios_rodada if chaves[c.nome] not in rodadas_sessao]
+    if faltando:
+        # Rodada em segundo plano: a página mostra o progresso e pode ser
+        # deixada; o resultado vai para o armazém ao terminar
+        fila = fila_de_tarefas()
+        id_tarefa = "|".join(sorted(chaves[c.nome] for c in faltando))
+        tarefa = fila.tarefa(id_tarefa)
+
+        if tarefa is not None and tarefa.estado == CANCELADA:
+            st.info("Rodada cancelada.")
+            if not st.button("🔁 Rodar novamente"):
+                st.stop()
+            tarefa = None
+
+        if tarefa is None:
+            tarefa = fila.submeter(
+                id_tarefa,
+                f"{arquivo.name} · {', '.join(c.nome for c in faltando)}",
+                rodar_e_salvar,
+                contratos,
+                faltando,
+                {c.nome: chaves[c.nome] for c in faltando},
+                arquivo.name,
+                total=passos_rodada(len(contratos), len(faltando)),
+                curva=curva_desconto,
+                projecoes=projecoes,
+                cambios=cambios,
+                historico=arquivo_historico,
+                cambio_paridade=cambio_paridade,
+                mercado=mercado_rodada,
+            )
+
+        if tarefa.estado == ERRO:
+            if isinstance(tarefa.erro, ErroValidacao):
+                # mesma planilha, mesmo relatório: a tarefa fica na fila com o erro
+                st.error(f"A planilha tem {len(tarefa.erro.relatorio)} erro(s); corrija e envie novamente.")
+                st.dataframe(tarefa.erro.relatorio, width="stretch", hide_index=True)
+            else:
+                fila.remover(id_tarefa)
+                st.error(f"Erro ao rodar o modelo de dívida: {tarefa.erro}")
+            st.stop()
+
+        if not tarefa.terminada:
+            acompanhar_tarefa(id_tarefa)
+            st.stop()
+
+        rodadas_sessao.update(tarefa.resultado)
+        fila.remover(id_tarefa)
+
+    rodadas_cenarios = {nome: rodadas_sessao[chave] for nome, chave in chaves.items()}
+    chave_resultados = chaves[cenario_escolhido.nome]
+    resultados = rodadas_cenarios[cenario_escolhido.nome]
+
+resumo, fluxo, carteira, fluxo_anual, fluxo_mensal, ranking = resultados
 
 
 # =========================================================
@@ -125,6 +331,16 @@ def safe_percent(x):
         return "-"
 
 
+def anos(x):
+    """Formata prazos em anos (ex.: '3,25 anos')."""
+    try:
+        if pd.isna(x):
+            return "-"
+        return f"{float(x):.2f} anos".replace(".", ",")
+    except Exception:
+        return "-"
+
+
 def preparar_dados_relatorio(resumo_df, carteira_df, fluxo_anual_df, ranking_df):
     resumo_r = resumo_df.copy()
     carteira_r = carteira_df.copy()
@@ -274,7 +490,10 @@ col1.metric("📈 TIR Atual", safe_percent(safe_val(atual, "TIR")))
 col2.metric("📈 TIR Nova", safe_percent(safe_val(novo, "TIR")))
 col3.metric("Diferença TIR", safe_percent(safe_val(dif, "TIR")))
 
-st.caption(f"Cenário: {cenario_escolhido.nome}")
+st.caption(
+    f"Cenário: {cenario_escolhido.nome}"
+    + (" · Backtest com taxas e câmbio realizados" if arquivo_historico is not None else "")
+)
 
 
 # =========================================================
@@ -291,9 +510,51 @@ if not carteira_fmt.empty:
         carteira_fmt["VPL"] = carteira_fmt["VPL"].apply(brl)
     if "TIR" in carteira_fmt.columns:
         carteira_fmt["TIR"] = carteira_fmt["TIR"].apply(safe_percent)
+    for c in ["Duration_Macaulay", "Duration_Modificada", "Vida_Media", "Prazo_Medio"]:
+        if c in carteira_fmt.columns:
+            carteira_fmt[c] = carteira_fmt[c].apply(anos)
+    if "Pct_Vence_12m" in carteira_fmt.columns:
+        carteira_fmt["Pct_Vence_12m"] = carteira_fmt["Pct_Vence_12m"].apply(safe_percent)
 
 st.dataframe(carteira_fmt, width="stretch")
 
+
+# =========================================================
+# ⏳ RISCO DE REFINANCIAMENTO (DURATION E PRAZOS)
+# =========================================================
+
+if set(COLUNAS_RISCO).issubset(carteira.columns):
+    st.subheader("⏳ Risco de Refinanciamento")
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("⏳ Duration Atual", anos(safe_val(atual, "Duration_Macaulay")))
+    col2.metric("⏳ Duration Nova", anos(safe_val(novo, "Duration_Macaulay")))
+    col3.metric("Diferença Duration", anos(safe_val(dif, "Duration_Macaulay")))
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("📆 Prazo Médio Atual", anos(safe_val(atual, "Prazo_Medio")))
+    col2.metric("📆 Prazo Médio Novo", anos(safe_val(novo, "Prazo_Medio")))
+    col3.metric("Diferença Prazo Médio", anos(safe_val(dif, "Prazo_Medio")))
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🔁 Vence em 12 meses (Atual)", safe_percent(safe_val(atual, "Pct_Vence_12m")))
+    col2.metric("🔁 Vence em 12 meses (Novo)", safe_percent(safe_val(novo, "Pct_Vence_12m")))
+    col3.metric("Diferença", safe_percent(safe_val(dif, "Pct_Vence_12m")))
+
+    st.caption(
+        "Fluxos a vencer após a data-base da curva de desconto, em dias úteis/252. "
+        "Duration ponderada pelo valor presente à TIR de cada contrato; vida média "
+        "pela amortização; prazo médio pelos pagamentos; vencendo em 12 meses: "
+        "parcela do saldo amortizada no próximo ano."
+    )
+
+    with st.expander("Indicadores por contrato"):
+        df_risco = resumo[["ID", "Descrição", "Tipo"] + COLUNAS_RISCO].sort_values("Pct_Vence_12m", ascending=False)
+        for c in ["Duration_Macaulay", "Duration_Modificada", "Vida_Media", "Prazo_Medio"]:
+            df_risco[c] = df_risco[c].apply(anos)
+        df_risco["Pct_Vence_12m"] = df_risco["Pct_Vence_12m"].apply(safe_percent)
+        st.dataframe(df_risco, width="stretch", hide_index=True)
+
 # =========================================================
 # 📅 IMPACTO ANUAL NO CAIXA
 # =========================================================
@@ -304,14 +565,7 @@ if not fluxo_anual.empty:
     if not {"Ano", "Pagamento", "Tipo"}.issubset(fluxo_anual.columns):
         st.error("A tabela 'fluxo_anual' não possui as colunas necessárias (Ano, Pagamento, Tipo).")
     else:
-        fig_anual = px.bar(
-            fluxo_anual,
-            x="Ano",
-            y="Pagamento",
-            color="Tipo",
-            barmode="group",
-            text_auto=True,
-        )
+        fig_anual = grafico_barras(fluxo_anual, x="Ano", y="Pagamento", cor="Tipo")
         st.plotly_chart(fig_anual, width="stretch")
 
         # monta tabela numérica sem TOTAL
@@ -356,17 +610,115 @@ if not fluxo_mensal.empty:
     if not {"Data", "Pagamento", "Tipo"}.issubset(fluxo_mensal.columns):
         st.error("A tabela 'fluxo_mensal' não possui as colunas necessárias (Data, Pagamento, Tipo).")
     else:
-        fig_mensal = px.line(
-            fluxo_mensal,
+        datas_mensal = pd.to_datetime(fluxo_mensal["Data"])
+        data_min = datas_mensal.min().to_pydatetime()
+        data_max = datas_mensal.max().to_pydatetime()
+        if data_min < data_max:
+            inicio_vis, fim_vis = st.slider(
+                "Período exibido",
+                min_value=data_min,
+                max_value=data_max,
+                value=(data_min, data_max),
+                format="MM/YYYY",
+            )
+        else:
+            inicio_vis, fim_vis = data_min, data_max
+
+        fig_mensal = grafico_linha(
+            fluxo_mensal.assign(Data=datas_mensal),
             x="Data",
             y="Pagamento",
-            color="Tipo",
+            cor="Tipo",
+            inicio=pd.Timestamp(inicio_vis),
+            fim=pd.Timestamp(fim_vis),
         )
         st.plotly_chart(fig_mensal, width="stretch")
 else:
     st.info("Nenhum dado para fluxo mensal.")
 
 
+# =========================================================
+# 🏦 ESTOQUE DA DÍVIDA E MURO DE VENCIMENTOS
+# =========================================================
+
+@st.cache_resource(max_entries=8)
+def matrizes_da_rodada(chave: str, _resumo, _fluxo):
+    """Matrizes contratos × meses, montadas uma vez por rodada (chave do armazém)."""
+    return montar_matrizes(_resumo, _fluxo)
+
+
+st.subheader("🏦 Estoque da Dívida e Muro de Vencimentos")
+
+if not fluxo.empty and "Saldo_Devedor" in fluxo.columns:
+    matrizes = matrizes_da_rodada(chave_resultados, resumo, fluxo)
+
+    col_moeda, col_idx = st.columns(2)
+    moedas_sel = col_moeda.multiselect("Moeda", sorted(matrizes.contratos["Moeda"].astype(str).unique()))
+    indexadores_sel = col_idx.multiselect("Indexador", sorted(matrizes.contratos["Indexador"].astype(str).unique()))
+    selecao = matrizes.selecionar(Moeda=moedas_sel or None, Indexador=indexadores_sel or None)
+
+    estoque = matrizes.por_atributo("saldo", "Tipo", selecao).reset_index().melt(
+        id_vars="Mes", var_name="Tipo", value_name="Saldo_Devedor"
+    )
+    st.plotly_chart(
+        grafico_linha(estoque, x="Mes", y="Saldo_Devedor", cor="Tipo", titulo="Saldo devedor (fim do mês)"),
+        width="stretch",
+    )
+
+    muro = matrizes.por_atributo("amortizacao", "Tipo", selecao)
+    muro = muro.groupby(muro.index.year).sum().rename_axis("Ano").reset_index().melt(
+        id_vars="Ano", var_name="Tipo", value_name="Amortização"
+    )
+    st.plotly_chart(grafico_barras(muro, x="Ano", y="Amortização", cor="Tipo"), width="stretch")
+else:
+    st.info("Sem fluxo detalhado para o estoque da dívida.")
+
+
+# =========================================================
+# 🧊 ANÁLISE MULTIDIMENSIONAL (CUBO)
+# =========================================================
+
+@st.cache_resource(max_entries=8)
+def cubo_da_rodada(chave: str, _resumo, _fluxo):
+    """Cubo de agregados da rodada, montado uma vez por chave."""
+    return montar_cubo(matrizes_da_rodada(chave, _resumo, _fluxo))
+
+
+st.subheader("🧊 Análise Multidimensional")
+
+if not fluxo.empty and "Saldo_Devedor" in fluxo.columns:
+    cubo = cubo_da_rodada(chave_resultados, resumo, fluxo)
+
+    c1, c2, c3 = st.columns(3)
+    linhas_cubo = c1.multiselect("Linhas", DIMENSOES, default=["Ano"])
+    colunas_cubo = c2.multiselect("Colunas", [d for d in DIMENSOES if d not in linhas_cubo], default=["Tipo"])
+    medida_cubo = c3.selectbox("Medida", list(MEDIDAS_CUBO))
+
+    with st.expander("Filtros"):
+        filtros_cubo = {}
+        colunas_filtro = st.columns(len(ATRIBUTOS))
+        for coluna_f, dimensao in zip(colunas_filtro, ATRIBUTOS):
+            escolhidos = coluna_f.multiselect(dimensao, list(cubo.rotulos[dimensao]), key=f"cubo_{dimensao}")
+            filtros_cubo[dimensao] = escolhidos or None
+
+    if linhas_cubo:
+        recorte = cubo.fatiar(**filtros_cubo)
+        if "Ano" in linhas_cubo + colunas_cubo and "Mes" in linhas_cubo + colunas_cubo:
+            st.info("Escolha Ano ou Mes, não os dois.")
+        else:
+            pivo_cubo = recorte.pivotar(linhas_cubo, colunas_cubo, medida_cubo)
+            st.dataframe(pivo_cubo.map(brl), width="stretch")
+
+            if len(linhas_cubo) == 1 and len(colunas_cubo) <= 1:
+                longo = recorte.agregar(linhas_cubo + colunas_cubo, medida_cubo)
+                fig_cubo = grafico_barras(
+                    longo, x=linhas_cubo[0], y=medida_cubo, cor=colunas_cubo[0] if colunas_cubo else None
+                )
+                st.plotly_chart(fig_cubo, width="stretch")
+    else:
+        st.info("Escolha ao menos uma dimensão nas linhas.")
+
+
 # =========================================================
 # 🏆 RANKING DE CONTRATOS
 # =========================================================
@@ -393,94 +745,399 @@ else:
 
 
 # =========================================================
-# 🔍 ANÁLISE INDIVIDUAL + AUDITORIA
+# 📐 SENSIBILIDADES POR CONTRATO
 # =========================================================
 
-st.header("🔍 Análise Individual do Contrato")
+st.header("📐 Sensibilidades por Contrato")
 
-if resumo is not None and not resumo.empty:
-    if "Descrição" not in resumo.columns or "ID" not in resumo.columns:
-        st.error("A tabela 'resumo' não possui as colunas necessárias (Descrição, ID).")
-    else:
-        contrato_sel = st.selectbox("Escolha o contrato", resumo["Descrição"])
-        dados = resumo[resumo["Descrição"] == contrato_sel]
+sens_cols = [
+    "VPL_DV01_CDI", "VPL_DV01_IPCA", "VPL_DV01_Spread", "VPL_Delta_FX",
+    "Pico_DV01_CDI", "Pico_DV01_IPCA", "Pico_DV01_Spread", "Pico_Delta_FX",
+]
 
-        if not dados.empty:
-            fluxo_ind = fluxo[fluxo["ID"] == dados["ID"].values[0]]
+if ranking is not None and not ranking.empty and set(sens_cols).issubset(ranking.columns):
+    st.caption(
+        "Variação em R$ do VPL e do pico anual de pagamentos para +1 bp no CDI/SELIC, "
+        "no IPCA e no spread, e para +1% no câmbio (curva de desconto mantida fixa)."
+    )
+
+    df_sens = ranking[["Descrição", "Tipo"] + sens_cols].copy()
 
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Valor Contratado", brl(dados["Valor_Contratado"].values[0]))
-            col2.metric("Custo Total", brl(dados["Custo_Total"].values[0]))
-            col3.metric("TIR", safe_percent(dados["TIR"].values[0]))
-            st.metric("VPL", brl(dados["VPL"].values[0]))
+    total_sens = df_sens.groupby("Tipo")[sens_cols].sum().reset_index()
+    for c in sens_cols:
+        total_sens[c] = total_sens[c].apply(brl)
+        df_sens[c] = df_sens[c].apply(brl)
 
-            auditoria = st.checkbox("🔎 Modo auditoria detalhada")
+    st.subheader("Carteira")
+    st.dataframe(total_sens, width="stretch")
+    st.subheader("Contratos")
+    st.dataframe(df_sens, width="stretch")
+else:
+    st.info("Sensibilidades não disponíveis.")
 
-            if auditoria and not fluxo_ind.empty:
-                st.subheader("Taxas Utilizadas")
 
-                if "Taxa_Anual" in fluxo_ind.columns:
-                    st.write(
-                        f"**Taxa anual (indexador + spread):** "
-                        f"{safe_percent(fluxo_ind['Taxa_Anual'].iloc[0])}"
+# =========================================================
+# 🧮 OTIMIZADOR DE REESTRUTURAÇÃO
+# =========================================================
+
+st.header("🧮 Otimizador de Reestruturação")
+
+novos = contratos[contratos["Tipo"] == "Novo"] if "Tipo" in contratos.columns else contratos.iloc[0:0]
+
+if not novos.empty:
+    with st.expander("Buscar termos para um contrato Novo"):
+        descricao_base = st.selectbox("Contrato base", novos["Descrição"].astype(str).tolist())
+        base_otim = novos[novos["Descrição"].astype(str) == descricao_base].iloc[0]
+
+        c1, c2, c3 = st.columns(3)
+        prazo_min, prazo_max = c1.slider("Prazo (períodos)", 1, 480, (12, 240))
+        passo_prazo = c1.number_input("Passo do prazo", 1, 60, 6)
+        carencia_max = c2.slider("Carência máxima (períodos)", 0, 120, 24)
+        passo_carencia = c2.number_input("Passo da carência", 1, 24, 3)
+        sistemas_otim = c3.multiselect("Sistemas", ["SAC", "PRICE"], default=["SAC", "PRICE"])
+        periodicidades_otim = c3.multiselect("Periodicidade (meses)", [1, 6], default=[int(base_otim["Periodicidade"])])
+
+        c4, c5, c6 = st.columns(3)
+        spread_min, spread_max = c4.slider("Spread (% a.a.)", 0.0, 10.0, (0.0, 4.0), step=0.25)
+        objetivo_otim = c5.selectbox("Minimizar", ["VPL", "Custo_Total"])
+        teto_otim = c6.number_input("Teto de pagamentos anuais (R$, 0 = sem teto)", min_value=0.0, value=0.0, step=1e6)
+        somar_demais = st.checkbox("Somar pagamentos dos demais contratos no teto anual", value=True)
+
+        if st.button("Otimizar") and sistemas_otim and periodicidades_otim:
+            existente = None
+            if somar_demais and not fluxo.empty:
+                demais = fluxo[fluxo["ID"] != base_otim["Id"]]
+                existente = demais.groupby(pd.to_datetime(demais["Data"]).dt.year)["Pagamento"].sum()
+
+            with st.spinner("Avaliando candidatos..."):
+                try:
+                    tabela_otim = otimizar_reestruturacao(
+                        base_otim,
+                        prazos=range(prazo_min, prazo_max + 1, int(passo_prazo)),
+                        carencias=range(0, carencia_max + 1, int(passo_carencia)),
+                        sistemas=tuple(sistemas_otim),
+                        periodicidades=tuple(periodicidades_otim),
+                        spreads=[
+                            (spread_min + 0.25 * i) / 100
+                            for i in range(int(round((spread_max - spread_min) / 0.25)) + 1)
+                        ],
+                        objetivo=objetivo_otim,
+                        teto_pico_anual=teto_otim or None,
+                        fluxo_anual_existente=existente,
+                        cenario=cenario_escolhido,
+                        curva=curva_desconto,
+                        projecoes=projecoes,
+                        cambios=cambios,
+                        cambio_paridade=cambio_paridade,
                     )
-                if "Taxa_Periodo" in fluxo_ind.columns:
-                    st.write(
-                        f"**Taxa por período:** "
-                        f"{safe_percent(fluxo_ind['Taxa_Periodo'].iloc[0])}"
+                except Exception as e:
+                    st.error(f"Erro no otimizador: {e}")
+                    tabela_otim = None
+
+            if tabela_otim is not None and not tabela_otim.empty:
+                melhor = tabela_otim.iloc[0]
+                if bool(melhor["Viavel"]):
+                    st.success(
+                        f"Recomendação: prazo {melhor['Prazo']}, carência {melhor['Carencia']}, "
+                        f"{melhor['Sistema_Amortização']}, spread {melhor['Spread']:.2%} — "
+                        f"{objetivo_otim} {brl(melhor[objetivo_otim])}, pico anual {brl(melhor['Pico_Anual'])} "
+                        f"em {melhor['Ano_Pico']}."
                     )
+                else:
+                    st.warning("Nenhum candidato respeita o teto de pagamentos anuais.")
+
+                st.caption(f"{len(tabela_otim):,} candidatos avaliados.".replace(",", "."))
+                df_otim = tabela_otim.head(50).copy()
+                df_otim["Spread"] = df_otim["Spread"].apply(lambda x: f"{x:.2%}")
+                for c in ["VPL", "Custo_Total", "Pico_Anual"]:
+                    df_otim[c] = df_otim[c].apply(brl)
+                st.dataframe(df_otim, width="stretch")
+else:
+    st.info("Nenhum contrato Novo para otimizar.")
 
-        
 
-                st.subheader("Tabela de Auditoria do Fluxo")
+# =========================================================
+# 🎯 SPREAD DE EQUILÍBRIO
+# =========================================================
 
-                colunas_auditoria = [
-                    "Data", "Pagamento", "Amortização",
-                    "Juros", "Saldo_Devedor",
-                    "Dias_corridos", "Dias_uteis_252",
-                    "Taxa_Dia_Util", "Taxa_Anual",
-                ]
-                cols_existentes = [
-                    c for c in colunas_auditoria if c in fluxo_ind.columns
-                ]
+if not novos.empty:
+    with st.expander("🎯 Spread de equilíbrio (contratos Novos)"):
+        descricoes_eq = st.multiselect(
+            "Contratos", novos["Descrição"].astype(str).tolist(), default=novos["Descrição"].astype(str).tolist()
+        )
+        c1, c2, c3 = st.columns(3)
+        variavel_eq = c1.selectbox("Resolver", list(VARIAVEIS))
+        metrica_eq = c2.selectbox("Para igualar", list(METRICAS_ALVO))
+        origem_alvo = c3.radio("Alvo", ["Carteira Antiga", "Valor informado"])
+
+        selecionados = novos[novos["Descrição"].astype(str).isin(descricoes_eq)]
+        antigos = resumo[resumo["Tipo"] == "Antigo"]
+        if origem_alvo == "Carteira Antiga":
+            if metrica_eq == "TIR":
+                alvo_eq = float(antigos["TIR"].mean()) if not antigos.empty else 0.0
+                st.caption(f"Cada contrato com a TIR média da carteira Antiga ({alvo_eq:.2f}% a.a.).")
+            else:
+                # total da carteira Antiga repartido pelo valor contratado dos Novos
+                valores_eq = pd.to_numeric(selecionados["Valor_Contratado"], errors="coerce").fillna(0.0)
+                alvo_eq = (float(antigos[metrica_eq].sum()) * valores_eq / max(valores_eq.sum(), 1e-12)).to_numpy()
+                st.caption(f"{metrica_eq} da carteira Antiga ({brl(antigos[metrica_eq].sum())}) repartido pelo valor contratado.")
+        else:
+            alvo_eq = st.number_input(f"{metrica_eq} alvo por contrato" + (" (% a.a.)" if metrica_eq == "TIR" else " (R$)"), value=0.0)
+
+        if st.button("Resolver") and not selecionados.empty:
+            try:
+                tabela_eq = resolver_equilibrio(
+                    selecionados,
+                    alvo_eq,
+                    metrica=metrica_eq,
+                    variavel=variavel_eq,
+                    cenario=cenario_escolhido,
+                    curva=curva_desconto,
+                    projecoes=projecoes,
+                    cambios=cambios,
+                    cambio_paridade=cambio_paridade,
+                )
+            except Exception as e:
+                st.error(f"Erro ao resolver: {e}")
+                tabela_eq = None
+
+            if tabela_eq is not None:
+                if not tabela_eq["Convergiu"].all():
+                    st.warning(
+                        f"{int((~tabela_eq['Convergiu']).sum())} contrato(s) sem solução: a variável não "
+                        "altera a métrica ou o alvo está fora do alcance."
+                    )
+                df_eq = tabela_eq.copy()
+                formato = (lambda x: f"{x:.4%}") if variavel_eq == "Spread" else (lambda x: f"{x:.4f}")
+                for c in [variavel_eq, f"{variavel_eq}_Atual"]:
+                    df_eq[c] = df_eq[c].apply(lambda x: "-" if pd.isna(x) else formato(x))
+                for c in ["VPL", "Custo_Total"]:
+                    df_eq[c] = df_eq[c].apply(brl)
+                df_eq["Alvo"] = df_eq["Alvo"].apply(safe_percent if metrica_eq == "TIR" else brl)
+                df_eq["TIR"] = df_eq["TIR"].apply(safe_percent)
+                st.dataframe(df_eq, width="stretch", hide_index=True)
 
-                df_aud = fluxo_ind[cols_existentes].copy()
 
+# =========================================================
+# 📉 VaR DE FLUXO (SIMULAÇÃO HISTÓRICA)
+# =========================================================
 
+if not contratos.empty:
+    with st.expander("📉 VaR de fluxo por simulação histórica"):
+        arquivo_choques = st.file_uploader(
+            "Histórico diário para os choques (Data, CDI, IPCA, USD, EUR...)", type=["csv", "xlsx"], key="historico_var"
+        )
+        c1, c2 = st.columns(2)
+        frequencia_var = c1.radio("Janelas de 12 meses", ["Diárias", "Mensais"], horizontal=True)
+        niveis_var = c2.multiselect("Níveis", [0.90, 0.95, 0.975, 0.99], default=[0.95, 0.99], format_func=lambda q: f"{q:.1%}")
+
+        if arquivo_choques is not None and niveis_var and st.button("Simular"):
+            try:
+                var_vpl, var_anual, simulacoes = var_historico(
+                    contratos,
+                    arquivo_choques,
+                    cenario=cenario_escolhido,
+                    curva=curva_desconto,
+                    projecoes=projecoes,
+                    cambios=cambios,
+                    cambio_paridade=cambio_paridade,
+                    frequencia=None if frequencia_var == "Diárias" else "ME",
+                    niveis=sorted(niveis_var),
+                )
+            except Exception as e:
+                st.error(f"Erro na simulação histórica: {e}")
+                var_vpl = None
+
+            if var_vpl is not None:
+                st.caption(
+                    f"{simulacoes['Data'].nunique()} variações de 12 meses de CDI, IPCA e câmbio aplicadas ao cenário "
+                    f"{cenario_escolhido.nome}, com a curva de desconto fixa. Perda = aumento do VPL ou dos pagamentos."
+                )
+                colunas_valor = [c for c in var_vpl.columns if c not in ("Tipo", "Data_Pior")]
+                df_var = var_vpl.copy()
+                for c in colunas_valor:
+                    df_var[c] = df_var[c].apply(brl)
+                st.dataframe(df_var, width="stretch", hide_index=True)
 
-                
+                maior_nivel = f"VaR_{max(niveis_var) * 100:g}"
+                st.plotly_chart(grafico_barras(var_anual, x="Ano", y=maior_nivel, cor="Tipo"), width="stretch")
+                df_var_anual = var_anual.copy()
+                for c in [c for c in var_anual.columns if c not in ("Tipo", "Ano", "Data_Pior")]:
+                    df_var_anual[c] = df_var_anual[c].apply(brl)
+                st.dataframe(df_var_anual, width="stretch", hide_index=True)
 
-                for c in ["Pagamento", "Amortização", "Juros", "Saldo_Devedor"]:
-                    if c in df_aud.columns:
-                        df_aud[c] = df_aud[c].apply(brl)
 
-                for c in ["Taxa_Periodo", "Taxa_Anual"]:
-                    if c in df_aud.columns:
-                        df_aud[c] = df_aud[c].apply(safe_percent)
+# =========================================================
+# 🔍 ANÁLISE INDIVIDUAL + AUDITORIA
+# =========================================================
 
-                st.dataframe(df_aud, width="stretch")
+st.header("🔍 Análise Individual do Contrato")
 
-            else:
-                if not fluxo_ind.empty and {"Data", "Pagamento"}.issubset(fluxo_ind.columns):
-                    fig_ind = px.line(
-                        fluxo_ind,
-                        x="Data",
-                        y="Pagamento",
-                        title="Fluxo do Contrato",
-                    )
-                    st.plotly_chart(fig_ind, width="stretch")
 
-                    tabela_ind = fluxo_ind[["Data", "Pagamento"]].copy()
-                    tabela_ind["Data"] = pd.to_datetime(tabela_ind["Data"]).dt.strftime("%d/%m/%Y")
-                    tabela_ind["Pagamento"] = tabela_ind["Pagamento"].apply(brl)
+@st.cache_resource(max_entries=8)
+def fluxo_indexado_da_rodada(chave: str, _fluxo):
+    """Fluxo ordenado por ID e faixas de cada contrato, montados uma vez por rodada."""
+    return indexar_fluxo(_fluxo)
+
+
+@st.fragment
+def analise_individual(resumo, fluxo_ordenado, faixas):
+    """
+    Drilldown de um contrato. Roda como fragmento: trocar o contrato ou
+    ligar a auditoria reexecuta só este trecho, e o fluxo do contrato vem
+    do índice por ID (fatia direta, sem filtrar a tabela inteira).
+    """
+    descricoes = resumo["Descrição"].astype(str).tolist()
+    if st.session_state.get("contrato_sel", 0) >= len(descricoes):
+        st.session_state["contrato_sel"] = 0
+    posicao = st.selectbox(
+        "Escolha o contrato",
+        range(len(descricoes)),
+        format_func=lambda i: descricoes[i],
+        key="contrato_sel",
+    )
+    dados = resumo.iloc[[posicao]]
+    fluxo_ind = fluxo_do_contrato(fluxo_ordenado, faixas, dados["ID"].values[0])
 
-                    st.dataframe(tabela_ind, width="stretch")
-                else:
-                    st.info("Não há fluxo detalhado para este contrato.")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Valor Contratado", brl(dados["Valor_Contratado"].values[0]))
+    col2.metric("Custo Total", brl(dados["Custo_Total"].values[0]))
+    col3.metric("TIR", safe_percent(dados["TIR"].values[0]))
+    st.metric("VPL", brl(dados["VPL"].values[0]))
+
+    auditoria = st.checkbox("🔎 Modo auditoria detalhada")
+
+    if auditoria and not fluxo_ind.empty:
+        st.subheader("Taxas Utilizadas")
+
+        if "Taxa_Anual" in fluxo_ind.columns:
+            st.write(
+                f"**Taxa anual (indexador + spread):** "
+                f"{safe_percent(fluxo_ind['Taxa_Anual'].iloc[0])}"
+            )
+        if "Taxa_Periodo" in fluxo_ind.columns:
+            st.write(
+                f"**Taxa por período:** "
+                f"{safe_percent(fluxo_ind['Taxa_Periodo'].iloc[0])}"
+            )
+
+
+
+        st.subheader("Tabela de Auditoria do Fluxo")
+
+        colunas_auditoria = [
+            "Data", "Pagamento", "Amortização",
+            "Juros", "Saldo_Devedor",
+            "Dias_corridos", "Dias_uteis_252",
+            "Taxa_Dia_Util", "Taxa_Anual",
+        ]
+        cols_existentes = [
+            c for c in colunas_auditoria if c in fluxo_ind.columns
+        ]
+
+        df_aud = fluxo_ind[cols_existentes].copy()
+
+
+
+
+
+        for c in ["Pagamento", "Amortização", "Juros", "Saldo_Devedor"]:
+            if c in df_aud.columns:
+                df_aud[c] = df_aud[c].apply(brl)
+
+        for c in ["Taxa_Periodo", "Taxa_Anual"]:
+            if c in df_aud.columns:
+                df_aud[c] = df_aud[c].apply(safe_percent)
+
+        st.dataframe(df_aud, width="stretch")
+
+    else:
+        if not fluxo_ind.empty and {"Data", "Pagamento"}.issubset(fluxo_ind.columns):
+            fig_ind = grafico_linha(
+                fluxo_ind,
+                x="Data",
+                y="Pagamento",
+                titulo="Fluxo do Contrato",
+            )
+            st.plotly_chart(fig_ind, width="stretch")
+
+            tabela_ind = fluxo_ind[["Data", "Pagamento"]].copy()
+            tabela_ind["Data"] = pd.to_datetime(tabela_ind["Data"]).dt.strftime("%d/%m/%Y")
+            tabela_ind["Pagamento"] = tabela_ind["Pagamento"].apply(brl)
+
+            st.dataframe(tabela_ind, width="stretch")
+        else:
+            st.info("Não há fluxo detalhado para este contrato.")
+
+
+if resumo is not None and not resumo.empty:
+    if "Descrição" not in resumo.columns or "ID" not in resumo.columns:
+        st.error("A tabela 'resumo' não possui as colunas necessárias (Descrição, ID).")
+    else:
+        analise_individual(resumo, *fluxo_indexado_da_rodada(chave_resultados, fluxo))
 else:
     st.info("Nenhum contrato disponível no resumo.")
 
 
+# =========================================================
+# ⚖️ CENÁRIOS LADO A LADO
+# =========================================================
+
+if len(rodadas_cenarios) >= 2:
+    st.header("⚖️ Cenários Lado a Lado")
+
+    tabela_cen = tabela_cenarios(rodadas_cenarios)
+    visao = st.radio("Métrica", ["Custo_Total", "VPL", "TIR", "Pico_Anual"], horizontal=True)
+    pivo = tabela_cen.pivot(index="Tipo", columns="Cenario", values=visao)[list(rodadas_cenarios)]
+    pivo = pivo.reindex([t for t in ["Antigo", "Novo", "Diferença"] if t in pivo.index])
+    st.dataframe(pivo.map(safe_percent if visao == "TIR" else brl), width="stretch")
+
+    anual_cen = fluxo_anual_cenarios(rodadas_cenarios)
+    tipo_cen = st.selectbox("Tranche no gráfico anual", ["Novo", "Antigo"], key="tipo_cenarios")
+    fig_cen = grafico_barras(anual_cen[anual_cen["Tipo"] == tipo_cen], x="Ano", y="Pagamento", cor="Cenario")
+    st.plotly_chart(fig_cen, width="stretch")
+
+
+# =========================================================
+# 🔀 COMPARAÇÃO ENTRE RODADAS
+# =========================================================
+
+st.header("🔀 Comparar Rodadas")
+
+rodadas_salvas = armazem.rodadas()
+if len(rodadas_salvas) >= 2:
+    rotulos = [
+        f"{r.Descricao} — {str(r.Criada)[:16].replace('T', ' ')}" for r in rodadas_salvas.itertuples()
+    ]
+    col_a, col_b = st.columns(2)
+    pos_a = col_a.selectbox("Rodada A (referência)", range(len(rotulos)), index=1, format_func=lambda i: rotulos[i])
+    pos_b = col_b.selectbox("Rodada B", range(len(rotulos)), index=0, format_func=lambda i: rotulos[i])
+
+    rodada_a = armazem.abrir(rodadas_salvas["Chave"].iloc[pos_a])
+    rodada_b = armazem.abrir(rodadas_salvas["Chave"].iloc[pos_b])
+
+    if rodada_a is not None and rodada_b is not None:
+        comparacao = comparar_rodadas(rodada_a, rodada_b)
+
+        st.subheader("Diferença por Ano (B − A)")
+        fig_dif = grafico_barras(comparacao.anos, x="Ano", y="Delta_Pagamento", cor="Tipo")
+        st.plotly_chart(fig_dif, width="stretch")
+
+        st.subheader("Diferença por Contrato (B − A)")
+        cols_dif = ["ID", "Descrição", "Tipo", "Presenca"] + [f"Delta_{m}" for m in METRICAS]
+        df_dif = comparacao.contratos[cols_dif].sort_values(
+            "Delta_Custo_Total", key=lambda x: x.abs(), ascending=False
+        )
+        for c in ["Delta_Custo_Total", "Delta_VPL", "Delta_Pico_Anual"]:
+            df_dif[c] = df_dif[c].apply(brl)
+        df_dif["Delta_TIR"] = df_dif["Delta_TIR"].apply(safe_percent)
+        st.dataframe(df_dif, width="stretch")
+    else:
+        st.info("Uma das rodadas não está mais no armazém.")
+else:
+    st.info("Rode ao menos dois cenários (ou duas planilhas) para comparar.")
+
+
 # =========================================================
 # 💾 EXPORTAÇÕES (EXCEL E PDF)
 # =========================================================
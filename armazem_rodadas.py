@@ -0,0 +1,274 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+import pyarrow as pa
+
+from cenarios import CenarioMercado
+from mercado import FotoMercado
+
+
+DIRETORIO_RODADAS = "armazem_rodadas"
+LIMITE_PADRAO_BYTES = 2 * 1024**3
+
+SAIDAS = ("resumo", "fluxo", "carteira", "fluxo_anual", "fluxo_mensal", "ranking")
+ARQUIVO_MANIFESTO = "manifesto.json"
+ARQUIVO_TRAVA = "manifesto.lock"
+
+
+# ===============================
+# 🔹 Chave da rodada (conteúdo das entradas)
+# ===============================
+
+def hash_conteudo(entrada) -> str | None:
+    """
+    SHA-256 de uma entrada da rodada: bytes, arquivo enviado (com
+    getvalue/read), caminho local ou DataFrame. None → None.
+    """
+    if entrada is None:
+        return None
+    if isinstance(entrada, pd.DataFrame):
+        dados = pd.util.hash_pandas_object(entrada, index=True).to_numpy().tobytes()
+        dados += "|".join(map(str, entrada.columns)).encode()
+    elif isinstance(entrada, (bytes, bytearray)):
+        dados = bytes(entrada)
+    elif hasattr(entrada, "getvalue"):
+        dados = entrada.getvalue()
+    elif hasattr(entrada, "read"):
+        posicao = entrada.tell()
+        dados = entrada.read()
+        entrada.seek(posicao)
+    else:
+        with open(entrada, "rb") as f:
+            dados = f.read()
+    return hashlib.sha256(dados).hexdigest()
+
+
+def chave_rodada(hash_contratos: str, cenario: CenarioMercado, mercado: FotoMercado, **opcoes) -> str:
+    """
+    Chave da rodada: hash das entradas (planilha e, em 'opcoes', hashes de
+    curvas/arquivos e flags) + cenário + foto do mercado usada. Rodadas
+    idênticas, de qualquer sessão, caem na mesma chave.
+    """
+    conteudo = {
+        "contratos": hash_contratos,
+        "cenario": asdict(cenario),
+        "taxas": dict(sorted(mercado.taxas.items())),
+        "cambios": dict(sorted(mercado.cambios.items())),
+        "opcoes": dict(sorted(opcoes.items())),
+    }
+    texto = json.dumps(conteudo, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+# ===============================
+# 🔹 Trava entre processos
+# ===============================
+
+@contextmanager
+def _travar(caminho: str):
+    """
+    Trava exclusiva sobre o arquivo 'caminho' (criado se não existir),
+    entre processos e entre threads: espera até conseguir.
+    """
+    with open(caminho, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK desiste após ~10 s: tenta de novo
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# ===============================
+# 🔹 Armazém em disco
+# ===============================
+
+class ArmazemRodadas:
+    """
+    Rodadas completas (as seis saídas de rodar_modelo) guardadas em disco.
+
+    - Uma pasta por chave, com um arquivo Arrow IPC por saída; a leitura
+      é por memória mapeada: colunas numéricas sem nulos viram arrays
+      sobre o próprio mapa, sem cópia (texto e colunas com nulos são
+      convertidos).
+    - 'manifesto.json' lista as rodadas (descrição, tamanho, datas de
+      criação e último acesso): sessões do app e jobs em lote reabrem
+      qualquer rodada pela chave.
+    - Ao passar de 'limite_bytes', as rodadas acessadas há mais tempo
+      são apagadas (LRU).
+    - Toda leitura-alteração-gravação do manifesto é feita sob uma trava
+      de arquivo ('manifesto.lock'): salvamentos simultâneos de sessões e
+      jobs não perdem entradas.
+    """
+
+    def __init__(self, diretorio: str = DIRETORIO_RODADAS, limite_bytes: int = LIMITE_PADRAO_BYTES):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        os.makedirs(diretorio, exist_ok=True)
+
+    # -------------------------
+    # Manifesto
+    # -------------------------
+
+    def _caminho_manifesto(self) -> str:
+        return os.path.join(self.diretorio, ARQUIVO_MANIFESTO)
+
+    def _ler_manifesto(self) -> dict:
+        try:
+            with open(self._caminho_manifesto(), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _trava(self):
+        return _travar(os.path.join(self.diretorio, ARQUIVO_TRAVA))
+
+    def _gravar_manifesto(self, manifesto: dict) -> None:
+        # grava em arquivo temporário e troca: leitores nunca veem JSON pela metade
+        temporario = self._caminho_manifesto() + f".{uuid.uuid4().hex}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f, ensure_ascii=False, indent=1)
+        os.replace(temporario, self._caminho_manifesto())
+
+    def rodadas(self) -> pd.DataFrame:
+        """Rodadas guardadas, da mais recente para a mais antiga."""
+        manifesto = self._ler_manifesto()
+        if not manifesto:
+            return pd.DataFrame(columns=["Chave", "Descricao", "Criada", "Ultimo_Acesso", "Bytes"])
+
+        tabela = pd.DataFrame(
+            [
+                {
+                    "Chave": chave,
+                    "Descricao": info.get("descricao", ""),
+                    "Criada": info.get("criada"),
+                    "Ultimo_Acesso": info.get("ultimo_acesso"),
+                    "Bytes": info.get("bytes", 0),
+                }
+                for chave, info in manifesto.items()
+            ]
+        )
+        return tabela.sort_values("Criada", ascending=False, ignore_index=True)
+
+    # -------------------------
+    # Gravação e leitura
+    # -------------------------
+
+    def _pasta(self, chave: str) -> str:
+        return os.path.join(self.diretorio, chave)
+
+    def contem(self, chave: str) -> bool:
+        pasta = self._pasta(chave)
+        return all(os.path.exists(os.path.join(pasta, f"{nome}.arrow")) for nome in SAIDAS)
+
+    def salvar(self, chave: str, resultados, descricao: str = "") -> None:
+        """Grava as seis saídas de rodar_modelo sob 'chave' e aplica o limite de tamanho."""
+        if len(resultados) != len(SAIDAS):
+            raise ValueError(f"Esperadas {len(SAIDAS)} saídas de rodar_modelo, recebidas {len(resultados)}.")
+
+        # Grava numa pasta temporária e renomeia: a rodada aparece inteira ou não aparece
+        temporaria = self._pasta(chave) + f".{uuid.uuid4().hex}.tmp"
+        os.makedirs(temporaria)
+        total = 0
+        for nome, df in zip(SAIDAS, resultados):
+            caminho = os.path.join(temporaria, f"{nome}.arrow")
+            tabela = pa.Table.from_pandas(df, preserve_index=True)
+            with pa.OSFile(caminho, "wb") as f, pa.ipc.new_file(f, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+            total += os.path.getsize(caminho)
+
+        agora = dt.datetime.now().isoformat()
+        with self._trava():
+            if os.path.exists(self._pasta(chave)):
+                shutil.rmtree(temporaria)
+            else:
+                os.replace(temporaria, self._pasta(chave))
+
+            manifesto = self._ler_manifesto()
+            manifesto[chave] = {
+                "descricao": descricao,
+                "criada": manifesto.get(chave, {}).get("criada", agora),
+                "ultimo_acesso": agora,
+                "bytes": total,
+            }
+            self._aplicar_limite(manifesto)
+            self._gravar_manifesto(manifesto)
+
+    def abrir(self, chave: str):
+        """
+        Reabre a rodada (tupla na ordem de rodar_modelo), lendo os arquivos
+        por memória mapeada. None se a chave não está no armazém.
+        """
+        if not self.contem(chave):
+            return None
+
+        saidas = []
+        for nome in SAIDAS:
+            with pa.memory_map(os.path.join(self._pasta(chave), f"{nome}.arrow"), "r") as fonte:
+                # split_blocks: sem consolidar em blocos (que copiaria tudo)
+                tabela = pa.ipc.open_file(fonte).read_all()
+                saidas.append(tabela.to_pandas(split_blocks=True, self_destruct=True))
+
+        with self._trava():
+            manifesto = self._ler_manifesto()
+            if chave in manifesto:
+                manifesto[chave]["ultimo_acesso"] = dt.datetime.now().isoformat()
+                self._gravar_manifesto(manifesto)
+        return tuple(saidas)
+
+    def remover(self, chave: str) -> None:
+        with self._trava():
+            shutil.rmtree(self._pasta(chave), ignore_errors=True)
+            manifesto = self._ler_manifesto()
+            if manifesto.pop(chave, None) is not None:
+                self._gravar_manifesto(manifesto)
+
+    def limpar(self) -> list[str]:
+        """Apaga as rodadas menos usadas até caber no limite. Retorna as chaves apagadas."""
+        with self._trava():
+            manifesto = self._ler_manifesto()
+            apagadas = self._aplicar_limite(manifesto)
+            if apagadas:
+                self._gravar_manifesto(manifesto)
+        return apagadas
+
+    def _aplicar_limite(self, manifesto: dict) -> list[str]:
+        """Tira do 'manifesto' (e apaga do disco) as rodadas LRU acima do limite; com a trava."""
+        total = sum(info.get("bytes", 0) for info in manifesto.values())
+
+        apagadas = []
+        for chave in sorted(manifesto, key=lambda c: manifesto[c].get("ultimo_acesso", "")):
+            if total <= self.limite_bytes:
+                break
+            total -= manifesto[chave].get("bytes", 0)
+            shutil.rmtree(self._pasta(chave), ignore_errors=True)
+            apagadas.append(chave)
+
+        for chave in apagadas:
+            manifesto.pop(chave, None)
+        return apagadas
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from curvas import CurvaCambio, CurvaProjecao, contar_dias_uteis, ler_tabela_local, para_data, para_numero
+
+
+# Colunas do histórico, nas unidades publicadas pelas fontes
+# (as mesmas guardadas por historico.ArmazemSeries):
+# - CDI: % a.d. (série 12);  SELIC: % a.a. base 252 (série 1178);
+# - IPCA: % a.m. (série 433, datada no 1º dia do mês);  SOFR: % a.a.;
+# - USD, EUR, GBP, JPY: R$ por unidade da moeda (PTAX).
+MOEDAS_HISTORICO = ["USD", "EUR", "GBP", "JPY"]
+
+
+def carregar_historico(arquivo) -> pd.DataFrame:
+    """
+    Lê histórico diário de arquivo local (CSV/Excel) com coluna 'Data'
+    e uma coluna por série (CDI, SELIC, IPCA, SOFR, USD, ...).
+    Devolve DataFrame indexado por data.
+    """
+    df = ler_tabela_local(arquivo)
+    if "Data" not in df.columns:
+        raise ValueError("Arquivo de histórico sem coluna obrigatória: 'Data'.")
+
+    df["Data"] = para_data(df["Data"])
+    df = df[df["Data"].notna()].set_index("Data").sort_index()
+    return df.apply(para_numero)
+
+
+def _taxa_anual_ipca(serie: pd.Series) -> pd.Series:
+    """
+    IPCA mensal (% a.m.) → taxa anual base 252 equivalente, pró-rata dia útil:
+    o acumulado dos dias úteis do mês reproduz exatamente a variação do mês.
+    """
+    inicios = serie.index.values.astype("datetime64[M]").astype("datetime64[D]")
+    fins = (serie.index.values.astype("datetime64[M]") + 1).astype("datetime64[D]")
+    du_mes = np.maximum(contar_dias_uteis(inicios, fins), 1)
+    return pd.Series((1 + serie.to_numpy() / 100.0) ** (252 / du_mes) - 1, index=inicios)
+
+
+def curvas_realizadas(historico: pd.DataFrame) -> tuple[dict[str, CurvaProjecao], dict[str, CurvaCambio]]:
+    """
+    Converte o histórico realizado em fatores acumulados por dia útil
+    (mesmo mecanismo das projeções) e em câmbio por data.
+
+    Depois da última observação, vale a última taxa / cotação.
+    Retorna (projecoes, cambios), prontos para rodar_modelo.
+    """
+    if "Data" in historico.columns:
+        historico = historico.set_index("Data")
+    historico = historico.sort_index()
+
+    conversoes = {
+        "CDI": lambda s: (1 + s / 100.0) ** 252 - 1,
+        "SELIC": lambda s: s / 100.0,
+        "SOFR": lambda s: s / 100.0,
+        "IPCA": _taxa_anual_ipca,
+    }
+
+    projecoes = {}
+    for indexador, converter in conversoes.items():
+        if indexador not in historico.columns:
+            continue
+        serie = historico[indexador].dropna()
+        if serie.empty:
+            continue
+        taxas = converter(serie)
+        projecoes[indexador] = CurvaProjecao(indexador, taxas.index, taxas.to_numpy())
+
+    cambios = {}
+    for moeda in MOEDAS_HISTORICO:
+        if moeda not in historico.columns:
+            continue
+        serie = historico[moeda].dropna()
+        if not serie.empty:
+            cambios[moeda] = CurvaCambio(moeda, serie.index, serie.to_numpy())
+
+    return projecoes, cambios
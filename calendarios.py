@@ -0,0 +1,335 @@
+import datetime as dt
+import functools
+
+import numpy as np
+
+from feriados_anbima import get_feriados_planilha_anbima
+
+
+# Faixa coberta pelos bitsets (dias fora dela: só fins de semana)
+DATA_INICIAL = np.datetime64("1950-01-01")
+DATA_FINAL = np.datetime64("2151-01-01")
+N_DIAS = int((DATA_FINAL - DATA_INICIAL).astype(np.int64))
+ANO_INICIAL = 1950
+ANO_FINAL = 2150
+
+
+# =========================
+# 🔹 Auxiliares de datas
+# =========================
+
+def _pascoa(ano: int) -> dt.date:
+    """Domingo de Páscoa (calendário gregoriano, algoritmo de Meeus)."""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(ano, mes, dia + 1)
+
+
+def _enesima_semana(ano: int, mes: int, dia_semana: int, n: int) -> dt.date:
+    """n-ésimo 'dia_semana' (0 = segunda) do mês; n = -1 → o último."""
+    if n > 0:
+        primeiro = dt.date(ano, mes, 1)
+        return primeiro + dt.timedelta(days=(dia_semana - primeiro.weekday()) % 7 + 7 * (n - 1))
+    ultimo = dt.date(ano + mes // 12, mes % 12 + 1, 1) - dt.timedelta(days=1)
+    return ultimo - dt.timedelta(days=(ultimo.weekday() - dia_semana) % 7)
+
+
+def _observado_eua(data: dt.date) -> dt.date:
+    """Sábado → sexta anterior; domingo → segunda seguinte."""
+    if data.weekday() == 5:
+        return data - dt.timedelta(days=1)
+    if data.weekday() == 6:
+        return data + dt.timedelta(days=1)
+    return data
+
+
+def _empurrar_fim_de_semana(datas: list[dt.date]) -> list[dt.date]:
+    """Feriados em fim de semana vão para o próximo dia útil ainda livre (regra do Reino Unido)."""
+    saida = []
+    for data in datas:
+        while data.weekday() >= 5 or data in saida:
+            data += dt.timedelta(days=1)
+        saida.append(data)
+    return saida
+
+
+# =========================
+# 🔹 Regras de feriados por praça
+# =========================
+
+def feriados_brasil(ano: int) -> list[dt.date]:
+    """Feriados nacionais (ANBIMA) por regra: usados onde a planilha oficial não cobre."""
+    pascoa = _pascoa(ano)
+    datas = [
+        dt.date(ano, 1, 1),
+        pascoa - dt.timedelta(days=48),  # Carnaval (segunda)
+        pascoa - dt.timedelta(days=47),  # Carnaval (terça)
+        pascoa - dt.timedelta(days=2),   # Sexta-feira Santa
+        dt.date(ano, 4, 21),
+        dt.date(ano, 5, 1),
+        pascoa + dt.timedelta(days=60),  # Corpus Christi
+        dt.date(ano, 9, 7),
+        dt.date(ano, 10, 12),
+        dt.date(ano, 11, 2),
+        dt.date(ano, 11, 15),
+        dt.date(ano, 12, 25),
+    ]
+    if ano >= 2024:
+        datas.append(dt.date(ano, 11, 20))
+    return datas
+
+
+def feriados_eua(ano: int) -> list[dt.date]:
+    """Feriados do mercado de renda fixa dos EUA (recomendação SIFMA)."""
+    datas = [
+        _enesima_semana(ano, 1, 0, 3),   # Martin Luther King
+        _enesima_semana(ano, 2, 0, 3),   # Presidents' Day
+        _pascoa(ano) - dt.timedelta(days=2),
+        _enesima_semana(ano, 5, 0, -1),  # Memorial Day
+        _observado_eua(dt.date(ano, 7, 4)),
+        _enesima_semana(ano, 9, 0, 1),   # Labor Day
+        _enesima_semana(ano, 10, 0, 2),  # Columbus Day
+        _observado_eua(dt.date(ano, 11, 11)),
+        _enesima_semana(ano, 11, 3, 4),  # Thanksgiving
+        _observado_eua(dt.date(ano, 12, 25)),
+    ]
+    # Ano-novo no sábado não é compensado na sexta (31/12)
+    if dt.date(ano, 1, 1).weekday() != 5:
+        datas.append(_observado_eua(dt.date(ano, 1, 1)))
+    if ano >= 2022:
+        datas.append(_observado_eua(dt.date(ano, 6, 19)))
+    return datas
+
+
+def feriados_target(ano: int) -> list[dt.date]:
+    """Dias de fechamento do TARGET2 (zona do euro)."""
+    pascoa = _pascoa(ano)
+    return [
+        dt.date(ano, 1, 1),
+        pascoa - dt.timedelta(days=2),
+        pascoa + dt.timedelta(days=1),
+        dt.date(ano, 5, 1),
+        dt.date(ano, 12, 25),
+        dt.date(ano, 12, 26),
+    ]
+
+
+def feriados_reino_unido(ano: int) -> list[dt.date]:
+    """Bank holidays da Inglaterra (Londres), com compensação de fim de semana."""
+    pascoa = _pascoa(ano)
+    return _empurrar_fim_de_semana([dt.date(ano, 1, 1)]) + [
+        pascoa - dt.timedelta(days=2),
+        pascoa + dt.timedelta(days=1),
+        _enesima_semana(ano, 5, 0, 1),   # Early May
+        _enesima_semana(ano, 5, 0, -1),  # Spring
+        _enesima_semana(ano, 8, 0, -1),  # Summer
+    ] + _empurrar_fim_de_semana([dt.date(ano, 12, 25), dt.date(ano, 12, 26)])
+
+
+def feriados_japao(ano: int) -> list[dt.date]:
+    """
+    Feriados bancários do Japão pelas regras principais (equinócios pela
+    fórmula usual; feriado no domingo passa ao próximo dia livre).
+    Mudanças pontuais (ex.: 2020-2021) não são cobertas.
+    """
+    base = ano - 1980
+    equinocio_primavera = int(20.8431 + 0.242194 * base - base // 4)
+    equinocio_outono = int(23.2488 + 0.242194 * base - base // 4)
+
+    datas = [
+        dt.date(ano, 1, 1),
+        dt.date(ano, 1, 2),
+        dt.date(ano, 1, 3),
+        _enesima_semana(ano, 1, 0, 2),   # Seijin no Hi
+        dt.date(ano, 2, 11),
+        dt.date(ano, 3, equinocio_primavera),
+        dt.date(ano, 4, 29),
+        dt.date(ano, 5, 3),
+        dt.date(ano, 5, 4),
+        dt.date(ano, 5, 5),
+        _enesima_semana(ano, 7, 0, 3),   # Umi no Hi
+        _enesima_semana(ano, 9, 0, 3),   # Keirō no Hi
+        dt.date(ano, 9, equinocio_outono),
+        _enesima_semana(ano, 10, 0, 2),  # Sports Day
+        dt.date(ano, 11, 3),
+        dt.date(ano, 11, 23),
+        dt.date(ano, 12, 31),
+    ]
+    if ano >= 2020:
+        datas.append(dt.date(ano, 2, 23))
+    elif 1989 <= ano <= 2018:
+        datas.append(dt.date(ano, 12, 23))
+    if ano >= 2016:
+        datas.append(dt.date(ano, 8, 11))
+
+    # Furikae kyūjitsu: domingo → próximo dia que não seja feriado
+    conjunto = set(datas)
+    for data in sorted(conjunto):
+        if data.weekday() == 6:
+            substituto = data + dt.timedelta(days=1)
+            while substituto in conjunto:
+                substituto += dt.timedelta(days=1)
+            datas.append(substituto)
+            conjunto.add(substituto)
+    return datas
+
+
+def _feriados_anbima(ano: int) -> list[dt.date]:
+    """Planilha oficial da ANBIMA nos anos que ela cobre; regras nos demais."""
+    planilha = get_feriados_planilha_anbima()
+    do_ano = [d for d in planilha if d.year == ano]
+    return do_ano if do_ano else feriados_brasil(ano)
+
+
+REGRAS_FERIADOS = {
+    "ANBIMA": _feriados_anbima,
+    "US": feriados_eua,
+    "TARGET": feriados_target,
+    "UK": feriados_reino_unido,
+    "JAPAO": feriados_japao,
+}
+
+
+# =========================
+# 🔹 Calendário como bitset
+# =========================
+
+class Calendario:
+    """
+    Dias úteis de uma praça (ou combinação de praças) de 1950 a 2150,
+    guardados como bitset de um bit por dia.
+
+    A contagem acumulada de dias úteis é montada uma vez a partir do
+    bitset: contar dias úteis entre duas datas são duas leituras,
+    vetorizado para arrays de datas.
+    """
+
+    def __init__(self, nome: str, bits: np.ndarray):
+        self.nome = nome
+        self.bits = bits
+        uteis = np.unpackbits(bits, count=N_DIAS).astype(bool)
+        self._acumulado = np.concatenate([[0], np.cumsum(uteis, dtype=np.int64)])
+        self._posicoes_uteis = np.flatnonzero(uteis)
+
+    @classmethod
+    def de_feriados(cls, nome: str, feriados) -> "Calendario":
+        dias = np.arange(DATA_INICIAL, DATA_FINAL)
+        uteis = np.is_busday(dias, weekmask="1111100")
+        feriados = np.asarray(feriados, dtype="datetime64[D]")
+        dentro = (feriados >= DATA_INICIAL) & (feriados < DATA_FINAL)
+        uteis[(feriados[dentro] - DATA_INICIAL).astype(np.int64)] = False
+        return cls(nome, np.packbits(uteis))
+
+    def __and__(self, outro: "Calendario") -> "Calendario":
+        """Dia útil nas duas praças (feriado em qualquer uma delas)."""
+        return Calendario(f"{self.nome}+{outro.nome}", self.bits & outro.bits)
+
+    def _indices(self, datas: np.ndarray) -> np.ndarray:
+        return (datas - DATA_INICIAL).astype(np.int64)
+
+    def contar(self, inicio: np.ndarray, fim: np.ndarray) -> np.ndarray:
+        """
+        Dias úteis entre 'inicio' (inclusive) e 'fim' (exclusive), como
+        np.busday_count (negativo se fim < inicio). Arrays datetime64[D].
+        """
+        i = self._indices(inicio)
+        j = self._indices(fim)
+        n = self._acumulado.size - 1
+        if (i.min(initial=0) < 0) or (j.min(initial=0) < 0) or (i.max(initial=0) > n) or (j.max(initial=0) > n):
+            return np.busday_count(inicio, fim, busdaycal=self.busdaycalendar())
+        # fim < inicio: como np.busday_count, conta (fim, inicio] com sinal negativo
+        invertido = j < i
+        i = np.where(invertido, i + 1, i).clip(max=n)
+        j = np.where(invertido, j + 1, j).clip(max=n)
+        return self._acumulado[j] - self._acumulado[i]
+
+    def e_util(self, datas: np.ndarray) -> np.ndarray:
+        i = np.clip(self._indices(datas), 0, self._acumulado.size - 2)
+        return self._acumulado[i + 1] > self._acumulado[i]
+
+    def dias_uteis_desde(self, inicio: np.datetime64, n: int) -> np.ndarray:
+        """Os 'n' primeiros dias úteis a partir de 'inicio' (inclusive)."""
+        k = int(self._acumulado[max(int(self._indices(np.asarray(inicio))), 0)])
+        return DATA_INICIAL + self._posicoes_uteis[k : k + n]
+
+    @functools.cache
+    def busdaycalendar(self) -> np.busdaycalendar:
+        """Equivalente np.busdaycalendar (para np.busday_offset e afins)."""
+        dias = np.arange(DATA_INICIAL, DATA_FINAL)
+        semana = np.is_busday(dias, weekmask="1111100")
+        uteis = np.unpackbits(self.bits, count=dias.size).astype(bool)
+        return np.busdaycalendar(weekmask="1111100", holidays=dias[semana & ~uteis])
+
+
+# =========================
+# 🔹 Registro de calendários
+# =========================
+
+@functools.lru_cache(maxsize=None)
+def _calendario_simples(nome: str) -> Calendario:
+    regra = REGRAS_FERIADOS.get(nome)
+    if regra is None:
+        raise ValueError(f"Calendário desconhecido: {nome}. Use um de {sorted(REGRAS_FERIADOS)} (combinados com '+').")
+
+    feriados = [d for ano in range(ANO_INICIAL, ANO_FINAL + 1) for d in regra(ano)]
+    return Calendario.de_feriados(nome, feriados)
+
+
+@functools.lru_cache(maxsize=None)
+def _calendario_combinado(nomes: tuple[str, ...]) -> Calendario:
+    calendario = _calendario_simples(nomes[0])
+    for nome in nomes[1:]:
+        calendario = calendario & _calendario_simples(nome)
+    return calendario
+
+
+def obter_calendario(nome: str = "ANBIMA") -> Calendario:
+    """
+    Calendário pelo nome: 'ANBIMA', 'US', 'TARGET', 'UK', 'JAPAO' ou uma
+    combinação com '+' (ex.: 'US+ANBIMA' = útil nas duas praças).
+    Cada calendário e cada combinação é montado uma única vez.
+    """
+    nomes = tuple(sorted({n.strip().upper() for n in str(nome).split("+") if n.strip()}))
+    if not nomes:
+        nomes = ("ANBIMA",)
+    return _calendario_combinado(nomes)
+
+
+# Indexadores domésticos usam o calendário ANBIMA qualquer que seja a moeda
+CALENDARIO_POR_INDEXADOR = {
+    "CDI": "ANBIMA",
+    "SELIC": "ANBIMA",
+    "IPCA": "ANBIMA",
+    "SOFR": "US",
+}
+
+CALENDARIO_POR_MOEDA = {
+    "BRL": "ANBIMA",
+    "USD": "US",
+    "EUR": "TARGET",
+    "GBP": "UK",
+    "JPY": "JAPAO",
+}
+
+
+def calendario_contrato(moeda: str, indexador: str, calendario=None) -> str:
+    """
+    Nome do calendário de um contrato: coluna 'Calendario' da planilha,
+    se preenchida; senão pelo indexador (CDI/SELIC/IPCA → ANBIMA,
+    SOFR → US) e, por fim, pela moeda. Sem regra, ANBIMA.
+    """
+    if calendario is not None and str(calendario).strip() and str(calendario).lower() != "nan":
+        return "+".join(n.strip().upper() for n in str(calendario).split("+") if n.strip())
+
+    nome = CALENDARIO_POR_INDEXADOR.get(str(indexador).upper())
+    if nome is None:
+        nome = CALENDARIO_POR_MOEDA.get(str(moeda).upper(), "ANBIMA")
+    return nome
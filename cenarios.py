@@ -27,3 +27,6 @@ CENARIO_OTIMISTA = CenarioMercado(
     choque_cambio_pct=-0.05,
     choque_spread_bps=-50,
 )
+
+# Cenários pré-definidos (rodados juntos por modelo_divida.rodar_cenarios)
+CENARIOS_PADRAO = [CENARIO_BASE, CENARIO_ESTRESSE, CENARIO_OTIMISTA]
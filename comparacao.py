@@ -0,0 +1,249 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+METRICAS = ["Custo_Total", "VPL", "TIR", "Pico_Anual"]
+
+
+@dataclass
+class ComparacaoRodadas:
+    """
+    Diferenças entre duas rodadas (B − A):
+    - contratos: uma linha por ID com métricas de A, de B e Delta_*;
+    - anos: pagamentos por (Ano, Tipo) em A, B e a diferença;
+    - contratos_anos: pagamentos por (ID, Ano) em A, B e a diferença;
+    - fluxo: pagamentos alinhados por (ID, Data).
+    """
+    contratos: pd.DataFrame
+    anos: pd.DataFrame
+    contratos_anos: pd.DataFrame
+    fluxo: pd.DataFrame
+
+
+# =========================
+# 🔹 Alinhamento por chaves inteiras
+# =========================
+
+def _alinhar(chaves_a: np.ndarray, chaves_b: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Junção externa de duas listas de chaves inteiras únicas e ordenadas
+    (merge ordenado por busca binária). Retorna (chaves, posicao_a,
+    posicao_b), com posição -1 onde a chave não existe no lado.
+    """
+    if np.array_equal(chaves_a, chaves_b):
+        posicao = np.arange(chaves_a.size)
+        return chaves_a, posicao, posicao
+
+    # Duas sequências já ordenadas: a ordenação estável (timsort) só as intercala
+    todas = np.sort(np.concatenate([chaves_a, chaves_b]), kind="stable")
+    chaves = todas[np.concatenate([[True], todas[1:] != todas[:-1]])] if todas.size else todas
+
+    def posicoes(lado: np.ndarray) -> np.ndarray:
+        if lado.size == 0:
+            return np.full(chaves.size, -1)
+        pos = np.searchsorted(lado, chaves)
+        existe = (pos < lado.size) & (lado[np.minimum(pos, lado.size - 1)] == chaves)
+        return np.where(existe, pos, -1)
+
+    return chaves, posicoes(chaves_a), posicoes(chaves_b)
+
+
+def _somar_por_chave(chaves: np.ndarray, valores: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Soma 'valores' por chave; devolve (chaves únicas ordenadas, somas).
+    Chaves já ordenadas (fluxo contrato a contrato, datas crescentes) não
+    são reordenadas.
+    """
+    if chaves.size == 0:
+        return chaves, np.zeros(0)
+    if not np.all(chaves[1:] >= chaves[:-1]):
+        ordem = np.argsort(chaves, kind="stable")
+        chaves = chaves[ordem]
+        valores = valores[ordem]
+
+    inicio = np.flatnonzero(np.concatenate([[True], chaves[1:] != chaves[:-1]]))
+    return chaves[inicio], np.add.reduceat(valores, inicio)
+
+
+def _pegar(valores: np.ndarray, posicao: np.ndarray) -> np.ndarray:
+    """valores[posicao], com NaN onde posicao = -1."""
+    saida = np.full(posicao.size, np.nan)
+    ok = posicao >= 0
+    saida[ok] = valores[posicao[ok]]
+    return saida
+
+
+def _pegar_texto(tabela: pd.DataFrame, coluna: str, posicao: np.ndarray) -> np.ndarray:
+    """tabela[coluna] nas posições, com None onde posicao = -1 ou sem a coluna."""
+    saida = np.full(posicao.size, None, dtype=object)
+    if coluna in tabela.columns:
+        ok = posicao >= 0
+        saida[ok] = tabela[coluna].to_numpy(dtype=object)[posicao[ok]]
+    return saida
+
+
+def _comparar_somas(chaves_a, valores_a, chaves_b, valores_b):
+    """Somas por chave dos dois lados, alinhadas; ausências viram 0."""
+    ka, sa = _somar_por_chave(chaves_a, valores_a)
+    kb, sb = _somar_por_chave(chaves_b, valores_b)
+    chaves, pa, pb = _alinhar(ka, kb)
+    va = np.nan_to_num(_pegar(sa, pa))
+    vb = np.nan_to_num(_pegar(sb, pb))
+    return chaves, va, vb
+
+
+# =========================
+# 🔹 Comparação
+# =========================
+
+def _tabela_contratos(rodada) -> pd.DataFrame:
+    """Uma linha por contrato com as métricas (ranking já traz o pico anual)."""
+    resumo, ranking = rodada[0], rodada[5]
+    base = ranking if ranking is not None and not ranking.empty else resumo
+    tabela = base.drop_duplicates("ID").copy()
+    for m in METRICAS:
+        if m not in tabela.columns:
+            tabela[m] = np.nan
+    return tabela
+
+
+def comparar_rodadas(rodada_a, rodada_b) -> ComparacaoRodadas:
+    """
+    Compara duas rodadas (tuplas de rodar_modelo, ex.: dois cenários ou
+    dois meses da mesma carteira).
+
+    IDs são convertidos em códigos inteiros comuns aos dois lados e datas
+    em dias; (ID, Data) vira uma única chave inteira. O alinhamento é um
+    merge ordenado sobre essas chaves, sem joins de DataFrame.
+    Contratos que só existem de um lado aparecem com NaN no outro.
+    """
+    contratos_a = _tabela_contratos(rodada_a)
+    contratos_b = _tabela_contratos(rodada_b)
+    fluxo_a = rodada_a[1]
+    fluxo_b = rodada_b[1]
+
+    # Códigos inteiros de ID comuns às duas rodadas, na ordem em que aparecem
+    # no fluxo: assim as chaves (ID, Data) já saem ordenadas
+    _, ids = pd.factorize(pd.concat([fluxo_a["ID"], fluxo_b["ID"], contratos_a["ID"], contratos_b["ID"]], ignore_index=True))
+    indice_ids = pd.Index(ids)
+
+    def codigos(serie: pd.Series) -> np.ndarray:
+        return indice_ids.get_indexer(serie).astype(np.int64)
+
+    # -------------------------
+    # Por contrato
+    # -------------------------
+    ca = codigos(contratos_a["ID"])
+    cb = codigos(contratos_b["ID"])
+    oa, ob = np.argsort(ca), np.argsort(cb)
+    chaves, pa, pb = _alinhar(ca[oa], cb[ob])
+    pa = np.where(pa >= 0, oa[np.maximum(pa, 0)], -1)
+    pb = np.where(pb >= 0, ob[np.maximum(pb, 0)], -1)
+
+    contratos = pd.DataFrame({"ID": ids[chaves]})
+    for col in ["Descrição", "Tipo"]:
+        contratos[col] = np.where(pb >= 0, _pegar_texto(contratos_b, col, pb), _pegar_texto(contratos_a, col, pa))
+
+    contratos["Presenca"] = np.select([(pa >= 0) & (pb >= 0), pa >= 0], ["Ambas", "Só A"], "Só B")
+    for m in METRICAS:
+        va = _pegar(contratos_a[m].to_numpy(dtype=float), pa)
+        vb = _pegar(contratos_b[m].to_numpy(dtype=float), pb)
+        contratos[f"{m}_A"] = va
+        contratos[f"{m}_B"] = vb
+        contratos[f"Delta_{m}"] = vb - va
+
+    # -------------------------
+    # Fluxo por (ID, Data)
+    # -------------------------
+    # (ID, Data) → código do ID nos bits altos, dias (deslocados para >= 0) nos baixos
+    deslocamento = np.int64(1 << 31)
+
+    def chave_fluxo(fluxo: pd.DataFrame) -> np.ndarray:
+        datas = fluxo["Data"]
+        if not pd.api.types.is_datetime64_any_dtype(datas):
+            datas = pd.to_datetime(datas)
+        dias = datas.to_numpy().astype("datetime64[D]").astype(np.int64)
+        return (codigos(fluxo["ID"]) << 32) + dias + deslocamento
+
+    chaves_f, pag_a, pag_b = _comparar_somas(
+        chave_fluxo(fluxo_a), fluxo_a["Pagamento"].to_numpy(dtype=float),
+        chave_fluxo(fluxo_b), fluxo_b["Pagamento"].to_numpy(dtype=float),
+    )
+    codigo_id = chaves_f >> 32
+    dias_f = (chaves_f & ((1 << 32) - 1)) - deslocamento
+    fluxo = pd.DataFrame(
+        {
+            "ID": ids[codigo_id],
+            "Data": dias_f.astype("datetime64[D]").astype("datetime64[us]"),
+            "Pagamento_A": pag_a,
+            "Pagamento_B": pag_b,
+            "Delta_Pagamento": pag_b - pag_a,
+        }
+    )
+
+    # -------------------------
+    # Por (ID, Ano) e por (Ano, Tipo)
+    # -------------------------
+    ano = dias_f.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+    chaves_ia, soma_a = _somar_por_chave(codigo_id * 10000 + ano, pag_a)
+    _, soma_b = _somar_por_chave(codigo_id * 10000 + ano, pag_b)
+    contratos_anos = pd.DataFrame(
+        {
+            "ID": ids[chaves_ia // 10000],
+            "Ano": (chaves_ia % 10000).astype(int),
+            "Pagamento_A": soma_a,
+            "Pagamento_B": soma_b,
+            "Delta_Pagamento": soma_b - soma_a,
+        }
+    )
+
+    tipo_por_id = contratos.set_index("ID")["Tipo"]
+    anos = (
+        contratos_anos.assign(Tipo=contratos_anos["ID"].map(tipo_por_id))
+        .groupby(["Ano", "Tipo"])[["Pagamento_A", "Pagamento_B", "Delta_Pagamento"]]
+        .sum()
+        .reset_index()
+    )
+
+    return ComparacaoRodadas(contratos=contratos, anos=anos, contratos_anos=contratos_anos, fluxo=fluxo)
+
+
+# =========================
+# 🔹 Cenários lado a lado
+# =========================
+
+def tabela_cenarios(rodadas: dict) -> pd.DataFrame:
+    """
+    Carteira de cada cenário lado a lado ({nome: saídas de rodar_modelo}):
+    uma linha por (Cenario, Tipo) com Custo_Total, VPL, TIR e o maior
+    pagamento anual (Pico_Anual) e seu ano.
+    """
+    partes = []
+    for nome, rodada in rodadas.items():
+        carteira, fluxo_anual = rodada[2], rodada[3]
+        tabela = carteira[["Tipo", "Custo_Total", "VPL", "TIR"]].copy()
+
+        picos = fluxo_anual.groupby("Tipo")["Pagamento"].max() if not fluxo_anual.empty else pd.Series(dtype=float)
+        anos_pico = (
+            fluxo_anual.loc[fluxo_anual.groupby("Tipo")["Pagamento"].idxmax()].set_index("Tipo")["Ano"]
+            if not fluxo_anual.empty
+            else pd.Series(dtype=float)
+        )
+        tabela["Pico_Anual"] = tabela["Tipo"].map(picos)
+        tabela["Ano_Pico"] = tabela["Tipo"].map(anos_pico).astype("Int64")
+        tabela.insert(0, "Cenario", nome)
+        partes.append(tabela)
+
+    if not partes:
+        return pd.DataFrame(columns=["Cenario", "Tipo", "Custo_Total", "VPL", "TIR", "Pico_Anual", "Ano_Pico"])
+    return pd.concat(partes, ignore_index=True)
+
+
+def fluxo_anual_cenarios(rodadas: dict) -> pd.DataFrame:
+    """Pagamentos anuais por Tipo de cada cenário, empilhados (coluna Cenario)."""
+    partes = [rodada[3].assign(Cenario=nome) for nome, rodada in rodadas.items()]
+    if not partes:
+        return pd.DataFrame(columns=["Ano", "Tipo", "Pagamento", "Cenario"])
+    return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,82 @@
+import numpy as np
+
+from curvas import contar_dias_uteis, para_dias
+
+
+# Convenções de contagem de dias aceitas na coluna 'Base_Calculo'
+BASES_CALCULO = ("DU/252", "ACT/360", "ACT/365", "30/360")
+BASE_PADRAO = "DU/252"
+
+# Grafias alternativas encontradas nas planilhas
+_SINONIMOS = {
+    "DU252": "DU/252",
+    "252": "DU/252",
+    "BUS/252": "DU/252",
+    "ACT360": "ACT/360",
+    "A/360": "ACT/360",
+    "ACT/365F": "ACT/365",
+    "ACT365": "ACT/365",
+    "A/365": "ACT/365",
+    "30360": "30/360",
+    "30U/360": "30/360",
+}
+
+
+def normalizar_base(base) -> str:
+    """
+    Nome canônico da convenção ('DU/252', 'ACT/360', 'ACT/365', '30/360').
+    Vazio/NaN → DU/252 (padrão do modelo).
+    """
+    if base is None or str(base).strip() == "" or str(base).lower() == "nan":
+        return BASE_PADRAO
+
+    texto = str(base).strip().upper().replace(" ", "")
+    texto = _SINONIMOS.get(texto, texto)
+    if texto not in BASES_CALCULO:
+        raise ValueError(f"Base de cálculo inválida: {base}. Use uma de {list(BASES_CALCULO)}.")
+    return texto
+
+
+# =========================
+# 🔹 Kernels vetorizados
+# =========================
+
+def _dias_30_360(inicio: np.ndarray, fim: np.ndarray) -> np.ndarray:
+    """
+    Dias pela convenção 30/360 (bond basis): dia 31 vira 30 no início, e
+    no fim só quando o início já é 30/31. Arrays datetime64[D].
+    """
+    mes_inicio = inicio.astype("datetime64[M]")
+    mes_fim = fim.astype("datetime64[M]")
+    d1 = (inicio - mes_inicio.astype("datetime64[D]")).astype(np.int64) + 1
+    d2 = (fim - mes_fim.astype("datetime64[D]")).astype(np.int64) + 1
+
+    d1 = np.minimum(d1, 30)
+    d2 = np.where((d2 == 31) & (d1 == 30), 30, d2)
+    meses = (mes_fim - mes_inicio).astype(np.int64)
+    return 30 * meses + (d2 - d1)
+
+
+def dias_base(inicio, fim, base: str = BASE_PADRAO, calendario: str = "ANBIMA") -> np.ndarray:
+    """
+    Numerador da fração de ano de cada período [inicio, fim): dias úteis
+    (DU/252), dias corridos (ACT/...) ou dias 30/360. Vetorizado.
+    """
+    base = normalizar_base(base)
+    if base == "DU/252":
+        return contar_dias_uteis(inicio, fim, calendario)
+
+    inicio, fim = np.broadcast_arrays(para_dias(inicio), para_dias(fim))
+    if base == "30/360":
+        return _dias_30_360(inicio, fim)
+    return (fim - inicio).astype(np.int64)
+
+
+def denominador_base(base: str) -> int:
+    """Dias no ano da convenção (252, 360 ou 365)."""
+    return int(normalizar_base(base).split("/")[1])
+
+
+def fracao_ano(inicio, fim, base: str = BASE_PADRAO, calendario: str = "ANBIMA") -> np.ndarray:
+    """Fração de ano de cada período [inicio, fim) na convenção 'base'."""
+    return dias_base(inicio, fim, base, calendario) / denominador_base(base)
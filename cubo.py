@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from matrizes import ATRIBUTOS, MatrizesCarteira
+
+
+# Medidas do cubo (nome → matriz de MatrizesCarteira)
+MEDIDAS_CUBO = {
+    "Pagamento": "pagamento",
+    "Juros": "juros",
+    "Amortização": "amortizacao",
+    "Saldo_Devedor": "saldo",
+}
+
+# Estoques: ao agregar no tempo, vale o último mês do período (não a soma)
+MEDIDAS_ESTOQUE = ("Saldo_Devedor",)
+
+DIMENSOES = ATRIBUTOS + ["Ano", "Mes"]
+
+
+@dataclass
+class CuboCarteira:
+    """
+    Agregados da rodada em arrays densos com um eixo por dimensão:
+    Tipo × Moeda × Indexador × Sistema_Amortização × Mes (Ano é derivado
+    do mês). Montado uma vez por rodada; recortes (fatiar) e totais por
+    qualquer combinação de dimensões (agregar/pivotar) são somas sobre
+    eixos, sem voltar às linhas do fluxo.
+    """
+    rotulos: dict[str, np.ndarray]
+    medidas: dict[str, np.ndarray]
+
+    # -------------------------
+    # Recorte
+    # -------------------------
+
+    def fatiar(self, **filtros) -> "CuboCarteira":
+        """
+        Sub-cubo com os valores pedidos em cada dimensão, ex.:
+        fatiar(Moeda=["USD"], Ano=[2030, 2031]). Ano filtra os meses.
+        """
+        rotulos = dict(self.rotulos)
+        medidas = dict(self.medidas)
+        for dimensao, valores in filtros.items():
+            if valores is None:
+                continue
+            if isinstance(valores, (str, int, float)):
+                valores = [valores]
+            if dimensao == "Ano":
+                anos = rotulos["Mes"].astype("datetime64[Y]").astype(np.int64) + 1970
+                posicoes = np.flatnonzero(np.isin(anos, list(valores)))
+                dimensao = "Mes"
+            elif dimensao in rotulos:
+                posicoes = np.flatnonzero(np.isin(rotulos[dimensao], list(valores)))
+            else:
+                raise ValueError(f"Dimensão desconhecida: {dimensao}. Use uma de {DIMENSOES}.")
+
+            eixo = len(ATRIBUTOS) if dimensao == "Mes" else ATRIBUTOS.index(dimensao)
+            rotulos[dimensao] = rotulos[dimensao][posicoes]
+            medidas = {nome: np.take(valores_m, posicoes, axis=eixo) for nome, valores_m in medidas.items()}
+        return CuboCarteira(rotulos=rotulos, medidas=medidas)
+
+    # -------------------------
+    # Roll-up
+    # -------------------------
+
+    def _tempo(self, valores: np.ndarray, medida: str, por_tempo: str | None) -> tuple[np.ndarray, np.ndarray | None]:
+        """Reduz o eixo do tempo (último): por mês, por ano ou inteiro."""
+        meses = self.rotulos["Mes"]
+        estoque = medida in MEDIDAS_ESTOQUE
+        if por_tempo == "Mes":
+            return valores, meses.astype("datetime64[us]")
+
+        if por_tempo == "Ano":
+            anos = meses.astype("datetime64[Y]").astype(np.int64) + 1970
+            inicio = np.flatnonzero(np.concatenate([[True], anos[1:] != anos[:-1]])) if anos.size else np.array([], dtype=int)
+            if estoque:
+                fim = np.append(inicio[1:], anos.size) - 1
+                return valores[..., fim], anos[inicio]
+            return np.add.reduceat(valores, inicio, axis=-1) if anos.size else valores, anos[inicio]
+
+        if estoque:
+            # sem tempo: estoque no último mês do recorte
+            return valores[..., -1] if meses.size else valores.sum(axis=-1), None
+        return valores.sum(axis=-1), None
+
+    def agregar(self, por: list[str], medida: str = "Pagamento") -> pd.DataFrame:
+        """
+        Total de 'medida' por combinação das dimensões em 'por' (ex.:
+        ["Ano", "Moeda"]); as demais são somadas. Em Saldo_Devedor, o
+        tempo agregado usa o fim do período. Retorna formato longo.
+        """
+        if medida not in self.medidas:
+            raise ValueError(f"Medida desconhecida: {medida}. Use uma de {list(self.medidas)}.")
+        desconhecidas = [d for d in por if d not in DIMENSOES]
+        if desconhecidas:
+            raise ValueError(f"Dimensões desconhecidas: {desconhecidas}. Use {DIMENSOES}.")
+        if "Ano" in por and "Mes" in por:
+            raise ValueError("Use Ano ou Mes, não os dois.")
+
+        atributos = [d for d in ATRIBUTOS if d in por]
+        eixos_soma = tuple(i for i, d in enumerate(ATRIBUTOS) if d not in por)
+        valores = self.medidas[medida].sum(axis=eixos_soma)
+
+        por_tempo = "Ano" if "Ano" in por else "Mes" if "Mes" in por else None
+        valores, tempo = self._tempo(valores, medida, por_tempo)
+
+        dims = atributos + ([por_tempo] if por_tempo else [])
+        rotulos = [self.rotulos[d] for d in atributos] + ([tempo] if por_tempo else [])
+        if not dims:
+            return pd.DataFrame({medida: [float(valores)]})
+
+        grade = np.meshgrid(*rotulos, indexing="ij")
+        tabela = pd.DataFrame({d: g.ravel() for d, g in zip(dims, grade)})
+        tabela[medida] = np.asarray(valores).ravel()
+        # combinações sem nenhum contrato não aparecem
+        return tabela[tabela[medida] != 0].reset_index(drop=True)
+
+    def pivotar(self, linhas: list[str], colunas: list[str] | None = None, medida: str = "Pagamento") -> pd.DataFrame:
+        """Tabela dinâmica: 'linhas' no índice, 'colunas' nas colunas, 'medida' nas células."""
+        colunas = list(colunas or [])
+        tabela = self.agregar(list(linhas) + colunas, medida)
+        if not colunas:
+            return tabela.set_index(list(linhas))
+        return tabela.pivot_table(index=list(linhas), columns=colunas, values=medida, aggfunc="sum", fill_value=0.0)
+
+
+def montar_cubo(matrizes: MatrizesCarteira) -> CuboCarteira:
+    """
+    Cubo a partir das matrizes contratos × meses da rodada: contratos com
+    os mesmos atributos são somados numa célula (ordenação + reduceat),
+    uma única vez.
+    """
+    codigos = []
+    rotulos = {}
+    for dimensao in ATRIBUTOS:
+        valores = matrizes.contratos[dimensao].astype(str).to_numpy()
+        codigo, rotulo = pd.factorize(valores, sort=True)
+        codigos.append(codigo)
+        rotulos[dimensao] = np.asarray(rotulo)
+    rotulos["Mes"] = matrizes.meses
+
+    forma = tuple(rotulos[d].size for d in ATRIBUTOS)
+    n_meses = matrizes.meses.size
+    celula = np.ravel_multi_index(codigos, forma) if len(matrizes.contratos) else np.zeros(0, dtype=np.int64)
+
+    ordem = np.argsort(celula, kind="stable")
+    celula_ordenada = celula[ordem]
+    inicio = np.flatnonzero(np.concatenate([[True], celula_ordenada[1:] != celula_ordenada[:-1]])) if celula.size else celula
+
+    medidas = {}
+    for nome, atributo in MEDIDAS_CUBO.items():
+        densa = np.zeros((int(np.prod(forma)), n_meses))
+        if celula.size:
+            densa[celula_ordenada[inicio]] = np.add.reduceat(getattr(matrizes, atributo)[ordem], inicio, axis=0)
+        medidas[nome] = densa.reshape(forma + (n_meses,))
+
+    return CuboCarteira(rotulos=rotulos, medidas=medidas)
@@ -0,0 +1,477 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from calendarios import obter_calendario
+
+
+# =========================
+# 🔹 Leitura de arquivos locais de curva
+# =========================
+
+def ler_tabela_local(arquivo) -> pd.DataFrame:
+    """
+    Lê uma tabela local (CSV ou Excel) com curva ou série.
+    Aceita caminho ou arquivo já aberto (ex.: upload do Streamlit).
+    CSV pode vir com ';' e vírgula decimal (padrão brasileiro).
+    """
+    nome = str(getattr(arquivo, "name", arquivo)).lower()
+    if nome.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(arquivo)
+    else:
+        df = pd.read_csv(arquivo, sep=None, engine="python")
+
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def para_numero(serie: pd.Series) -> pd.Series:
+    """
+    Converte coluna numérica que pode vir como texto com vírgula decimal.
+    Só as células de texto são interpretadas (se alguma tem vírgula, "."
+    é separador de milhar em todas elas); células já numéricas ficam como
+    estão.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+
+    e_texto = serie.map(lambda v: isinstance(v, str)).astype(bool)
+    numeros = pd.to_numeric(serie.where(~e_texto), errors="coerce").astype(float)
+
+    texto = serie[e_texto].astype(str).str.strip()
+    if texto.str.contains(",").any():
+        texto = texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    numeros[e_texto] = pd.to_numeric(texto, errors="coerce")
+    return numeros
+
+
+def para_data(serie: pd.Series) -> pd.Series:
+    """
+    Converte coluna de datas de arquivo local: ISO (AAAA-MM-DD) ou padrão
+    brasileiro (DD/MM/AAAA). Valores inválidos viram NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    texto = serie.astype(str).str.strip()
+    datas = pd.to_datetime(texto, format="ISO8601", errors="coerce")
+    brasileiras = datas.isna()
+    if brasileiras.any():
+        datas[brasileiras] = pd.to_datetime(texto[brasileiras], format="%d/%m/%Y", errors="coerce")
+    return datas
+
+
+def para_dias(datas) -> np.ndarray:
+    """Converte datas diversas em array numpy datetime64[D]."""
+    if isinstance(datas, np.ndarray) and np.issubdtype(datas.dtype, np.datetime64):
+        return datas.astype("datetime64[D]")
+    if isinstance(datas, pd.DatetimeIndex):
+        return datas.values.astype("datetime64[D]")
+    return pd.to_datetime(np.atleast_1d(datas)).values.astype("datetime64[D]")
+
+
+def contar_dias_uteis(inicio, fim, calendario: str = "ANBIMA") -> np.ndarray:
+    """
+    Conta dias úteis entre 'inicio' (inclusive) e 'fim' (exclusive), de
+    forma vetorizada, no calendário informado (ver calendarios.obter_calendario;
+    padrão ANBIMA). Se fim < inicio, o resultado é negativo.
+    """
+    inicio = para_dias(inicio)
+    fim = para_dias(fim)
+    if inicio.size == 0 or fim.size == 0:
+        return np.zeros(max(inicio.size, fim.size), dtype=np.int64)
+
+    inicio, fim = np.broadcast_arrays(inicio, fim)
+    return obter_calendario(calendario).contar(inicio, fim)
+
+
+# =========================
+# 🔹 Curva de desconto (pré, base 252)
+# =========================
+
+class CurvaDesconto:
+    """
+    Curva de desconto em taxa efetiva anual base 252 dias úteis.
+
+    - Vértices em dias úteis contados a partir de 'data_base'.
+    - Interpolação flat forward (linear no log do fator de desconto),
+      convenção usual da curva pré/DI.
+    - Antes do primeiro vértice vale a primeira taxa; depois do último,
+      a última taxa.
+    - Fatores de desconto ficam em cache por data: a curva é montada uma
+      vez por rodada e reutilizada por todos os contratos.
+    """
+
+    def __init__(self, data_base, dias_uteis, taxas):
+        dias_uteis = np.asarray(dias_uteis, dtype=float)
+        taxas = np.asarray(taxas, dtype=float)
+        if dias_uteis.size == 0 or dias_uteis.size != taxas.size:
+            raise ValueError("Curva de desconto precisa de vértices (dias úteis e taxas) de mesmo tamanho.")
+
+        ordem = np.argsort(dias_uteis)
+        self.data_base = pd.Timestamp(data_base).normalize()
+        self.dias_uteis = dias_uteis[ordem]
+        self.taxas = taxas[ordem]
+
+        # log do fator de desconto em cada vértice, com o ponto (0, 0) na data-base
+        log_fd = -self.dias_uteis / 252 * np.log1p(self.taxas)
+        self._du_nos = np.concatenate([[0.0], self.dias_uteis])
+        self._log_fd_nos = np.concatenate([[0.0], log_fd])
+
+        self._cache: dict[np.datetime64, float] = {}
+
+    # -------------------------
+    # Construtores
+    # -------------------------
+
+    @classmethod
+    def plana(cls, taxa_anual: float, data_base=None) -> "CurvaDesconto":
+        """Curva plana: mesma taxa anual (base 252) para qualquer prazo."""
+        if data_base is None:
+            data_base = dt.date.today()
+        return cls(data_base, [252], [taxa_anual])
+
+    @classmethod
+    def de_arquivo(cls, arquivo, data_base=None) -> "CurvaDesconto":
+        """
+        Carrega curva pré de arquivo local (CSV/Excel), ex.: ajustes de DI futuro.
+
+        Colunas esperadas:
+        - 'Taxa' em % a.a. base 252 (como divulgado pela B3);
+        - 'DU' (dias úteis a partir da data-base) ou 'Data' (vencimento do vértice).
+        """
+        df = ler_tabela_local(arquivo)
+
+        if "Taxa" not in df.columns:
+            raise ValueError("Arquivo de curva sem coluna obrigatória: 'Taxa'.")
+        if "DU" not in df.columns and "Data" not in df.columns:
+            raise ValueError("Arquivo de curva precisa da coluna 'DU' ou 'Data'.")
+
+        if data_base is None:
+            data_base = dt.date.today()
+
+        taxas = para_numero(df["Taxa"]) / 100.0
+        if "DU" in df.columns:
+            dias_uteis = para_numero(df["DU"])
+        else:
+            datas = para_data(df["Data"])
+            dias_uteis = pd.Series(np.nan, index=df.index)
+            validas = datas.notna()
+            dias_uteis[validas] = contar_dias_uteis(
+                np.full(int(validas.sum()), np.datetime64(pd.Timestamp(data_base).date())),
+                datas[validas],
+            )
+
+        validos = taxas.notna() & dias_uteis.notna() & (dias_uteis > 0)
+        return cls(data_base, dias_uteis[validos], taxas[validos])
+
+    # -------------------------
+    # Fatores de desconto
+    # -------------------------
+
+    def _log_fator(self, du: np.ndarray) -> np.ndarray:
+        du = np.asarray(du, dtype=float)
+        log_fd = np.interp(du, self._du_nos, self._log_fd_nos)
+
+        antes = du < 0
+        if antes.any():
+            log_fd[antes] = -du[antes] / 252 * np.log1p(self.taxas[0])
+
+        depois = du > self.dias_uteis[-1]
+        if depois.any():
+            log_fd[depois] = -du[depois] / 252 * np.log1p(self.taxas[-1])
+
+        return log_fd
+
+    def fator_desconto(self, datas) -> np.ndarray:
+        """
+        Fatores de desconto (data-base → data) para um array de datas.
+        Calcula só as datas ainda não vistas e guarda em cache.
+        """
+        datas = para_dias(datas)
+        unicas, inversa = np.unique(datas, return_inverse=True)
+
+        novas = np.array([d for d in unicas if d not in self._cache], dtype="datetime64[D]")
+        if novas.size:
+            base = np.full(novas.size, np.datetime64(self.data_base.date()))
+            fatores = np.exp(self._log_fator(contar_dias_uteis(base, novas)))
+            self._cache.update(zip(novas, fatores))
+
+        valores = np.array([self._cache[d] for d in unicas], dtype=float)
+        return valores[inversa.ravel()]
+
+    # -------------------------
+    # VPL
+    # -------------------------
+
+    def vpl_carteira(
+        self,
+        contrato_idx,
+        datas,
+        pagamentos,
+        datas_referencia,
+        fluxos_iniciais,
+    ) -> np.ndarray:
+        """
+        VPL de todos os contratos de uma vez.
+
+        - contrato_idx: índice (0..n-1) do contrato de cada pagamento;
+        - datas / pagamentos: datas e valores (BRL) de cada pagamento;
+        - datas_referencia: data de liberação de cada contrato (data do VPL);
+        - fluxos_iniciais: fluxo na liberação de cada contrato (ex.: -valor).
+
+        O desconto é o produto da matriz esparsa contratos × datas de
+        pagamento pelo vetor de fatores de desconto, trazido para a data
+        de liberação de cada contrato.
+        """
+        contrato_idx = np.asarray(contrato_idx, dtype=np.int64)
+        fluxos_iniciais = np.asarray(fluxos_iniciais, dtype=float)
+        n = fluxos_iniciais.size
+
+        pv_base = np.bincount(
+            contrato_idx,
+            weights=np.asarray(pagamentos, dtype=float) * self.fator_desconto(datas),
+            minlength=n,
+        )
+        return pv_base / self.fator_desconto(datas_referencia) + fluxos_iniciais
+
+
+# =========================
+# 🔹 Curvas de projeção de indexadores (CDI, IPCA, SELIC...)
+# =========================
+
+class CurvaProjecao:
+    """
+    Projeção de um indexador no tempo (ex.: Focus ou projeção interna).
+
+    - 'datas' / 'taxas': taxa efetiva anual (base 252) em vigor a partir
+      de cada data, até a data seguinte (mensal ou diária).
+    - A projeção é convertida uma única vez em fatores acumulados por dia
+      útil; o fator de qualquer período é a razão entre dois valores
+      pré-calculados, com o mesmo custo de uma taxa constante.
+    - Antes da primeira data vale a primeira taxa; depois da última,
+      a última taxa.
+    """
+
+    def __init__(self, indexador: str, datas, taxas):
+        datas = para_dias(datas)
+        taxas = np.asarray(taxas, dtype=float)
+        if datas.size == 0 or datas.size != taxas.size:
+            raise ValueError(f"Projeção de {indexador} precisa de datas e taxas de mesmo tamanho.")
+
+        ordem = np.argsort(datas, kind="stable")
+        self.indexador = str(indexador).upper()
+        self.datas = datas[ordem]
+        self.taxas = taxas[ordem]
+        self.inicio = self.datas[0]
+
+        # Taxa anual em vigor em cada dia útil da grade [inicio, última data]
+        n_dias = int(contar_dias_uteis(self.inicio, self.datas[-1])[0])
+        dias_grade = obter_calendario("ANBIMA").dias_uteis_desde(self.inicio, n_dias)
+        vigente = np.searchsorted(self.datas, dias_grade, side="right") - 1
+        self._taxas_grade = self.taxas[np.clip(vigente, 0, None)]
+
+        self._acumulados: dict[tuple[float, float], np.ndarray] = {}
+
+    @classmethod
+    def plana(cls, indexador: str, taxa_anual: float, data_base=None) -> "CurvaProjecao":
+        """Projeção constante (equivale à taxa única usada até aqui)."""
+        if data_base is None:
+            data_base = dt.date.today()
+        return cls(indexador, [data_base], [taxa_anual])
+
+    def _log_acumulado(self, fator: float, choque: float) -> np.ndarray:
+        """
+        Log do fator acumulado do indexador do início da grade até cada dia
+        útil (tamanho n+1), para um multiplicador ('Fator_indexador') e
+        choque paralelo (em base 1.0). Calculado uma vez por combinação.
+        """
+        chave = (float(fator), float(choque))
+        if chave not in self._acumulados:
+            taxas = (self._taxas_grade + choque) * fator
+            log_dia = np.log1p(taxas) / 252
+            self._acumulados[chave] = np.concatenate([[0.0], np.cumsum(log_dia)])
+        return self._acumulados[chave]
+
+    def _log_fator(self, datas, fator: float, choque: float) -> np.ndarray:
+        acumulado = self._log_acumulado(fator, choque)
+        n = acumulado.size - 1
+        du = contar_dias_uteis(np.full(para_dias(datas).size, self.inicio), datas)
+
+        log_inicio = np.log1p((self.taxas[0] + choque) * fator) / 252
+        log_fim = np.log1p((self.taxas[-1] + choque) * fator) / 252
+
+        return np.where(
+            du < 0,
+            du * log_inicio,
+            np.where(
+                du > n,
+                acumulado[-1] + (du - n) * log_fim,
+                acumulado[np.clip(du, 0, n)],
+            ),
+        )
+
+    def fator_periodo(self, inicios, fins, fator: float = 1.0, choque: float = 0.0) -> np.ndarray:
+        """
+        Fator do indexador em cada período [inicio, fim), em dias úteis ANBIMA.
+        Ex.: fator 1.01 = indexador rendeu 1% no período.
+        """
+        return np.exp(self._log_fator(fins, fator, choque) - self._log_fator(inicios, fator, choque))
+
+    def taxas_diarias(self, inicios, fins) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Taxa anual em vigor em cada dia útil dos períodos [inicio, fim), o
+        período (posição em 'inicios') e o sinal de cada dia. Com elas, o
+        fator de qualquer Fator_indexador é uma soma por período, sem
+        acumular a grade de novo:
+        log fator = Σ sinal × log1p((taxa + choque) × fator) / 252.
+        Período com início depois do fim conta os dias de [fim, inicio)
+        com sinal negativo, como fator_periodo.
+        """
+        inicios = para_dias(inicios)
+        n = self._taxas_grade.size
+        du_inicio = contar_dias_uteis(np.full(inicios.size, self.inicio), inicios)
+        du_fim = contar_dias_uteis(np.full(inicios.size, self.inicio), fins)
+        primeiro = np.minimum(du_inicio, du_fim)
+        tamanhos = np.abs(du_fim - du_inicio)
+
+        periodo = np.repeat(np.arange(inicios.size), tamanhos)
+        dia = np.repeat(primeiro, tamanhos) + np.arange(tamanhos.sum()) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+        # depois da grade vale a última taxa; antes, a primeira
+        grade = np.append(self._taxas_grade, self.taxas[-1])
+        taxas = np.where(dia < 0, self.taxas[0], grade[np.clip(dia, 0, n)])
+        sinal = np.where(du_fim >= du_inicio, 1.0, -1.0)[periodo]
+        return taxas, periodo, sinal
+
+
+def carregar_projecoes(arquivo) -> dict[str, CurvaProjecao]:
+    """
+    Carrega projeções de indexadores de arquivo local (CSV/Excel).
+
+    Colunas esperadas:
+    - 'Indexador' (CDI, IPCA, SELIC, ...);
+    - 'Data' (início de vigência da taxa, mensal ou diária);
+    - 'Taxa' em % a.a. base 252, ou 'Taxa_Mensal' em % a.m.
+      (ex.: IPCA mensal do Focus), anualizada na leitura.
+    """
+    df = ler_tabela_local(arquivo)
+
+    if "Indexador" not in df.columns or "Data" not in df.columns:
+        raise ValueError("Arquivo de projeções precisa das colunas 'Indexador' e 'Data'.")
+
+    if "Taxa" in df.columns:
+        taxas = para_numero(df["Taxa"]) / 100.0
+    elif "Taxa_Mensal" in df.columns:
+        taxas = (1 + para_numero(df["Taxa_Mensal"]) / 100.0) ** 12 - 1
+    else:
+        raise ValueError("Arquivo de projeções precisa da coluna 'Taxa' ou 'Taxa_Mensal'.")
+
+    df = df.assign(
+        Indexador=df["Indexador"].astype(str).str.strip().str.upper(),
+        Data=para_data(df["Data"]),
+        Taxa=taxas,
+    )
+    df = df[df["Data"].notna() & df["Taxa"].notna()]
+
+    return {
+        indexador: CurvaProjecao(indexador, grupo["Data"], grupo["Taxa"])
+        for indexador, grupo in df.groupby("Indexador")
+    }
+
+
+# =========================
+# 🔹 Câmbio por data
+# =========================
+
+class CurvaCambio:
+    """
+    Câmbio (R$ por unidade da moeda) por data.
+    Vale o último valor conhecido em cada data (ou, com 'linear', a
+    interpolação linear entre datas); antes da primeira data, o primeiro
+    valor, e depois da última, o último.
+    """
+
+    def __init__(self, moeda: str, datas, valores, linear: bool = False):
+        datas = para_dias(datas)
+        valores = np.asarray(valores, dtype=float)
+        if datas.size == 0 or datas.size != valores.size:
+            raise ValueError(f"Câmbio de {moeda} precisa de datas e valores de mesmo tamanho.")
+
+        ordem = np.argsort(datas, kind="stable")
+        self.moeda = str(moeda).upper()
+        self.datas = datas[ordem]
+        self.cotacoes = valores[ordem]
+        self.linear = linear
+
+    @classmethod
+    def paridade(
+        cls,
+        moeda: str,
+        spot: float,
+        curva_local: CurvaDesconto,
+        taxa_externa: float,
+        anos: int = 60,
+    ) -> "CurvaCambio":
+        """
+        Câmbio a termo por paridade coberta de juros, a partir do spot na
+        data-base da curva local:
+
+            F(t) = spot × FD_externo(t) / FD_local(t)
+
+        - FD_local: fator de desconto da curva local (pré/CDI, base 252);
+        - FD_externo: taxa externa (ex.: SOFR) capitalizada por dia
+          corrido, convenção ACT/360.
+
+        Calculado uma vez, dia a dia, por 'anos' a partir da data-base;
+        depois disso vale o último valor.
+        """
+        base = np.datetime64(curva_local.data_base.date(), "D")
+        datas = base + np.arange(int(anos * 365.25) + 1)
+        dias_corridos = np.arange(datas.size)
+
+        fd_externo = (1 + taxa_externa / 360) ** -dias_corridos
+        termo = spot * fd_externo / curva_local.fator_desconto(datas)
+        return cls(moeda, datas, termo)
+
+    def valores(self, datas) -> np.ndarray:
+        """Câmbio em cada data (vetorizado)."""
+        datas = para_dias(datas)
+        if self.linear:
+            return np.interp(
+                datas.astype(np.int64),
+                self.datas.astype(np.int64),
+                self.cotacoes,
+            )
+        posicao = np.searchsorted(self.datas, datas, side="right") - 1
+        return self.cotacoes[np.clip(posicao, 0, None)]
+
+
+def carregar_cambios(arquivo) -> dict[str, CurvaCambio]:
+    """
+    Carrega curva de câmbio a termo de arquivo local (CSV/Excel).
+
+    Colunas esperadas:
+    - 'Moeda' (USD, EUR, ...);
+    - 'Data' (vencimento);
+    - 'Cambio' em R$ por unidade da moeda.
+
+    Entre datas o câmbio é interpolado linearmente.
+    """
+    df = ler_tabela_local(arquivo)
+
+    faltando = [c for c in ("Moeda", "Data", "Cambio") if c not in df.columns]
+    if faltando:
+        raise ValueError(f"Arquivo de câmbio sem colunas obrigatórias: {faltando}")
+
+    df = df.assign(
+        Moeda=df["Moeda"].astype(str).str.strip().str.upper(),
+        Data=para_data(df["Data"]),
+        Cambio=para_numero(df["Cambio"]),
+    )
+    df = df[df["Data"].notna() & df["Cambio"].notna()]
+
+    return {
+        moeda: CurvaCambio(moeda, grupo["Data"], grupo["Cambio"], linear=True)
+        for moeda, grupo in df.groupby("Moeda")
+    }
@@ -0,0 +1,459 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import asdict
+
+import pandas as pd
+
+from cenarios import CENARIOS_PADRAO, CenarioMercado
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao
+from mercado import FotoMercado
+from modelo_divida import (
+    _agregar_lote,
+    _consolidar,
+    _preparar_rodada,
+    _resultado_vazio,
+    _simular_lote,
+    _somar,
+)
+
+
+# Pastas da fila dentro do diretório compartilhado
+PENDENTES = "pendentes"
+RODANDO = "rodando"
+CONCLUIDAS = "concluidas"
+FALHAS = "falhas"
+LOTES = "lotes"
+RESULTADOS = "resultados"
+FLUXOS = "fluxos"
+PASTAS = (PENDENTES, RODANDO, CONCLUIDAS, FALHAS, LOTES, RESULTADOS, FLUXOS)
+
+ARQUIVO_RODADA = "rodada.json"
+ARQUIVO_CONTEXTO = "contexto.pkl"
+
+MAX_TENTATIVAS = 3
+# Tarefa em 'rodando' sem sinal de vida há mais que isso volta para a fila
+PRAZO_LEASE_S = 120.0
+INTERVALO_BATIMENTO_S = 10.0
+
+
+# ===============================
+# 🔹 Arquivos (gravação atômica)
+# ===============================
+
+def _gravar_atomico(caminho: str, conteudo: bytes) -> None:
+    """Grava em temporário e troca: quem lê nunca vê arquivo pela metade."""
+    temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def _gravar_json(caminho: str, dados: dict) -> None:
+    _gravar_atomico(caminho, json.dumps(dados, ensure_ascii=False, indent=1, default=str).encode("utf-8"))
+
+
+def _ler_json(caminho: str) -> dict:
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _pasta(diretorio: str, nome: str) -> str:
+    return os.path.join(diretorio, nome)
+
+
+def _tarefas_em(diretorio: str, pasta: str) -> list[str]:
+    """Ids das tarefas numa pasta da fila (arquivos .json), em ordem."""
+    try:
+        nomes = os.listdir(_pasta(diretorio, pasta))
+    except FileNotFoundError:
+        return []
+    return sorted(n[:-5] for n in nomes if n.endswith(".json"))
+
+
+def _mover(diretorio: str, id_tarefa: str, origem: str, destino: str) -> bool:
+    """
+    Move a tarefa de uma pasta para outra com rename atômico. Só um
+    processo consegue: False se a tarefa já não estava em 'origem'.
+    """
+    try:
+        os.rename(
+            os.path.join(diretorio, origem, f"{id_tarefa}.json"),
+            os.path.join(diretorio, destino, f"{id_tarefa}.json"),
+        )
+        return True
+    except FileNotFoundError:
+        return False
+
+
+# ===============================
+# 🔹 Coordenador: montar a fila
+# ===============================
+
+def preparar_rodada_distribuida(
+    diretorio: str,
+    contratos: pd.DataFrame,
+    cenarios: list[CenarioMercado] | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    historico=None,
+    sensibilidades: bool = True,
+    cambio_paridade: bool = False,
+    mercado: FotoMercado | None = None,
+    tamanho_lote: int = 500,
+    guardar_fluxo: bool = False,
+) -> list[str]:
+    """
+    Monta no 'diretorio' compartilhado (ex.: pasta de rede vista por
+    todos os nós) uma rodada dividida em tarefas lote × cenário:
+
+    - a planilha é validada inteira e o que não depende de lote (foto do
+      mercado, curva, projeções, câmbios) é lido uma vez e gravado em
+      'contexto.pkl': todos os nós usam exatamente as mesmas entradas;
+    - os contratos são gravados em lotes de 'tamanho_lote' ('lotes/');
+    - cada par (lote, cenário) vira um arquivo em 'pendentes/'.
+
+    Trabalhadores (trabalhar, em qualquer nó) pegam as tarefas; depois,
+    consolidar_rodada_distribuida junta os agregados parciais.
+    Retorna os ids das tarefas.
+    """
+    if cenarios is None:
+        cenarios = CENARIOS_PADRAO
+    nomes = [c.nome for c in cenarios]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError(f"Nomes de cenário repetidos: {nomes}")
+    if os.path.exists(os.path.join(diretorio, ARQUIVO_RODADA)):
+        raise ValueError(f"Já existe uma rodada em {diretorio}; use outro diretório.")
+
+    df, curva, projecoes, cambios, mercado = _preparar_rodada(
+        contratos, curva, projecoes, cambios, historico, cambio_paridade, mercado
+    )
+
+    for pasta in PASTAS:
+        os.makedirs(_pasta(diretorio, pasta), exist_ok=True)
+
+    contexto = {"curva": curva, "projecoes": projecoes, "cambios": cambios, "mercado": mercado}
+    _gravar_atomico(os.path.join(diretorio, ARQUIVO_CONTEXTO), pickle.dumps(contexto))
+
+    lotes = []
+    for i, inicio in enumerate(range(0, len(df), tamanho_lote)):
+        nome = f"lote_{i:05d}"
+        _gravar_atomico(os.path.join(diretorio, LOTES, f"{nome}.pkl"), pickle.dumps(df.iloc[inicio : inicio + tamanho_lote]))
+        lotes.append(nome)
+
+    tarefas = []
+    for cenario in cenarios:
+        for lote in lotes:
+            id_tarefa = f"{lote}__{len(tarefas):06d}"
+            _gravar_json(
+                os.path.join(diretorio, PENDENTES, f"{id_tarefa}.json"),
+                {"id": id_tarefa, "lote": lote, "cenario": cenario.nome, "tentativas": 0, "erros": []},
+            )
+            tarefas.append(id_tarefa)
+
+    # Gravado por último: com ele presente, a rodada está completa
+    _gravar_json(
+        os.path.join(diretorio, ARQUIVO_RODADA),
+        {
+            "cenarios": [asdict(c) for c in cenarios],
+            "lotes": lotes,
+            "tarefas": tarefas,
+            "sensibilidades": sensibilidades,
+            "guardar_fluxo": guardar_fluxo,
+            "n_contratos": len(df),
+            "criada_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+    )
+    return tarefas
+
+
+# ===============================
+# 🔹 Trabalhador
+# ===============================
+
+def _executar_tarefa(diretorio: str, tarefa: dict, rodada: dict, contexto: dict) -> None:
+    """Roda um lote num cenário (mesma lógica de rodar_modelo) e grava o parcial."""
+    cenario = next(CenarioMercado(**c) for c in rodada["cenarios"] if c["nome"] == tarefa["cenario"])
+    with open(os.path.join(diretorio, LOTES, f"{tarefa['lote']}.pkl"), "rb") as f:
+        lote = pickle.load(f)
+
+    curva = contexto["curva"]
+    resumo, fluxo = _simular_lote(
+        lote,
+        cenario,
+        curva,
+        contexto["projecoes"],
+        contexto["cambios"],
+        contexto["mercado"],
+        rodada["sensibilidades"],
+    )
+    anual, mensal, pico, risco = _agregar_lote(resumo, fluxo, curva.data_base)
+
+    if rodada["guardar_fluxo"]:
+        caminho = os.path.join(diretorio, FLUXOS, f"{tarefa['id']}.csv")
+        temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        fluxo.to_csv(temporario, index=False)
+        os.replace(temporario, caminho)
+
+    parcial = {"resumo": resumo, "anual": anual, "mensal": mensal, "pico": pico, "risco": risco}
+    _gravar_atomico(os.path.join(diretorio, RESULTADOS, f"{tarefa['id']}.pkl"), pickle.dumps(parcial))
+
+
+def _batimento(caminho: str, parar: threading.Event) -> None:
+    """Renova o lease da tarefa (mtime do arquivo em 'rodando/') enquanto ela roda."""
+    while not parar.wait(INTERVALO_BATIMENTO_S):
+        try:
+            os.utime(caminho)
+        except FileNotFoundError:
+            return
+
+
+def reenfileirar_expiradas(diretorio: str, prazo_lease: float = PRAZO_LEASE_S) -> list[str]:
+    """
+    Devolve a 'pendentes/' as tarefas em 'rodando/' sem batimento há mais
+    de 'prazo_lease' segundos (nó que caiu ou processo morto).
+    """
+    agora = time.time()
+    devolvidas = []
+    for id_tarefa in _tarefas_em(diretorio, RODANDO):
+        try:
+            parada = agora - os.path.getmtime(os.path.join(diretorio, RODANDO, f"{id_tarefa}.json"))
+        except FileNotFoundError:
+            continue
+        if parada > prazo_lease and _mover(diretorio, id_tarefa, RODANDO, PENDENTES):
+            devolvidas.append(id_tarefa)
+    return devolvidas
+
+
+def trabalhar(
+    diretorio: str,
+    id_trabalhador: str | None = None,
+    continuo: bool = False,
+    espera: float = 1.0,
+    max_tentativas: int = MAX_TENTATIVAS,
+    prazo_lease: float = PRAZO_LEASE_S,
+) -> int:
+    """
+    Laço de um trabalhador (rodar em quantos processos/nós quiser):
+    pega uma tarefa de 'pendentes/' por rename atômico para 'rodando/',
+    roda e grava o parcial em 'resultados/' e move a tarefa para
+    'concluidas/'. Com erro, a tarefa volta à fila até 'max_tentativas'
+    e depois vai para 'falhas/' com o traceback.
+
+    Idempotente: o parcial tem nome fixo por tarefa e é gravado de forma
+    atômica; se já existir quando a tarefa é pega (ex.: execução repetida
+    após lease expirado), ela só é marcada como concluída.
+
+    Sem 'continuo', para quando não há pendentes nem tarefas em
+    andamento. Retorna quantas tarefas este trabalhador concluiu.
+    """
+    id_trabalhador = id_trabalhador or f"{socket.gethostname()}-{os.getpid()}"
+    while not os.path.exists(os.path.join(diretorio, ARQUIVO_RODADA)):
+        if not continuo:
+            return 0
+        time.sleep(espera)
+
+    rodada = _ler_json(os.path.join(diretorio, ARQUIVO_RODADA))
+    with open(os.path.join(diretorio, ARQUIVO_CONTEXTO), "rb") as f:
+        contexto = pickle.load(f)
+
+    concluidas = 0
+    while True:
+        reenfileirar_expiradas(diretorio, prazo_lease)
+
+        pegou = None
+        for id_tarefa in _tarefas_em(diretorio, PENDENTES):
+            if _mover(diretorio, id_tarefa, PENDENTES, RODANDO):
+                pegou = id_tarefa
+                break
+
+        if pegou is None:
+            if not continuo and not _tarefas_em(diretorio, RODANDO):
+                return concluidas
+            time.sleep(espera)
+            continue
+
+        caminho = os.path.join(diretorio, RODANDO, f"{pegou}.json")
+        os.utime(caminho)
+        tarefa = _ler_json(caminho)
+
+        if os.path.exists(os.path.join(diretorio, RESULTADOS, f"{pegou}.pkl")):
+            _mover(diretorio, pegou, RODANDO, CONCLUIDAS)
+            continue
+
+        parar = threading.Event()
+        batimento = threading.Thread(target=_batimento, args=(caminho, parar), daemon=True)
+        batimento.start()
+        try:
+            _executar_tarefa(diretorio, tarefa, rodada, contexto)
+        except Exception as e:
+            tarefa["tentativas"] += 1
+            tarefa["erros"].append(
+                {"trabalhador": id_trabalhador, "erro": str(e), "detalhe": traceback.format_exc()}
+            )
+            if os.path.exists(caminho):
+                _gravar_json(caminho, tarefa)
+                _mover(diretorio, pegou, RODANDO, FALHAS if tarefa["tentativas"] >= max_tentativas else PENDENTES)
+            continue
+        finally:
+            parar.set()
+            batimento.join()
+
+        # Se o lease expirou no meio, a tarefa pode ter voltado à fila:
+        # o parcial já está gravado e quem pegá-la só a marca concluída
+        _mover(diretorio, pegou, RODANDO, CONCLUIDAS)
+        concluidas += 1
+
+
+def reenfileirar_falhas(diretorio: str) -> list[str]:
+    """Devolve à fila as tarefas em 'falhas/' (zerando as tentativas)."""
+    devolvidas = []
+    for id_tarefa in _tarefas_em(diretorio, FALHAS):
+        caminho = os.path.join(diretorio, FALHAS, f"{id_tarefa}.json")
+        tarefa = _ler_json(caminho)
+        tarefa["tentativas"] = 0
+        _gravar_json(caminho, tarefa)
+        if _mover(diretorio, id_tarefa, FALHAS, PENDENTES):
+            devolvidas.append(id_tarefa)
+    return devolvidas
+
+
+# ===============================
+# 🔹 Coordenador: acompanhar e consolidar
+# ===============================
+
+def situacao_rodada(diretorio: str) -> dict[str, int]:
+    """Quantas tarefas há em cada pasta da fila (e quantos parciais gravados)."""
+    situacao = {pasta: len(_tarefas_em(diretorio, pasta)) for pasta in (PENDENTES, RODANDO, CONCLUIDAS, FALHAS)}
+    rodada = _ler_json(os.path.join(diretorio, ARQUIVO_RODADA))
+    situacao["total"] = len(rodada["tarefas"])
+    return situacao
+
+
+def consolidar_rodada_distribuida(
+    diretorio: str,
+    esperar: bool = True,
+    espera: float = 2.0,
+    prazo_lease: float = PRAZO_LEASE_S,
+    timeout: float | None = None,
+) -> dict[str, tuple]:
+    """
+    Junta os parciais de todas as tarefas, como rodar_modelo_streaming:
+    resumos concatenados na ordem dos lotes, pagamentos por ano/data e
+    somas de risco adicionados, picos por contrato empilhados.
+
+    Com 'esperar', aguarda até todas as tarefas terem parcial (devolvendo
+    à fila as de nós que caíram). Tarefas em 'falhas/' levantam
+    ValueError com o último erro de cada uma (ver reenfileirar_falhas).
+
+    Retorna {cenário: (resumo, arquivos_fluxo, carteira, fluxo_anual,
+    fluxo_mensal, ranking)}, como rodar_modelo_streaming.
+    """
+    rodada = _ler_json(os.path.join(diretorio, ARQUIVO_RODADA))
+    inicio = time.time()
+
+    while True:
+        falhas = _tarefas_em(diretorio, FALHAS)
+        if falhas:
+            erros = [
+                f"{t}: {(_ler_json(os.path.join(diretorio, FALHAS, f'{t}.json'))['erros'] or [{}])[-1].get('erro')}"
+                for t in falhas[:5]
+            ]
+            raise ValueError(f"{len(falhas)} tarefa(s) esgotaram as tentativas. " + "; ".join(erros))
+
+        faltando = [t for t in rodada["tarefas"] if not os.path.exists(os.path.join(diretorio, RESULTADOS, f"{t}.pkl"))]
+        if not faltando:
+            break
+        if not esperar:
+            raise ValueError(f"Rodada incompleta: faltam {len(faltando)} de {len(rodada['tarefas'])} tarefas.")
+        if timeout is not None and time.time() - inicio > timeout:
+            raise TimeoutError(f"Rodada incompleta após {timeout:.0f} s: faltam {len(faltando)} tarefas.")
+        reenfileirar_expiradas(diretorio, prazo_lease)
+        time.sleep(espera)
+
+    # Cada tarefa entra uma única vez (pelo id), mesmo que tenha rodado mais de uma
+    por_cenario = {c["nome"]: [] for c in rodada["cenarios"]}
+    for id_tarefa in rodada["tarefas"]:
+        tarefa = _ler_json(_caminho_tarefa(diretorio, id_tarefa))
+        por_cenario[tarefa["cenario"]].append(id_tarefa)
+
+    saidas = {}
+    for nome, tarefas in por_cenario.items():
+        resumos, picos = [], []
+        anual = mensal = risco = None
+        arquivos_fluxo = []
+        for id_tarefa in tarefas:
+            with open(os.path.join(diretorio, RESULTADOS, f"{id_tarefa}.pkl"), "rb") as f:
+                parcial = pickle.load(f)
+            resumos.append(parcial["resumo"])
+            picos.append(parcial["pico"])
+            anual = _somar(anual, parcial["anual"])
+            mensal = _somar(mensal, parcial["mensal"])
+            risco = _somar(risco, parcial["risco"])
+            if rodada["guardar_fluxo"]:
+                arquivos_fluxo.append(os.path.join(diretorio, FLUXOS, f"{id_tarefa}.csv"))
+
+        if not resumos:
+            resumo, _, carteira, fluxo_anual, fluxo_mensal, ranking = _resultado_vazio()
+            saidas[nome] = (resumo, arquivos_fluxo, carteira, fluxo_anual, fluxo_mensal, ranking)
+            continue
+
+        resumo = pd.concat(resumos, ignore_index=True)
+        carteira, fluxo_anual, fluxo_mensal, ranking = _consolidar(
+            resumo, anual, mensal, pd.concat(picos, ignore_index=True), risco
+        )
+        saidas[nome] = (resumo, arquivos_fluxo, carteira, fluxo_anual, fluxo_mensal, ranking)
+    return saidas
+
+
+def _caminho_tarefa(diretorio: str, id_tarefa: str) -> str:
+    """Arquivo da tarefa, em qualquer pasta da fila em que esteja."""
+    for pasta in (CONCLUIDAS, RODANDO, PENDENTES, FALHAS):
+        caminho = os.path.join(diretorio, pasta, f"{id_tarefa}.json")
+        if os.path.exists(caminho):
+            return caminho
+    raise ValueError(f"Tarefa {id_tarefa} não encontrada em {diretorio}.")
+
+
+# ===============================
+# 🔹 Vários trabalhadores numa máquina
+# ===============================
+
+def rodar_distribuido_local(diretorio: str, contratos: pd.DataFrame, n_trabalhadores: int = 2, **opcoes) -> dict[str, tuple]:
+    """
+    Rodada distribuída numa só máquina: prepara a fila em 'diretorio',
+    sobe 'n_trabalhadores' processos (como subiriam em vários nós) e
+    consolida. 'opcoes' vão para preparar_rodada_distribuida.
+    """
+    preparar_rodada_distribuida(diretorio, contratos, **opcoes)
+
+    processos = [
+        multiprocessing.Process(target=trabalhar, args=(diretorio, f"local-{i}"))
+        for i in range(n_trabalhadores)
+    ]
+    for processo in processos:
+        processo.start()
+    try:
+        return consolidar_rodada_distribuida(diretorio)
+    finally:
+        for processo in processos:
+            processo.join()
+
+
+if __name__ == "__main__":
+    # Em cada nó: python distribuido.py <diretório compartilhado> [--continuo]
+    parser = argparse.ArgumentParser(description="Trabalhador da rodada distribuída.")
+    parser.add_argument("diretorio")
+    parser.add_argument("--continuo", action="store_true", help="esperar novas tarefas em vez de sair com a fila vazia")
+    parser.add_argument("--id", default=None, help="identificação do trabalhador (padrão: host-pid)")
+    argumentos = parser.parse_args()
+    n = trabalhar(argumentos.diretorio, argumentos.id, continuo=argumentos.continuo)
+    print(f"{n} tarefa(s) concluída(s).")
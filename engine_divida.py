@@ -1,10 +1,14 @@
+from dataclasses import dataclass, replace
+
 import pandas as pd
 import numpy as np
 import numpy_financial as npf
 
-from mercado import pegar_cdi, pegar_ipca, pegar_cambio, pegar_selic, pegar_sofr
+from mercado import FotoMercado, pegar_cdi, pegar_ipca, pegar_cambio, pegar_selic, pegar_sofr
 from cenarios import CenarioMercado
-from feriados_anbima import get_feriados_intervalo
+from calendarios import calendario_contrato
+from contagem_dias import BASE_PADRAO, dias_base, denominador_base, normalizar_base
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao, contar_dias_uteis
 
 # =========================
 # 🔹 Conversões de taxa
@@ -44,18 +48,14 @@ def fator_periodo_dias_uteis(taxa_dia_util: float, data_inicio, data_fim, feriad
 
     Retorna (taxa_periodo, dias_corridos, dias_uteis).
     """
-    if feriados is None:
-        feriados = []
-
-    dias = pd.date_range(start=data_inicio, end=data_fim, freq="D")[:-1]
-    dias_corridos = len(dias)
-    dias_uteis_lista = dias[dias.weekday < 5]
-
-    if feriados:
-        feriados_set = set(feriados)
-        dias_uteis_lista = [d for d in dias_uteis_lista if d.date() not in feriados_set]
+    inicio = np.datetime64(pd.Timestamp(data_inicio).date(), "D")
+    fim = np.datetime64(pd.Timestamp(data_fim).date(), "D")
+    if fim <= inicio:
+        return 0.0, 0, 0
 
-    dias_uteis = len(dias_uteis_lista)
+    feriados = np.array([np.datetime64(pd.Timestamp(d).date(), "D") for d in (feriados or [])], dtype="datetime64[D]")
+    dias_corridos = int((fim - inicio).astype(np.int64))
+    dias_uteis = int(np.busday_count(inicio, fim, holidays=feriados))
 
     if dias_uteis <= 0:
         return 0.0, dias_corridos, dias_uteis
@@ -83,37 +83,45 @@ def gerar_datas_semestrais_convecao_anbima(ano_inicial: int, prazo: int) -> pd.D
     Gera 'prazo' datas semestrais:
     15/05 e 15/11 a partir do ano_inicial.
     """
-    ano = ano_inicial
-    datas = []
-    while len(datas) < prazo:
-        datas.append(pd.Timestamp(year=ano, month=5, day=15))
-        if len(datas) >= prazo:
-            break
-        datas.append(pd.Timestamp(year=ano, month=11, day=15))
-        ano += 1
-    return pd.to_datetime(datas[:prazo])
+    k = np.arange(prazo)
+    meses = np.datetime64(f"{ano_inicial}-05", "M") + 12 * (k // 2) + 6 * (k % 2)
+    return pd.DatetimeIndex((meses.astype("datetime64[D]") + 14).astype("datetime64[us]"))
 
 
 # =========================
 # 🔹 Motor de Indexadores
 # =========================
 
-def taxa_indexador(row, cenario: CenarioMercado) -> float:
+def choque_indexador(indexador: str, cenario: CenarioMercado) -> float:
     """
-    Retorna taxa efetiva anual do indexador de referência,
+    Choque paralelo do cenário (em base 1.0) aplicado ao indexador.
+    SELIC acompanha o choque de CDI.
+    """
+    indexador = str(indexador).upper()
+
+    if indexador in ("CDI", "SELIC"):
+        return cenario.choque_cdi_bps / 10000.0
+    if indexador == "IPCA":
+        return cenario.choque_ipca_bps / 10000.0
+    return 0.0
+
+
+def taxa_indexador_anual(indexador: str, cenario: CenarioMercado, mercado: FotoMercado | None = None) -> float:
+    """
+    Retorna taxa efetiva anual atual do indexador,
     já incluindo choques de cenário (em bps).
+    Com 'mercado', usa a foto já lida em vez de consultar as fontes.
     """
-    indexador = str(row["Indexador"]).upper()
+    indexador = str(indexador).upper()
 
-    if indexador == "CDI":
+    if mercado is not None:
+        base = mercado.taxa(indexador)
+    elif indexador == "CDI":
         base = pegar_cdi()
-        base += cenario.choque_cdi_bps / 10000.0
     elif indexador == "IPCA":
         base = pegar_ipca()
-        base += cenario.choque_ipca_bps / 10000.0
     elif indexador == "SELIC":
         base = pegar_selic()
-        base += cenario.choque_cdi_bps / 10000.0
     elif indexador == "SOFR":
         base = pegar_sofr()
     elif indexador == "VARIAÇÃO CAMBIAL":
@@ -121,7 +129,15 @@ def taxa_indexador(row, cenario: CenarioMercado) -> float:
     else:
         base = 0.0
 
-    return base
+    return base + choque_indexador(indexador, cenario)
+
+
+def taxa_indexador(row, cenario: CenarioMercado) -> float:
+    """
+    Retorna taxa efetiva anual do indexador de referência,
+    já incluindo choques de cenário (em bps).
+    """
+    return taxa_indexador_anual(row["Indexador"], cenario)
 
 
 # =========================
@@ -168,336 +184,705 @@ def calcular_vpl(fluxo_fin, taxa_desconto_anual: float, periodicidade_meses: int
     return float(npf.npv(taxa_periodo, fluxo_fin))
 
 
+
+
 # =========================
-# 🔹 Simulação do contrato – Modo mensal (Periodicidade != 6)
+# 🔹 Cronograma do contrato (independe de taxas)
 # =========================
 
-def simular_contrato(row, cenario: CenarioMercado):
-    """
-    Simula o fluxo de um contrato de dívida.
+SISTEMA_OUTRO = 0
+SISTEMA_SAC = 1
+SISTEMA_PRICE = 2
 
-    Convenções:
-    - Se Periodicidade = 1 → períodos mensais (juros pró‑rata dia útil ANBIMA),
-      iniciando na Data_liberacao e pagando no mesmo dia de Data_liberacao + k meses.
-    - Se Periodicidade = 6 → encaminha para simulação semestral.
-    """
 
-    valor = float(row["Valor_Contratado"])
-    prazo = int(row["Prazo"])
-    carencia = int(row["Carencia"])
-    periodicidade = int(row["Periodicidade"])
-    sistema = str(row["Sistema_Amortização"]).upper()
-    moeda = str(row["Moeda"]).upper()
+def codigo_sistema(sistema: str) -> int:
+    """Código numérico do sistema de amortização (usado nos cálculos em lote)."""
+    sistema = str(sistema).upper()
+    if sistema == "SAC":
+        return SISTEMA_SAC
+    if sistema == "PRICE":
+        return SISTEMA_PRICE
+    return SISTEMA_OUTRO
 
-    # Desvio: modo semestral
-    if periodicidade == 6:
-        return simular_contrato_semestral(row, cenario)
 
-    # Modo padrão (mensal)
-    spread = float(row["Spread"] or 0.0)
-    fator = float(row["Fator_indexador"] or 1.0)
+@dataclass
+class Cronograma:
+    """
+    Parte do contrato que não depende de taxas: termos, datas de pagamento
+    e contagem de dias de cada período [inicio, data).
+    Montado uma vez por contrato e reaproveitado em qualquer cenário.
+    """
+    id: object
+    valor: float
+    prazo: int
+    carencia: int
+    periodicidade: int
+    sistema: str
+    moeda: str
+    indexador: str
+    spread: float
+    fator: float
+    data_liberacao: pd.Timestamp
+    datas: pd.DatetimeIndex
+    inicios: pd.DatetimeIndex
+    dias_corridos: np.ndarray
+    dias_uteis: np.ndarray
+    dias_uteis_entre_pagamentos: float
+    calendario: str = "ANBIMA"
+    base_calculo: str = BASE_PADRAO
+    dias_acumulacao: np.ndarray | None = None
+
+    def __post_init__(self):
+        # 252 × fração de ano de cada período; em DU/252 são os próprios
+        # dias úteis (expoente das taxas diárias)
+        if self.dias_acumulacao is None:
+            self.dias_acumulacao = self.dias_uteis
+
+
+def gerar_datas_pagamento(data_liber, data_contrat, prazo: int, periodicidade: int, moeda: str) -> pd.DatetimeIndex:
+    """
+    Datas de pagamento do contrato:
+    - Periodicidade = 6 e moeda estrangeira → convenção 15/05 e 15/11;
+    - Periodicidade = 6 em BRL → semestres a partir da Data_liberacao;
+    - demais → meses a partir da Data_liberacao, no mesmo dia.
+    """
+    if periodicidade == 6 and moeda != "BRL":
+        return gerar_datas_semestrais_convecao_anbima(data_contrat.year, prazo)
 
-    # CDI (ou outro indexador) em base anual
-    taxa_base = taxa_indexador(row, cenario)  # ex.: CDI
-    taxa_cdi_anual = taxa_base * fator  # componente indexador
-    taxa_spread_anual = spread + (cenario.choque_spread_bps / 10000.0)
+    meses = 6 if periodicidade == 6 else 1
+    mes_liberacao = np.datetime64(data_liber.date(), "M")
+    datas = _mesmo_dia_nos_meses(mes_liberacao + meses * np.arange(1, prazo + 1), data_liber.day)
+    return pd.DatetimeIndex(datas.astype("datetime64[us]"))
 
-    # Diarização separada, como na planilha:
-    # =((1+CDI)^(1/252))*((1+spread)^(1/252))-1
-    taxa_cdi_dia = (1 + taxa_cdi_anual) ** (1 / 252) - 1
-    taxa_spread_dia = (1 + taxa_spread_anual) ** (1 / 252) - 1
-    taxa_dia_util = (1 + taxa_cdi_dia) * (1 + taxa_spread_dia) - 1
 
-    # Taxa anual equivalente apenas para exibição na auditoria
-    taxa_anual = (1 + taxa_dia_util) ** 252 - 1
+def _mesmo_dia_nos_meses(meses: np.ndarray, dia: int) -> np.ndarray:
+    """Dia 'dia' de cada mês (datetime64[M]), limitado ao último dia do mês."""
+    inicio_mes = meses.astype("datetime64[D]")
+    ultimo_dia_mes = ((meses + 1).astype("datetime64[D]") - inicio_mes).astype(np.int64)
+    return inicio_mes + (np.minimum(dia, ultimo_dia_mes) - 1)
 
-    cambio = pegar_cambio(moeda) if moeda != "BRL" else 1.0
-    if cenario.choque_cambio_pct != 0.0 and moeda != "BRL":
-        cambio *= (1 + cenario.choque_cambio_pct)
 
-    saldo = valor
-    pagamentos = []
+def montar_cronograma(row) -> Cronograma:
+    """
+    Monta o cronograma de um contrato (linha da planilha).
+    Dias úteis contados, de forma vetorizada, no calendário do contrato:
+    coluna opcional 'Calendario' (ex.: "US+ANBIMA") ou, sem ela, o da
+    praça do indexador/moeda (ver calendarios.calendario_contrato).
+
+    Coluna opcional 'Base_Calculo' (DU/252, ACT/360, ACT/365, 30/360;
+    padrão DU/252). Em DU/252 as taxas são capitalizadas por dia útil; nas
+    demais, os juros do período são simples pela fração de ano da
+    convenção (ver taxas_periodo). Internamente, a fração vira
+    'dias_acumulacao' = 252 × fração.
+    """
+    prazo = int(row["Prazo"])
+    periodicidade = int(row["Periodicidade"])
+    moeda = str(row["Moeda"]).upper()
+    calendario = calendario_contrato(moeda, row["Indexador"], row.get("Calendario"))
+    base_calculo = normalizar_base(row.get("Base_Calculo"))
 
-    # =========================
-    # Datas: liberação (início dos juros) e pagamentos mensais
-    # =========================
     data_contrat = pd.to_datetime(row["Data_contratação"])
     data_liber = pd.to_datetime(row["Data_liberacao"])
 
-    # Regra nova: pagamentos mensais a partir da Data_liberacao
-    dia_pag = data_liber.day
-    datas = []
-    for k in range(1, prazo + 1):
-        d = data_liber + pd.DateOffset(months=k)
-        ultimo_dia_mes = (d + pd.offsets.MonthEnd(0)).day
-        d = d.replace(day=min(dia_pag, ultimo_dia_mes))
-        datas.append(d)
-    datas = pd.to_datetime(datas)
-
-    # Feriados ANBIMA no intervalo do contrato
-    data_inicio = data_liber.date()
-    data_fim = datas[-1].date()
-    feriados = get_feriados_intervalo(data_inicio, data_fim)
-    feriados_set = set(feriados)
-
-    # Estimar número médio de dias úteis entre pagamentos (para TIR anual)
-    datas_exemplo = pd.date_range(start=datas[0], periods=2, freq="ME")
-    datas_exemplo = datas_exemplo.map(lambda d: d.replace(day=dia_pag))
-    dias_exemplo = pd.date_range(
-        start=datas_exemplo[0],
-        end=datas_exemplo[1],
-        freq="D",
-    )[:-1]
-    dias_uteis_exemplo = [
-        d for d in dias_exemplo
-        if d.weekday() < 5 and d.date() not in feriados_set
-    ]
-    dias_uteis_entre_pagamentos = len(dias_uteis_exemplo)
-
-    # PRICE: prestação aproximada com base na taxa por período média
-    pmt = None
-    if sistema == "PRICE" and prazo > carencia:
-        taxa_periodo_aprox = (1 + taxa_dia_util) ** dias_uteis_entre_pagamentos - 1
-        pmt = float(npf.pmt(taxa_periodo_aprox, prazo - carencia, -valor))
-    elif sistema == "PRICE" and prazo <= carencia:
-        pmt = None
-
-    # Primeiro período: da Data_liberacao até o primeiro pagamento
-    data_anterior = data_liber
-
-    for i in range(prazo):
-        data_atual = datas[i]
-
-        # Taxa efetiva do período com base em dias úteis ANBIMA
-        taxa_periodo_efetiva, dias_corridos, dias_uteis = fator_periodo_dias_uteis(
-            taxa_dia_util,
-            data_anterior,
-            data_atual,
-            feriados=feriados,
-        )
+    datas = gerar_datas_pagamento(data_liber, data_contrat, prazo, periodicidade, moeda)
+    inicios = pd.DatetimeIndex([data_liber]).append(datas[:-1])
 
-        juros = saldo * taxa_periodo_efetiva
+    dias_corridos = np.maximum((datas - inicios).days.to_numpy(), 0)
+    dias_uteis = np.maximum(contar_dias_uteis(inicios, datas, calendario), 0)
 
-        if i < carencia:
-            amort = 0.0
-            pagamento = juros
-        else:
-            if sistema == "SAC":
-                n_amort = max(prazo - carencia, 1)
-                amort = valor / n_amort
-                pagamento = amort + juros
-            elif sistema == "PRICE" and pmt is not None:
-                amort = pmt - juros
-                pagamento = pmt
-            else:
-                amort = 0.0
-                pagamento = juros
-
-        saldo -= amort
-        saldo = max(saldo, 0.0)
-
-        pagamento_brl = pagamento * cambio
-
-        pagamentos.append(
-            {
-                "ID": row["Id"],
-                "Data": data_atual,
-                "Ano": data_atual.year,
-                "Pagamento": pagamento_brl,
-                "Amortização": amort * cambio,
-                "Juros": juros * cambio,
-                "Saldo_Devedor": saldo * cambio,
-                "Dias_corridos": dias_corridos,
-                "Dias_uteis_252": dias_uteis,
-                "Taxa_Dia_Util": taxa_dia_util * 100,
-                "Taxa_Anual": taxa_anual * 100,
-                "Indexador": row["Indexador"],
-                "Spread": spread * 100,
-            }
+    # Número médio de dias úteis entre dois pagamentos (para PRICE e TIR anual)
+    if periodicidade == 6 and moeda != "BRL":
+        datas_exemplo = gerar_datas_semestrais_convecao_anbima(data_contrat.year, 2)
+    elif periodicidade == 6:
+        datas_exemplo = datas[:2] if len(datas) >= 2 else pd.DatetimeIndex([data_liber, datas[0]])
+    else:
+        datas_exemplo = _mesmo_dia_nos_meses(
+            np.datetime64(datas[0].date(), "M") + np.arange(2), data_liber.day
+        )
+    dias_uteis_entre_pagamentos = int(contar_dias_uteis(datas_exemplo[0], datas_exemplo[1], calendario)[0])
+
+    dias_acumulacao = None
+    if base_calculo != BASE_PADRAO:
+        escala = 252 / denominador_base(base_calculo)
+        dias_acumulacao = np.maximum(dias_base(inicios, datas, base_calculo), 0) * escala
+        dias_uteis_entre_pagamentos = float(
+            dias_base(datas_exemplo[0], datas_exemplo[1], base_calculo)[0] * escala
         )
 
-        data_anterior = data_atual
+    return Cronograma(
+        id=row["Id"],
+        valor=float(row["Valor_Contratado"]),
+        prazo=prazo,
+        carencia=int(row["Carencia"]),
+        periodicidade=periodicidade,
+        sistema=str(row["Sistema_Amortização"]).upper(),
+        moeda=moeda,
+        indexador=row["Indexador"],
+        spread=float(row["Spread"] or 0.0),
+        fator=float(row["Fator_indexador"] or 1.0),
+        data_liberacao=data_liber,
+        datas=datas,
+        inicios=inicios,
+        dias_corridos=dias_corridos,
+        dias_uteis=dias_uteis,
+        dias_uteis_entre_pagamentos=dias_uteis_entre_pagamentos,
+        calendario=calendario,
+        base_calculo=base_calculo,
+        dias_acumulacao=dias_acumulacao,
+    )
 
-    df = pd.DataFrame(pagamentos)
 
-    fluxo_fin = [-valor * cambio] + df["Pagamento"].tolist()
+# =========================
+# 🔹 Contratos com termos idênticos
+# =========================
 
-    tir = calcular_tir(
-        fluxo_fin,
-        periodicidade_meses=periodicidade,
-        dias_uteis_entre_pagamentos=dias_uteis_entre_pagamentos,
+def assinatura_termos(cron: Cronograma) -> tuple:
+    """
+    Termos que definem o fluxo por unidade de principal: tudo no
+    cronograma, menos Id e valor. Contratos com a mesma assinatura têm
+    fluxos proporcionais ao Valor_Contratado.
+    """
+    return (
+        cron.prazo,
+        cron.carencia,
+        cron.periodicidade,
+        cron.sistema,
+        cron.moeda,
+        cron.indexador,
+        cron.spread,
+        cron.fator,
+        cron.data_liberacao,
+        cron.calendario,
+        cron.base_calculo,
+        cron.datas.asi8.tobytes(),
     )
 
-    # VPL sempre descontado a CDI (taxa anual), mantida lógica por período em meses
-    taxa_cdi_desconto = pegar_cdi()
-    vpl = calcular_vpl(fluxo_fin, taxa_cdi_desconto, periodicidade)
 
-    return df, tir, vpl
+def agrupar_cronogramas(cronogramas: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Agrupa cronogramas por assinatura_termos. Retorna (grupo de cada
+    cronograma, 0..g-1 na ordem de aparição; posição do primeiro de cada grupo).
+    """
+    grupos = {}
+    grupo = np.array(
+        [grupos.setdefault(assinatura_termos(c), len(grupos)) for c in cronogramas],
+        dtype=np.int64,
+    )
+    _, representantes = np.unique(grupo, return_index=True)
+    return grupo, representantes
+
+
+def cronograma_unitario(cron: Cronograma) -> Cronograma:
+    """O mesmo cronograma com principal 1 (fluxo por unidade de valor)."""
+    return replace(cron, valor=1.0)
 
 
 # =========================
-# 🔹 Simulação semestral (Periodicidade = 6)
+# 🔹 Taxas por período
 # =========================
 
-def simular_contrato_semestral(row, cenario: CenarioMercado):
+def spread_anual(spread, cenario: CenarioMercado):
+    """Spread (base 1.0 a.a., vetorizável) + choque de cenário."""
+    return np.asarray(spread) + cenario.choque_spread_bps / 10000.0
+
+
+def taxa_spread_dia_util(spread, cenario: CenarioMercado):
+    """Spread (base 1.0 a.a., vetorizável) + choque de cenário, diarizado base 252."""
+    return (1 + spread_anual(spread, cenario)) ** (1 / 252) - 1
+
+
+def taxa_indexador_dia_util(cron: "Cronograma", cenario: CenarioMercado, mercado: FotoMercado | None = None) -> float:
+    """Taxa diária (base 252) do indexador atual × Fator_indexador, com choque."""
+    taxa_cdi_anual = taxa_indexador_anual(cron.indexador, cenario, mercado) * cron.fator
+    return (1 + taxa_cdi_anual) ** (1 / 252) - 1
+
+
+def taxa_anual_equivalente(log_fatores, dias_uteis):
+    """
+    Taxa anual efetiva (base 252) de fatores acumulados em 'dias_uteis'
+    dias úteis, dados pelo log. Vetorizada; zero onde não há dias.
     """
-    Simula contrato com pagamentos semestrais.
+    log_fatores = np.asarray(log_fatores, dtype=float)
+    dias_uteis = np.asarray(dias_uteis, dtype=float)
+    forma = np.broadcast(log_fatores, dias_uteis).shape
+    return np.expm1(np.divide(log_fatores * 252, dias_uteis, out=np.zeros(forma), where=dias_uteis != 0))
+
+
+def fatores_indexador(
+    cron: "Cronograma",
+    cenario: CenarioMercado,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    mercado: FotoMercado | None = None,
+) -> np.ndarray:
+    """
+    Fator só do indexador (sem spread) em cada período: razão de fatores
+    acumulados da projeção, ou taxa atual constante por dia útil.
+    Fora de DU/252, juros simples: 1 + taxa anual × fração de ano, com a
+    taxa anual equivalente da projeção no período (acumulada em dias
+    úteis ANBIMA) ou a taxa atual.
+    """
+    projecao = (projecoes or {}).get(str(cron.indexador).upper())
+    if projecao is None:
+        if cron.base_calculo == BASE_PADRAO:
+            return (1 + taxa_indexador_dia_util(cron, cenario, mercado)) ** cron.dias_acumulacao
+        taxa_anual = taxa_indexador_anual(cron.indexador, cenario, mercado) * cron.fator
+        return 1 + taxa_anual * cron.dias_acumulacao / 252
+
+    fatores = projecao.fator_periodo(
+        cron.inicios,
+        cron.datas,
+        fator=cron.fator,
+        choque=choque_indexador(cron.indexador, cenario),
+    )
+    if cron.base_calculo == BASE_PADRAO:
+        return fatores
 
-    Convenções:
-    - Periodicidade = 6 → período de 6 meses.
-    - Prazo e Carencia são interpretados como número de períodos (semestrais).
-      Ex.: Prazo = 40 → 40 semestres ~ 20 anos.
-    - Carencia = número de semestres em que se paga só juros.
-    - Sistema SAC: amortização constante semestral após a carência.
-    - Sistema PRICE: prestação fixa semestral após a carência.
-    """
-
-    valor = float(row["Valor_Contratado"])
-    prazo = int(row["Prazo"])  # em semestres
-    carencia = int(row["Carencia"])  # em semestres
-    periodicidade = int(row["Periodicidade"])  # deve ser 6 aqui
-    sistema = str(row["Sistema_Amortização"]).upper()
-    moeda = str(row["Moeda"]).upper()
+    taxa_anual = taxa_anual_equivalente(np.log(fatores), contar_dias_uteis(cron.inicios, cron.datas))
+    return 1 + taxa_anual * cron.dias_acumulacao / 252
 
-    spread = float(row["Spread"] or 0.0)
-    fator = float(row["Fator_indexador"] or 1.0)
 
-    # CDI (ou outro indexador) em base anual
-    taxa_base = taxa_indexador(row, cenario)
-    taxa_cdi_anual = taxa_base * fator
-    taxa_spread_anual = spread + (cenario.choque_spread_bps / 10000.0)
+def taxas_periodo(
+    cron: Cronograma,
+    cenario: CenarioMercado,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    mercado: FotoMercado | None = None,
+):
+    """
+    Fatores (1 + taxa efetiva) de cada período do cronograma.
 
-    # Diarização separada (mesma fórmula da planilha)
-    taxa_cdi_dia = (1 + taxa_cdi_anual) ** (1 / 252) - 1
-    taxa_spread_dia = (1 + taxa_spread_anual) ** (1 / 252) - 1
-    taxa_dia_util = (1 + taxa_cdi_dia) * (1 + taxa_spread_dia) - 1
+    - Sem projeção para o indexador: taxa anual única (mercado + choque),
+      diarizada separadamente do spread, como na planilha:
+      =((1+CDI)^(1/252))*((1+spread)^(1/252))-1
+    - Com projeção: fator do indexador no período é a razão de dois
+      fatores acumulados pré-calculados na curva.
+    - Fora de DU/252 (ACT/360, ACT/365, 30/360): juros simples no período,
+      1 + (taxa anual do indexador + spread) × fração de ano.
 
-    # Taxa anual equivalente só para exibição
-    taxa_anual = (1 + taxa_dia_util) ** 252 - 1
+    Retorna (fatores, taxas_dia_util, taxa_dia_util_media).
+    """
+    taxa_spread_dia = taxa_spread_dia_util(cron.spread, cenario)
 
-    cambio = pegar_cambio(moeda) if moeda != "BRL" else 1.0
-    if cenario.choque_cambio_pct != 0.0 and moeda != "BRL":
-        cambio *= (1 + cenario.choque_cambio_pct)
+    projecao = (projecoes or {}).get(str(cron.indexador).upper())
 
-    saldo = valor
-    pagamentos = []
+    if projecao is None and cron.base_calculo == BASE_PADRAO:
+        taxa_cdi_dia = taxa_indexador_dia_util(cron, cenario, mercado)
+        taxa_dia_util = (1 + taxa_cdi_dia) * (1 + taxa_spread_dia) - 1
 
-    # Datas de pagamento semestrais: regra interna x externa
-    data_contrat = pd.to_datetime(row["Data_contratação"])
-    data_liber = pd.to_datetime(row["Data_liberacao"])
+        fatores = (1 + taxa_dia_util) ** cron.dias_acumulacao
+        return fatores, np.full(cron.prazo, taxa_dia_util), taxa_dia_util
 
-    if moeda == "BRL":
-        # Dívida interna: semestres a partir da Data_liberacao
-        datas = []
-        dia_pag = data_liber.day
-        for k in range(1, prazo + 1):
-            d = data_liber + pd.DateOffset(months=6 * k)
-            ultimo_dia_mes = (d + pd.offsets.MonthEnd(0)).day
-            d = d.replace(day=min(dia_pag, ultimo_dia_mes))
-            datas.append(d)
-        datas = pd.to_datetime(datas)
+    if cron.base_calculo == BASE_PADRAO:
+        fatores = fatores_indexador(cron, cenario, projecoes, mercado) * (1 + taxa_spread_dia) ** cron.dias_acumulacao
     else:
-        # Dívida externa: convenção ANBIMA 15/05 e 15/11
-        ano_inicial = data_contrat.year
-        datas = gerar_datas_semestrais_convecao_anbima(ano_inicial, prazo)
-
-    # Feriados ANBIMA no intervalo
-    data_inicio = min(data_liber.date(), datas[0].date())
-    data_fim = datas[-1].date()
-    feriados = get_feriados_intervalo(data_inicio, data_fim)
-    feriados_set = set(feriados)
-
-    # Número médio de dias úteis entre dois pagamentos semestrais
-    if moeda == "BRL":
-        datas_exemplo = datas[:2]
+        fatores = fatores_indexador(cron, cenario, projecoes, mercado) + spread_anual(cron.spread, cenario) * cron.dias_acumulacao / 252
+
+    total_du = cron.dias_acumulacao.sum()
+    if total_du > 0:
+        taxa_dia_media = np.exp(np.log(fatores).sum() / total_du) - 1
     else:
-        datas_exemplo = gerar_datas_semestrais_convecao_anbima(data_contrat.year, 2)
+        taxa_dia_media = taxa_spread_dia
 
-    dias_exemplo = pd.date_range(
-        start=datas_exemplo[0],
-        end=datas_exemplo[1],
-        freq="D",
-    )[:-1]
-    dias_uteis_exemplo = [
-        d for d in dias_exemplo
-        if d.weekday() < 5 and d.date() not in feriados_set
-    ]
-    dias_uteis_entre_pagamentos = len(dias_uteis_exemplo)
-
-    pmt = None
-    n_amort = max(prazo - carencia, 1)
-
-    if sistema == "PRICE" and prazo > carencia:
-        taxa_periodo_aprox = (1 + taxa_dia_util) ** dias_uteis_entre_pagamentos - 1
-        pmt = float(npf.pmt(taxa_periodo_aprox, prazo - carencia, -valor))
-    elif sistema == "PRICE" and prazo <= carencia:
-        pmt = None
-
-    # Primeiro período: da Data_liberacao até o primeiro vencimento
-    data_anterior = data_liber
-
-    for i in range(prazo):
-        data_atual = datas[i]
-
-        taxa_periodo_efetiva, dias_corridos, dias_uteis = fator_periodo_dias_uteis(
-            taxa_dia_util,
-            data_anterior,
-            data_atual,
-            feriados=feriados,
-        )
+    du = np.where(cron.dias_acumulacao > 0, cron.dias_acumulacao, 1)
+    taxas_dia = np.where(cron.dias_acumulacao > 0, fatores ** (1 / du) - 1, taxa_dia_media)
+    return fatores, taxas_dia, taxa_dia_media
 
-        juros = saldo * taxa_periodo_efetiva
 
-        if i < carencia:
-            amort = 0.0
-            pagamento = juros
-        else:
-            if sistema == "SAC":
-                amort = valor / n_amort
-                pagamento = amort + juros
-            elif sistema == "PRICE" and pmt is not None:
-                amort = pmt - juros
-                pagamento = pmt
-            else:
-                amort = 0.0
-                pagamento = juros
-
-        saldo -= amort
-        saldo = max(saldo, 0.0)
-
-        pagamento_brl = pagamento * cambio
-
-        pagamentos.append(
-            {
-                "ID": row["Id"],
-                "Data": data_atual,
-                "Ano": data_atual.year,
-                "Pagamento": pagamento_brl,
-                "Amortização": amort * cambio,
-                "Juros": juros * cambio,
-                "Saldo_Devedor": saldo * cambio,
-                "Dias_corridos": dias_corridos,
-                "Dias_uteis_252": dias_uteis,
-                "Taxa_Dia_Util": taxa_dia_util * 100,
-                "Taxa_Anual": taxa_anual * 100,
-                "Indexador": row["Indexador"],
-                "Spread": spread * 100,
-            }
+def cambio_contrato(moeda: str, cenario: CenarioMercado, mercado: FotoMercado | None = None) -> float:
+    """Câmbio para BRL da moeda do contrato, já com o choque de cenário."""
+    if mercado is not None:
+        cambio = mercado.cambio(moeda)
+    else:
+        cambio = pegar_cambio(moeda) if moeda != "BRL" else 1.0
+    if cenario.choque_cambio_pct != 0.0 and moeda != "BRL":
+        cambio *= (1 + cenario.choque_cambio_pct)
+    return cambio
+
+
+def cambios_periodo(
+    cron: Cronograma,
+    cenario: CenarioMercado,
+    cambios: dict[str, CurvaCambio] | None = None,
+    mercado: FotoMercado | None = None,
+) -> tuple[np.ndarray, float]:
+    """
+    Câmbio de cada pagamento e da liberação do contrato.
+    Com curva de câmbio para a moeda, usa o valor de cada data; sem curva,
+    o câmbio atual para todas as datas. Choque de cenário aplicado nos dois casos.
+
+    Retorna (cambio_pagamentos, cambio_liberacao).
+    """
+    curva = (cambios or {}).get(cron.moeda) if cron.moeda != "BRL" else None
+    if curva is None:
+        cambio = cambio_contrato(cron.moeda, cenario, mercado)
+        return np.full(cron.prazo, cambio), cambio
+
+    choque = 1 + cenario.choque_cambio_pct
+    return curva.valores(cron.datas) * choque, float(curva.valores(cron.data_liberacao)[0]) * choque
+
+
+def calcular_pmt(valor, prazo, carencia, sistema, taxa_dia_util, dias_uteis_entre_pagamentos):
+    """
+    Prestação PRICE aproximada com base na taxa por período média.
+    Vetorizada; devolve NaN onde não há prestação (não PRICE ou prazo <= carência).
+    """
+    valor = np.asarray(valor, dtype=float)
+    n = np.asarray(prazo) - np.asarray(carencia)
+    tem_pmt = (np.asarray(sistema) == SISTEMA_PRICE) & (n > 0)
+
+    taxa_periodo_aprox = (1 + np.asarray(taxa_dia_util, dtype=float)) ** np.asarray(dias_uteis_entre_pagamentos) - 1
+    pmt = npf.pmt(taxa_periodo_aprox, np.maximum(n, 1), -valor)
+    return np.where(tem_pmt, pmt, np.nan)
+
+
+# =========================
+# 🔹 Amortização em lote
+# =========================
+
+def amortizar_lote(valor, fatores, prazo, carencia, sistema, pmt):
+    """
+    Aplica carência + SAC / PRICE / só juros a vários fluxos de uma vez.
+
+    - valor, prazo, carencia, sistema, pmt: um elemento por linha
+      (pmt NaN = sem prestação fixa);
+    - fatores: matriz linhas × períodos com 1 + taxa efetiva do período.
+      Períodos além do prazo de cada linha saem zerados.
+
+    Retorna matrizes (juros, amortizacao, pagamento, saldo) em moeda do contrato.
+    """
+    fatores = np.atleast_2d(np.asarray(fatores, dtype=float))
+    n, p = fatores.shape
+
+    valor = np.broadcast_to(np.asarray(valor, dtype=float), (n,))
+    prazo = np.broadcast_to(np.asarray(prazo), (n,))
+    carencia = np.broadcast_to(np.asarray(carencia), (n,))
+    sistema = np.broadcast_to(np.asarray(sistema), (n,))
+    pmt = np.broadcast_to(np.asarray(pmt, dtype=float), (n,))
+
+    amort_sac = valor / np.maximum(prazo - carencia, 1)
+    sac = sistema == SISTEMA_SAC
+    price = (sistema == SISTEMA_PRICE) & ~np.isnan(pmt)
+
+    juros = np.zeros((n, p))
+    amortizacao = np.zeros((n, p))
+    pagamento = np.zeros((n, p))
+    saldos = np.zeros((n, p))
+
+    saldo = valor.copy()
+    for i in range(p):
+        ativo = i < prazo
+        amortiza = ativo & (i >= carencia)
+
+        j = np.where(ativo, saldo * (fatores[:, i] - 1), 0.0)
+        a = np.where(amortiza & sac, amort_sac, np.where(amortiza & price, pmt - j, 0.0))
+        pg = np.where(amortiza & price, pmt, a + j)
+
+        saldo = np.maximum(saldo - a, 0.0)
+
+        juros[:, i] = j
+        amortizacao[:, i] = a
+        pagamento[:, i] = pg
+        saldos[:, i] = np.where(ativo, saldo, 0.0)
+
+    return juros, amortizacao, pagamento, saldos
+
+
+# =========================
+# 🔹 Lote de cronogramas (vários contratos de uma vez)
+# =========================
+
+@dataclass
+class LoteCronogramas:
+    """
+    Cronogramas empilhados em matrizes contratos × períodos, preenchidas
+    até o maior prazo do lote ('mascara' indica os períodos válidos).
+    Independe de taxas: montado uma vez e reaproveitado em cálculos em lote.
+    """
+    cronogramas: list
+    valor: np.ndarray
+    prazo: np.ndarray
+    carencia: np.ndarray
+    sistema: np.ndarray
+    dias_uteis_entre_pagamentos: np.ndarray
+    datas: np.ndarray
+    mascara: np.ndarray
+
+    @classmethod
+    def de_cronogramas(cls, cronogramas: list) -> "LoteCronogramas":
+        prazo = np.array([c.prazo for c in cronogramas], dtype=np.int64)
+        p = int(prazo.max()) if prazo.size else 0
+        mascara = np.arange(p)[None, :] < prazo[:, None]
+
+        datas = np.full(mascara.shape, np.datetime64("NaT"), dtype="datetime64[D]")
+        if cronogramas:
+            datas[mascara] = np.concatenate([c.datas.values.astype("datetime64[D]") for c in cronogramas])
+
+        return cls(
+            cronogramas=cronogramas,
+            valor=np.array([c.valor for c in cronogramas], dtype=float),
+            prazo=prazo,
+            carencia=np.array([c.carencia for c in cronogramas], dtype=np.int64),
+            sistema=np.array([codigo_sistema(c.sistema) for c in cronogramas], dtype=np.int64),
+            dias_uteis_entre_pagamentos=np.array(
+                [c.dias_uteis_entre_pagamentos for c in cronogramas], dtype=float
+            ),
+            datas=datas,
+            mascara=mascara,
         )
 
-        data_anterior = data_atual
+    def espalhar(self, vetores, preenchimento: float = 0.0) -> np.ndarray:
+        """Vetores por contrato (um por período) → matriz contratos × períodos."""
+        matriz = np.full(self.mascara.shape, preenchimento, dtype=float)
+        if len(vetores):
+            matriz[self.mascara] = np.concatenate([np.asarray(v, dtype=float) for v in vetores])
+        return matriz
+
+    @property
+    def anos(self) -> np.ndarray:
+        anos = self.datas.astype("datetime64[Y]").astype(np.int64) + 1970
+        return np.where(self.mascara, anos, 0)
+
+
+def fatores_lote(
+    lote: LoteCronogramas,
+    cenario: CenarioMercado,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    mercado: FotoMercado | None = None,
+    linhas=None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fatores por período (matriz) e taxa diária média (vetor) dos contratos
+    'linhas' do lote (todos, se None), com as mesmas regras de taxas_periodo.
+    """
+    if linhas is None:
+        linhas = np.arange(len(lote.cronogramas))
+
+    fatores = np.ones((len(linhas), lote.mascara.shape[1]))
+    taxa_media = np.zeros(len(linhas))
+    for k, i in enumerate(linhas):
+        cron = lote.cronogramas[i]
+        f, _, media = taxas_periodo(cron, cenario, projecoes, mercado)
+        fatores[k, : cron.prazo] = f
+        taxa_media[k] = media
+    return fatores, taxa_media
+
+
+def cambios_lote(
+    lote: LoteCronogramas,
+    cenario: CenarioMercado,
+    cambios: dict[str, CurvaCambio] | None = None,
+    mercado: FotoMercado | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Câmbio de cada pagamento (matriz) e da liberação (vetor) de cada contrato."""
+    por_contrato = [cambios_periodo(c, cenario, cambios, mercado) for c in lote.cronogramas]
+    matriz = lote.espalhar([c[0] for c in por_contrato])
+    liberacao = np.array([c[1] for c in por_contrato], dtype=float)
+    return matriz, liberacao
+
+
+def amortizar_cronogramas(lote: LoteCronogramas, fatores: np.ndarray, taxa_media: np.ndarray, linhas=None):
+    """
+    Amortização em lote das 'linhas' do lote (uma linha de fatores por
+    elemento de 'linhas'; a mesma linha do lote pode aparecer várias vezes,
+    ex.: uma por cenário). Retorna (juros, amortizacao, pagamento, saldo).
+    """
+    if linhas is None:
+        linhas = np.arange(len(lote.cronogramas))
+    linhas = np.asarray(linhas, dtype=np.int64)
+
+    pmt = calcular_pmt(
+        lote.valor[linhas],
+        lote.prazo[linhas],
+        lote.carencia[linhas],
+        lote.sistema[linhas],
+        taxa_media,
+        lote.dias_uteis_entre_pagamentos[linhas],
+    )
+    return amortizar_lote(
+        lote.valor[linhas],
+        fatores,
+        lote.prazo[linhas],
+        lote.carencia[linhas],
+        lote.sistema[linhas],
+        pmt,
+    )
 
-    df = pd.DataFrame(pagamentos)
 
-    fluxo_fin = [-valor * cambio] + df["Pagamento"].tolist()
+def descontos_lote(lote: LoteCronogramas, curva: CurvaDesconto) -> tuple[np.ndarray, np.ndarray]:
+    """Fatores de desconto de cada pagamento (matriz) e da liberação (vetor)."""
+    fd = np.zeros(lote.mascara.shape)
+    fd[lote.mascara] = curva.fator_desconto(lote.datas[lote.mascara])
+    fd_liberacao = curva.fator_desconto([c.data_liberacao for c in lote.cronogramas])
+    return fd, fd_liberacao
+
+
+def vpl_lote(pagamento_brl, fd, fd_liberacao, fluxo_inicial) -> np.ndarray:
+    """
+    VPL na data de liberação de cada linha: pagamentos (BRL) × fatores de
+    desconto, trazidos à liberação, mais o fluxo inicial (ex.: -valor).
+    """
+    return (pagamento_brl * fd).sum(axis=1) / fd_liberacao + fluxo_inicial
+
+
+def somas_anuais_lote(anos, pagamentos, mascara, ano_inicial: int, n_anos: int) -> np.ndarray:
+    """Pagamentos somados por ano civil numa grade comum: linhas × [ano_inicial, +n_anos)."""
+    r = pagamentos.shape[0]
+    deslocamento = np.clip(anos - ano_inicial, 0, n_anos - 1)
+    chave = np.arange(r)[:, None] * n_anos + deslocamento
+    return np.bincount(chave[mascara], weights=pagamentos[mascara], minlength=r * n_anos).reshape(r, n_anos)
+
+
+def pico_anual_lote(anos: np.ndarray, pagamentos: np.ndarray, mascara: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Maior soma anual de pagamentos de cada linha e o ano correspondente.
+    Retorna (pico, ano_pico); linhas sem pagamentos → (0, 0).
+    """
+    r = pagamentos.shape[0]
+    if r == 0 or not mascara.any():
+        return np.zeros(r), np.zeros(r, dtype=np.int64)
+
+    ano_min = np.where(mascara, anos, np.iinfo(np.int64).max).min(axis=1)
+    ano_min = np.where(mascara.any(axis=1), ano_min, 0)
+    deslocamento = np.where(mascara, anos - ano_min[:, None], 0)
+    k = int(deslocamento.max()) + 1
+
+    chave = np.arange(r)[:, None] * k + deslocamento
+    somas = np.bincount(chave[mascara], weights=pagamentos[mascara], minlength=r * k).reshape(r, k)
+
+    posicao = somas.argmax(axis=1)
+    pico = somas[np.arange(r), posicao]
+    ano_pico = np.where(mascara.any(axis=1), ano_min + posicao, 0)
+    return pico, ano_pico
+
+
+# =========================
+# 🔹 Simulação do contrato
+# =========================
+
+def precificar_cronograma(
+    cron: Cronograma,
+    cenario: CenarioMercado,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    mercado: FotoMercado | None = None,
+):
+    """
+    Aplica taxas e câmbio do cenário a um cronograma já montado.
+    Retorna (df, tir, fluxo_inicial).
+    """
+    fatores, taxas_dia, taxa_dia_media = taxas_periodo(cron, cenario, projecoes, mercado)
+    sistema = codigo_sistema(cron.sistema)
+
+    pmt = calcular_pmt(
+        cron.valor,
+        cron.prazo,
+        cron.carencia,
+        sistema,
+        taxa_dia_media,
+        cron.dias_uteis_entre_pagamentos,
+    )
+    juros, amort, pagamento, saldo = (
+        m[0] for m in amortizar_lote(cron.valor, fatores, cron.prazo, cron.carencia, sistema, pmt)
+    )
+
+    cambio, cambio_liberacao = cambios_periodo(cron, cenario, cambios, mercado)
+
+    df = pd.DataFrame(
+        {
+            "ID": cron.id,
+            "Data": cron.datas,
+            "Ano": cron.datas.year,
+            "Pagamento": pagamento * cambio,
+            "Amortização": amort * cambio,
+            "Juros": juros * cambio,
+            "Saldo_Devedor": saldo * cambio,
+            "Dias_corridos": cron.dias_corridos,
+            "Dias_uteis_252": cron.dias_uteis,
+            "Taxa_Dia_Util": taxas_dia * 100,
+            "Taxa_Anual": ((1 + taxas_dia) ** 252 - 1) * 100,
+            "Indexador": cron.indexador,
+            "Spread": cron.spread * 100,
+        }
+    )
+
+    fluxo_fin = [-cron.valor * cambio_liberacao] + df["Pagamento"].tolist()
 
     tir = calcular_tir(
         fluxo_fin,
-        periodicidade_meses=periodicidade,
-        dias_uteis_entre_pagamentos=dias_uteis_entre_pagamentos,
+        periodicidade_meses=cron.periodicidade,
+        dias_uteis_entre_pagamentos=cron.dias_uteis_entre_pagamentos,
     )
 
-    taxa_cdi_desconto = pegar_cdi()
-    vpl = calcular_vpl(fluxo_fin, taxa_cdi_desconto, periodicidade)
+    return df, tir, fluxo_fin[0]
 
-    return df, tir, vpl
+
+def simular_fluxo(
+    row,
+    cenario: CenarioMercado,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+):
+    """
+    Simula o fluxo de um contrato de dívida, sem calcular o VPL.
+
+    Convenções:
+    - Se Periodicidade = 1 → períodos mensais (juros pró‑rata dia útil ANBIMA),
+      iniciando na Data_liberacao e pagando no mesmo dia de Data_liberacao + k meses.
+    - Se Periodicidade = 6 → períodos semestrais; Prazo e Carencia em semestres.
+      Em BRL, semestres a partir da Data_liberacao; em moeda estrangeira,
+      convenção ANBIMA 15/05 e 15/11.
+    - 'projecoes' (opcional): curvas de projeção por indexador; sem curva,
+      o indexador usa a taxa atual de mercado, constante.
+    - 'cambios' (opcional): câmbio por data para cada moeda; sem curva,
+      usa o câmbio atual em todos os pagamentos.
+
+    Retorna (df, tir, fluxo_inicial), onde fluxo_inicial é o valor liberado
+    em BRL com sinal negativo (primeiro elemento do fluxo financeiro).
+    """
+    return precificar_cronograma(montar_cronograma(row), cenario, projecoes, cambios)
+
+
+def simular_contrato(
+    row,
+    cenario: CenarioMercado,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+):
+    """
+    Simula o fluxo de um contrato de dívida e calcula TIR e VPL.
+
+    - Com 'curva', o VPL desconta cada pagamento pela curva na sua data,
+      trazido à Data_liberacao.
+    - Sem 'curva', mantém a lógica antiga: CDI atual convertido por período em meses.
+    """
+    df, tir, fluxo_inicial = simular_fluxo(row, cenario, projecoes, cambios)
+    return df, tir, _vpl_contrato(row, df, fluxo_inicial, curva)
+
+
+def simular_contrato_semestral(
+    row,
+    cenario: CenarioMercado,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+):
+    """
+    (Mantida para compatibilidade)
+    Simula contrato semestral e calcula TIR e VPL.
+    """
+    return simular_contrato(row, cenario, curva, projecoes, cambios)
+
+
+def _vpl_contrato(row, df: pd.DataFrame, fluxo_inicial: float, curva: CurvaDesconto | None) -> float:
+    if curva is None:
+        fluxo_fin = [fluxo_inicial] + df["Pagamento"].tolist()
+        return calcular_vpl(fluxo_fin, pegar_cdi(), int(row["Periodicidade"]))
+
+    vpl = curva.vpl_carteira(
+        np.zeros(len(df), dtype=np.int64),
+        df["Data"],
+        df["Pagamento"],
+        [row["Data_liberacao"]],
+        [fluxo_inicial],
+    )
+    return float(vpl[0])
@@ -0,0 +1,382 @@
+import numpy as np
+import pandas as pd
+
+from cenarios import CenarioMercado
+from contagem_dias import BASE_PADRAO
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao, contar_dias_uteis
+from engine_divida import (
+    LoteCronogramas,
+    amortizar_lote,
+    calcular_pmt,
+    calcular_tir,
+    cambios_lote,
+    choque_indexador,
+    descontos_lote,
+    fatores_indexador,
+    montar_cronograma,
+    spread_anual,
+    taxa_anual_equivalente,
+    taxa_indexador_anual,
+    taxa_spread_dia_util,
+    vpl_lote,
+)
+from mercado import FotoMercado, foto_mercado
+from modelo_divida import ErroValidacao, normalizar_contratos, projetar_cambios, validar_contratos
+
+
+METRICAS_ALVO = ("VPL", "TIR", "Custo_Total")
+VARIAVEIS = ("Spread", "Fator_indexador")
+
+# Intervalo inicial da busca e limites para ampliá-lo (base 1.0)
+INTERVALOS_PADRAO = {"Spread": (-0.02, 0.10), "Fator_indexador": (0.5, 2.0)}
+LIMITES = {"Spread": (-0.9, 5.0), "Fator_indexador": (0.0, 20.0)}
+MAX_AMPLIACOES = 12
+
+
+# ===============================
+# 🔹 Pagamentos em lote em função da variável
+# ===============================
+
+class _PrecificadorLote:
+    """
+    Parte dos contratos que não depende da variável resolvida (spread ou
+    Fator_indexador), montada uma vez: cronogramas empilhados, dias de
+    acumulação, câmbios, fatores de desconto e o fator do indexador (ou as
+    taxas diárias da projeção, quando a variável é o Fator_indexador).
+    Cada avaliação é só aritmética de matrizes contratos × períodos.
+
+    Como em taxas_periodo: em DU/252, indexador e spread capitalizam por
+    dia útil (fatores separáveis em log); nas demais bases, juros simples
+    1 + (taxa anual do indexador + spread) × fração de ano.
+    """
+
+    def __init__(self, cronogramas, variavel, cenario, curva, projecoes, cambios, mercado):
+        self.cronogramas = cronogramas
+        self.variavel = variavel
+        self.cenario = cenario
+        self.lote = LoteCronogramas.de_cronogramas(cronogramas)
+        n, p = self.lote.mascara.shape
+
+        self.dias = self.lote.espalhar([c.dias_acumulacao for c in cronogramas])
+        self.total_dias = self.dias.sum(axis=1)
+        self.fracao = self.dias / 252
+        self.simples = np.array([c.base_calculo != BASE_PADRAO for c in cronogramas], dtype=bool)
+        self.spread = np.array([c.spread for c in cronogramas], dtype=float)
+        self.fator = np.array([c.fator for c in cronogramas], dtype=float)
+        self.cambio, self.cambio_liberacao = cambios_lote(self.lote, cenario, cambios, mercado)
+        self.fd, self.fd_liberacao = descontos_lote(self.lote, curva)
+        self.principal_brl = self.lote.valor * self.cambio_liberacao
+
+        if variavel == "Spread":
+            # Fator do indexador fixo: calculado uma vez por contrato
+            self.fator_indexador = self.lote.espalhar(
+                [fatores_indexador(c, cenario, projecoes, mercado) for c in cronogramas], 1.0
+            )
+            self.log_indexador = np.log(self.fator_indexador)
+            return
+
+        # Fator_indexador variável: taxa única do indexador (sem projeção)
+        # ou taxas de cada dia útil do período (com projeção)
+        self.taxa_unica = np.zeros(n)
+        self.com_projecao = np.zeros(n, dtype=bool)
+        self.du_curva = np.zeros((n, p))
+        celulas, linhas, taxas, sinais = [], [], [], []
+        for i, cron in enumerate(cronogramas):
+            projecao = (projecoes or {}).get(str(cron.indexador).upper())
+            if projecao is None:
+                self.taxa_unica[i] = taxa_indexador_anual(cron.indexador, cenario, mercado)
+                continue
+
+            self.com_projecao[i] = True
+            taxas_dia, periodo, sinal = projecao.taxas_diarias(cron.inicios, cron.datas)
+            taxas.append(taxas_dia + choque_indexador(cron.indexador, cenario))
+            celulas.append(i * p + periodo)
+            linhas.append(np.full(periodo.size, i))
+            sinais.append(sinal)
+            if self.simples[i]:
+                self.du_curva[i, : cron.prazo] = contar_dias_uteis(cron.inicios, cron.datas)
+
+        self.celula_dia = np.concatenate(celulas) if celulas else np.zeros(0, dtype=np.int64)
+        self.linha_dia = np.concatenate(linhas) if linhas else np.zeros(0, dtype=np.int64)
+        self.taxa_dia = np.concatenate(taxas) if taxas else np.zeros(0)
+        self.sinal_dia = np.concatenate(sinais) if sinais else np.zeros(0)
+
+    def _log_indexador(self, fator: np.ndarray) -> np.ndarray:
+        """Log do fator do indexador capitalizado por dia útil (dias úteis da curva, com projeção)."""
+        n, p = self.dias.shape
+        unica = self.dias * (np.log1p(self.taxa_unica * fator) / 252)[:, None]
+        projetada = np.bincount(
+            self.celula_dia,
+            weights=self.sinal_dia * np.log1p(self.taxa_dia * fator[self.linha_dia]) / 252,
+            minlength=n * p,
+        ).reshape(n, p)
+        return np.where(self.com_projecao[:, None], projetada, unica)
+
+    def _log_fatores(self, spread: np.ndarray, fator: np.ndarray) -> np.ndarray:
+        """Log do fator (indexador + spread) de cada período, como em taxas_periodo."""
+        log_indexador = self.log_indexador if self.variavel == "Spread" else self._log_indexador(fator)
+        composto = log_indexador + self.dias * np.log1p(taxa_spread_dia_util(spread, self.cenario))[:, None]
+        if not self.simples.any():
+            return composto
+
+        if self.variavel == "Spread":
+            fator_indexador = self.fator_indexador
+        else:
+            taxa_anual = np.where(
+                self.com_projecao[:, None],
+                taxa_anual_equivalente(log_indexador, self.du_curva),
+                (self.taxa_unica * fator)[:, None],
+            )
+            fator_indexador = 1 + taxa_anual * self.fracao
+
+        simples = self.simples[:, None]
+        fatores = fator_indexador + spread_anual(spread, self.cenario)[:, None] * self.fracao
+        return np.where(simples, np.log(np.where(simples, fatores, 1.0)), composto)
+
+    def pagamentos(self, x: np.ndarray) -> np.ndarray:
+        """Pagamentos em BRL (contratos × períodos) com a variável = x."""
+        spread = x if self.variavel == "Spread" else self.spread
+        fator = x if self.variavel == "Fator_indexador" else self.fator
+
+        log_fatores = self._log_fatores(spread, fator)
+        taxa_media = np.where(
+            self.total_dias > 0,
+            np.exp(log_fatores.sum(axis=1) / np.where(self.total_dias > 0, self.total_dias, 1.0)) - 1,
+            taxa_spread_dia_util(spread, self.cenario),
+        )
+
+        lote = self.lote
+        pmt = calcular_pmt(lote.valor, lote.prazo, lote.carencia, lote.sistema, taxa_media, lote.dias_uteis_entre_pagamentos)
+        _, _, pagamento, _ = amortizar_lote(lote.valor, np.exp(log_fatores), lote.prazo, lote.carencia, lote.sistema, pmt)
+        return pagamento * self.cambio
+
+    def vpl(self, pagamento_brl: np.ndarray) -> np.ndarray:
+        return vpl_lote(pagamento_brl, self.fd, self.fd_liberacao, -self.principal_brl)
+
+    def taxa_periodo(self, tir_anual: np.ndarray) -> np.ndarray:
+        """TIR anual (%) → taxa por período, com a mesma conversão de calcular_tir."""
+        dias = self.lote.dias_uteis_entre_pagamentos
+        meses = np.array([c.periodicidade for c in self.cronogramas], dtype=float)
+        expoente = np.where(dias > 0, dias / 252, meses / 12)
+        return (1 + tir_anual / 100) ** expoente - 1
+
+    def residuo(self, x: np.ndarray, metrica: str, alvo: np.ndarray) -> np.ndarray:
+        """
+        Métrica − alvo, por unidade de principal em BRL. Para TIR, o VPL do
+        fluxo à taxa alvo (zero quando a TIR do contrato é o alvo).
+        Crescente na variável.
+        """
+        pagamento = self.pagamentos(x)
+        if metrica == "VPL":
+            valor = self.vpl(pagamento) - alvo
+        elif metrica == "Custo_Total":
+            valor = pagamento.sum(axis=1) - alvo
+        else:
+            desconto = (1 + self.taxa_periodo(alvo))[:, None] ** -np.arange(1, pagamento.shape[1] + 1)[None, :]
+            valor = (pagamento * desconto).sum(axis=1) - self.principal_brl
+        return valor / self.principal_brl
+
+
+# ===============================
+# 🔹 Busca de raízes vetorizada
+# ===============================
+
+def _ampliar_intervalo(funcao, baixo, alto, limite_baixo, limite_alto):
+    """
+    Amplia [baixo, alto] de cada contrato até haver troca de sinal (a
+    função é crescente), dobrando a largura e respeitando os limites.
+    """
+    f_baixo, f_alto = funcao(baixo), funcao(alto)
+    for _ in range(MAX_AMPLIACOES):
+        descer = (f_baixo > 0) & (baixo > limite_baixo)
+        subir = (f_alto < 0) & (alto < limite_alto)
+        if not (descer | subir).any():
+            break
+        largura = alto - baixo
+        baixo = np.where(descer, np.maximum(baixo - largura, limite_baixo), baixo)
+        alto = np.where(subir, np.minimum(alto + largura, limite_alto), alto)
+        f_baixo = np.where(descer, funcao(baixo), f_baixo)
+        f_alto = np.where(subir, funcao(alto), f_alto)
+    return baixo, alto, f_baixo, f_alto
+
+
+def _raizes(funcao, baixo, alto, f_baixo, f_alto, tolerancia: float, max_iteracoes: int):
+    """
+    Regula falsi (variante Illinois) em todos os contratos de uma vez:
+    cada iteração avalia 'funcao' num vetor de candidatos. Retorna
+    (raiz, iteracoes, convergiu); sem troca de sinal, raiz NaN.
+    """
+    n = baixo.size
+    # a variável precisa mexer na métrica (ex.: Fator_indexador de um
+    # indexador com taxa zero não mexe) e o intervalo, conter a raiz
+    valido = (f_alto > f_baixo) & (np.sign(f_baixo) * np.sign(f_alto) <= 0)
+    raiz = np.where(valido & (f_baixo == 0), baixo, np.where(valido & (f_alto == 0), alto, np.nan))
+    convergiu = valido & ~np.isnan(raiz)
+    iteracoes = np.zeros(n, dtype=np.int64)
+    ultimo_lado = np.zeros(n, dtype=np.int64)
+
+    for _ in range(max_iteracoes):
+        ativo = valido & ~convergiu
+        if not ativo.any():
+            break
+
+        denominador = f_alto - f_baixo
+        meio = (baixo + alto) / 2
+        candidato = np.where(denominador != 0, (baixo * f_alto - alto * f_baixo) / np.where(denominador != 0, denominador, 1.0), meio)
+        candidato = np.where(ativo, candidato, meio)
+        f_candidato = funcao(candidato)
+        iteracoes += ativo
+
+        pronto = ativo & ((np.abs(f_candidato) <= tolerancia) | (alto - baixo <= tolerancia * np.maximum(1.0, np.abs(candidato))))
+        raiz = np.where(pronto, candidato, raiz)
+        convergiu |= pronto
+
+        # troca o extremo com o mesmo sinal; o que fica parado tem o valor
+        # reduzido à metade (Illinois) para não estagnar
+        vai_alto = ativo & ~pronto & (f_candidato > 0)
+        vai_baixo = ativo & ~pronto & (f_candidato <= 0)
+        f_baixo = np.where(vai_alto & (ultimo_lado == 1), f_baixo / 2, f_baixo)
+        f_alto = np.where(vai_baixo & (ultimo_lado == -1), f_alto / 2, f_alto)
+        alto = np.where(vai_alto, candidato, alto)
+        f_alto = np.where(vai_alto, f_candidato, f_alto)
+        baixo = np.where(vai_baixo, candidato, baixo)
+        f_baixo = np.where(vai_baixo, f_candidato, f_baixo)
+        ultimo_lado = np.where(vai_alto, 1, np.where(vai_baixo, -1, ultimo_lado))
+
+    raiz = np.where(valido & ~convergiu, (baixo + alto) / 2, raiz)
+    return raiz, iteracoes, convergiu
+
+
+# ===============================
+# 🔹 Spread (ou fator) de equilíbrio
+# ===============================
+
+def _alvos(alvo, ids: pd.Series) -> np.ndarray:
+    """Alvo único, um por contrato (na ordem) ou por Id (dict/Series)."""
+    if isinstance(alvo, (dict, pd.Series)):
+        alvos = pd.Series(alvo)
+        faltando = [i for i in ids if i not in alvos.index]
+        if faltando:
+            raise ValueError(f"Sem alvo para os contratos: {faltando[:10]}")
+        return alvos.loc[ids.to_numpy()].to_numpy(dtype=float)
+    if np.ndim(alvo) == 0:
+        return np.full(len(ids), float(alvo))
+
+    alvos = np.asarray(alvo, dtype=float)
+    if alvos.size != len(ids):
+        raise ValueError(f"Informe um alvo por contrato ({len(ids)}), não {alvos.size}.")
+    return alvos
+
+
+def resolver_equilibrio(
+    contratos: pd.DataFrame,
+    alvo,
+    metrica: str = "VPL",
+    variavel: str = "Spread",
+    cenario: CenarioMercado | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    mercado: FotoMercado | None = None,
+    cambio_paridade: bool = False,
+    cronogramas: list | None = None,
+    intervalo: tuple[float, float] | None = None,
+    tolerancia: float = 1e-10,
+    max_iteracoes: int = 100,
+) -> pd.DataFrame:
+    """
+    Spread (ou Fator_indexador) de equilíbrio: o valor da 'variavel' que
+    leva a 'metrica' ("VPL", "TIR" em % a.a. ou "Custo_Total") de cada
+    contrato de 'contratos' ao 'alvo'. O alvo é de cada contrato: um total
+    (ex.: o VPL da dívida antiga) precisa ser repartido entre eles. Ex.:
+    spreads dos contratos novos para que, juntos, igualem o VPL da dívida
+    antiga, repartido pelo valor contratado:
+
+        valores = novos.set_index("Id")["Valor_Contratado"]
+        vpl_antigo = resumo.loc[resumo["Tipo"] == "Antigo", "VPL"].sum()
+        resolver_equilibrio(novos, alvo=vpl_antigo * valores / valores.sum())
+
+    - 'alvo': número (o mesmo para cada contrato), um por contrato (na
+      ordem) ou dict/Series por Id;
+    - 'cronogramas' (opcional): os já montados para 'contratos' (mesma
+      ordem), reaproveitados; sem eles, são montados uma vez;
+    - demais opções como em rodar_modelo.
+
+    Todos os contratos são resolvidos juntos: câmbios, descontos, dias e o
+    fator do indexador são calculados uma vez, e cada iteração da busca
+    (regula falsi em intervalo ampliado até haver troca de sinal) avalia
+    todos os candidatos numa única amortização em lote.
+
+    Retorna, por contrato: a variável encontrada, o valor atual, as três
+    métricas no ponto encontrado, iterações e se convergiu.
+    """
+    if metrica not in METRICAS_ALVO:
+        raise ValueError(f"Métrica inválida: {metrica}. Use uma de {list(METRICAS_ALVO)}.")
+    if variavel not in VARIAVEIS:
+        raise ValueError(f"Variável inválida: {variavel}. Use uma de {list(VARIAVEIS)}.")
+    if cenario is None:
+        cenario = CenarioMercado(nome="Base")
+
+    contratos = contratos.copy()
+    contratos.columns = [str(c).strip() for c in contratos.columns]
+    if cronogramas is None:
+        relatorio = validar_contratos(contratos, projecoes)
+        if not relatorio.empty:
+            raise ErroValidacao(relatorio)
+        contratos = normalizar_contratos(contratos)
+        cronogramas = [montar_cronograma(row) for _, row in contratos.iterrows()]
+    elif len(cronogramas) != len(contratos):
+        raise ValueError("'cronogramas' deve ter um cronograma por contrato.")
+
+    colunas = ["ID", "Metrica", "Alvo", variavel, f"{variavel}_Atual", "VPL", "TIR", "Custo_Total", "Iteracoes", "Convergiu"]
+    if not cronogramas:
+        return pd.DataFrame(columns=colunas)
+
+    alvos = _alvos(alvo, contratos["Id"])
+    moedas = contratos["Moeda"].astype(str).str.upper().unique()
+    if mercado is None:
+        mercado = foto_mercado(moedas)
+    if curva is None:
+        curva = CurvaDesconto.plana(mercado.taxa("CDI"))
+    if cambio_paridade:
+        cambios = projetar_cambios(moedas, mercado, curva, cambios)
+
+    precificador = _PrecificadorLote(cronogramas, variavel, cenario, curva, projecoes, cambios, mercado)
+    n = len(cronogramas)
+
+    def funcao(x):
+        return precificador.residuo(x, metrica, alvos)
+
+    baixo, alto = intervalo or INTERVALOS_PADRAO[variavel]
+    baixo, alto, f_baixo, f_alto = _ampliar_intervalo(funcao, np.full(n, float(baixo)), np.full(n, float(alto)), *LIMITES[variavel])
+    raiz, iteracoes, convergiu = _raizes(funcao, baixo, alto, f_baixo, f_alto, tolerancia, max_iteracoes)
+
+    # Métricas no ponto encontrado (TIR como em rodar_modelo)
+    resolvido = np.where(np.isnan(raiz), precificador.spread if variavel == "Spread" else precificador.fator, raiz)
+    pagamento = precificador.pagamentos(resolvido)
+    tir = [
+        calcular_tir(
+            [-precificador.principal_brl[i]] + pagamento[i, : cron.prazo].tolist(),
+            periodicidade_meses=cron.periodicidade,
+            dias_uteis_entre_pagamentos=cron.dias_uteis_entre_pagamentos,
+        )
+        for i, cron in enumerate(cronogramas)
+    ]
+    vpl = precificador.vpl(pagamento)
+    custo = pagamento.sum(axis=1)
+    sem_raiz = np.isnan(raiz)
+
+    return pd.DataFrame(
+        {
+            "ID": [c.id for c in cronogramas],
+            "Metrica": metrica,
+            "Alvo": alvos,
+            variavel: raiz,
+            f"{variavel}_Atual": precificador.spread if variavel == "Spread" else precificador.fator,
+            "VPL": np.where(sem_raiz, np.nan, vpl),
+            "TIR": np.where(sem_raiz, np.nan, tir),
+            "Custo_Total": np.where(sem_raiz, np.nan, custo),
+            "Iteracoes": iteracoes,
+            "Convergiu": convergiu,
+        }
+    )[colunas]
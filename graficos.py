@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+
+# Limites do que vai para o navegador, independentes do tamanho da carteira
+MAX_PONTOS_SERIE = 1000
+LIMIAR_WEBGL = 2000
+MAX_BARRAS = 60
+LIMIAR_TEXTO_BARRAS = 40
+
+
+# =========================
+# 🔹 Redução de pontos (no servidor)
+# =========================
+
+def filtrar_intervalo(df: pd.DataFrame, x: str, inicio=None, fim=None) -> pd.DataFrame:
+    """Linhas com 'x' dentro de [inicio, fim] (limites opcionais)."""
+    mascara = np.ones(len(df), dtype=bool)
+    if inicio is not None:
+        mascara &= (df[x] >= inicio).to_numpy()
+    if fim is not None:
+        mascara &= (df[x] <= fim).to_numpy()
+    return df[mascara]
+
+
+def _indices_min_max(y: np.ndarray, n_baldes: int) -> np.ndarray:
+    """
+    Posições (ordenadas) do mínimo e do máximo de 'y' em cada um de
+    'n_baldes' baldes consecutivos de tamanho igual.
+    """
+    n = y.size
+    balde = np.arange(n) * n_baldes // n
+    inicio = np.searchsorted(balde, np.arange(n_baldes))
+
+    # min/max por balde sem laço: ordena por (balde, y) e pega as pontas
+    ordem = np.lexsort((y, balde))
+    fim = np.append(inicio[1:], n) - 1
+    return np.unique(np.concatenate([ordem[inicio], ordem[fim]]))
+
+
+def reduzir_min_max(df: pd.DataFrame, x: str, y: str, cor: str | None = None, max_pontos: int = MAX_PONTOS_SERIE) -> pd.DataFrame:
+    """
+    Reduz cada série (uma por valor de 'cor') a no máximo 'max_pontos'
+    pontos, mantendo o mínimo e o máximo de cada trecho: picos de
+    pagamento continuam visíveis no gráfico. Séries menores passam inteiras.
+    """
+    if df.empty:
+        return df
+
+    grupos = [df] if cor is None else [g for _, g in df.groupby(cor, sort=False)]
+    partes = []
+    for g in grupos:
+        g = g.sort_values(x, kind="stable")
+        if len(g) > max_pontos:
+            g = g.iloc[_indices_min_max(g[y].to_numpy(dtype=float), max(1, max_pontos // 2))]
+        partes.append(g)
+    return pd.concat(partes, ignore_index=True)
+
+
+def agrupar_barras(df: pd.DataFrame, x: str, y: str, cor: str | None = None, max_barras: int = MAX_BARRAS) -> pd.DataFrame:
+    """
+    Para eixos numéricos (ex.: Ano) com mais de 'max_barras' valores,
+    soma 'y' em faixas de k valores consecutivos; 'x' passa a ser o
+    início da faixa. Com poucos valores, devolve 'df' como está.
+    """
+    valores = np.sort(df[x].unique())
+    if valores.size <= max_barras:
+        return df
+
+    k = int(np.ceil(valores.size / max_barras))
+    inicio = valores.min()
+    faixa = inicio + (df[x] - inicio) // k * k
+
+    chaves = [faixa.rename(x)] + ([df[cor]] if cor is not None else [])
+    return df[y].groupby(chaves).sum().reset_index()
+
+
+# =========================
+# 🔹 Gráficos
+# =========================
+
+def grafico_linha(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    cor: str | None = None,
+    titulo: str | None = None,
+    inicio=None,
+    fim=None,
+    max_pontos: int = MAX_PONTOS_SERIE,
+    limiar_webgl: int = LIMIAR_WEBGL,
+):
+    """
+    Linha com pontos reduzidos no servidor: recorta o intervalo visível
+    [inicio, fim], reduz por min/max e usa WebGL quando o intervalo
+    recortado (antes da redução) passa de 'limiar_webgl' pontos.
+    """
+    visiveis = filtrar_intervalo(df, x, inicio, fim)
+    dados = reduzir_min_max(visiveis, x, y, cor, max_pontos)
+    return px.line(
+        dados,
+        x=x,
+        y=y,
+        color=cor,
+        title=titulo,
+        render_mode="webgl" if len(visiveis) > limiar_webgl else "svg",
+    )
+
+
+def grafico_barras(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    cor: str | None = None,
+    max_barras: int = MAX_BARRAS,
+    limiar_texto: int = LIMIAR_TEXTO_BARRAS,
+):
+    """
+    Barras agrupadas com no máximo 'max_barras' posições no eixo x;
+    rótulos de valor só quando há poucas posições.
+    """
+    dados = agrupar_barras(df, x, y, cor, max_barras)
+    return px.bar(
+        dados,
+        x=x,
+        y=y,
+        color=cor,
+        barmode="group",
+        text_auto=dados[x].nunique() <= limiar_texto,
+    )
@@ -0,0 +1,271 @@
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+import requests
+
+
+DIRETORIO_HISTORICO = "historico_series"
+
+URL_SGS = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo}/dados"
+URL_FRED = "https://api.stlouisfed.org/fred/series/observations"
+
+# Séries guardadas, como publicadas na fonte (sem conversão de unidade):
+# - CDI (12): % a.d.;  IPCA (433): % a.m.;  SELIC (1178): % a.a. base 252;
+# - câmbio: R$ por unidade da moeda (PTAX venda);  SOFR (FRED): % a.a.
+SERIES_BACEN = {
+    "CDI": 12,
+    "IPCA": 433,
+    "SELIC": 1178,
+    "USD": 1,
+    "EUR": 21619,
+    "GBP": 21623,
+    "JPY": 21621,
+}
+
+SERIES_FRED = {
+    "SOFR": "SOFR",
+}
+
+DATA_INICIAL_PADRAO = dt.date(1980, 1, 1)
+
+# A API SGS limita consultas de séries diárias a janelas de 10 anos
+ANOS_POR_CONSULTA_SGS = 10
+
+
+# ===============================
+# 🔹 Download das fontes
+# ===============================
+
+def baixar_sgs(codigo: int, inicio: dt.date, fim: dt.date, url_base: str = URL_SGS) -> pd.Series:
+    """
+    Baixa a série SGS do Bacen entre 'inicio' e 'fim' (inclusive),
+    em janelas de até 10 anos. Janelas sem dados são ignoradas.
+    """
+    partes = []
+    janela_inicio = inicio
+    while janela_inicio <= fim:
+        janela_fim = min(
+            fim,
+            dt.date(janela_inicio.year + ANOS_POR_CONSULTA_SGS, janela_inicio.month, 1) - dt.timedelta(days=1),
+        )
+        r = requests.get(
+            url_base.format(codigo=codigo),
+            params={
+                "formato": "json",
+                "dataInicial": janela_inicio.strftime("%d/%m/%Y"),
+                "dataFinal": janela_fim.strftime("%d/%m/%Y"),
+            },
+            timeout=30,
+        )
+        # 404 = nenhuma observação na janela
+        if r.status_code != 404:
+            r.raise_for_status()
+            dados = r.json()
+            if dados:
+                partes.append(pd.DataFrame(dados))
+
+        janela_inicio = janela_fim + dt.timedelta(days=1)
+
+    if not partes:
+        return pd.Series(dtype=float)
+
+    df = pd.concat(partes, ignore_index=True)
+    datas = pd.to_datetime(df["data"], format="%d/%m/%Y")
+    valores = pd.to_numeric(df["valor"].astype(str).str.replace(",", "."), errors="coerce")
+    return pd.Series(valores.to_numpy(), index=datas).dropna()
+
+
+def baixar_fred(serie: str, inicio: dt.date, fim: dt.date, url_base: str = URL_FRED, api_key: str | None = None) -> pd.Series:
+    """
+    Baixa a série do FRED entre 'inicio' e 'fim' (inclusive).
+    Observações sem valor ('.') são descartadas.
+    """
+    if api_key is None:
+        api_key = os.environ.get("FRED_API_KEY", "fred")
+
+    r = requests.get(
+        url_base,
+        params={
+            "series_id": serie,
+            "api_key": api_key,
+            "file_type": "json",
+            "observation_start": inicio.isoformat(),
+            "observation_end": fim.isoformat(),
+        },
+        timeout=30,
+    )
+    r.raise_for_status()
+    obs = r.json().get("observations", [])
+    if not obs:
+        return pd.Series(dtype=float)
+
+    df = pd.DataFrame(obs)
+    valores = pd.to_numeric(df["value"], errors="coerce")
+    return pd.Series(valores.to_numpy(), index=pd.to_datetime(df["date"])).dropna()
+
+
+# ===============================
+# 🔹 Armazém local colunar
+# ===============================
+
+def _dia(data) -> int:
+    """Data → número de dias desde 1970-01-01 (formato da coluna de datas)."""
+    return int(np.datetime64(pd.Timestamp(data).date(), "D").astype(np.int64))
+
+
+class ArmazemSeries:
+    """
+    Histórico diário completo das séries de mercado em disco.
+
+    - Cada série são duas colunas binárias só de acréscimo
+      (<nome>.datas.i8 com dias desde 1970-01-01 e <nome>.valores.f8),
+      lidas por memória mapeada: leituras por intervalo não carregam o arquivo.
+    - 'atualizar' busca na fonte apenas as datas posteriores à última
+      observação guardada e acrescenta ao fim dos arquivos.
+    - URLs das fontes configuráveis (ex.: stub local da API SGS em testes).
+    """
+
+    def __init__(
+        self,
+        diretorio: str = DIRETORIO_HISTORICO,
+        url_sgs: str = URL_SGS,
+        url_fred: str = URL_FRED,
+        api_key_fred: str | None = None,
+    ):
+        self.diretorio = diretorio
+        self.url_sgs = url_sgs
+        self.url_fred = url_fred
+        self.api_key_fred = api_key_fred
+        os.makedirs(diretorio, exist_ok=True)
+
+    # -------------------------
+    # Arquivos
+    # -------------------------
+
+    def _caminhos(self, nome: str) -> tuple[str, str]:
+        base = os.path.join(self.diretorio, nome.upper())
+        return base + ".datas.i8", base + ".valores.f8"
+
+    def _colunas(self, nome: str) -> tuple[np.ndarray, np.ndarray]:
+        """Colunas (datas em dias, valores) mapeadas em memória, só leitura."""
+        caminho_datas, caminho_valores = self._caminhos(nome)
+        if not os.path.exists(caminho_datas) or not os.path.exists(caminho_valores):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        # Usa o menor tamanho: gravação interrompida no meio (corrigida no próximo acréscimo)
+        n = min(os.path.getsize(caminho_datas), os.path.getsize(caminho_valores)) // 8
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        datas = np.memmap(caminho_datas, dtype=np.int64, mode="r", shape=(n,))
+        valores = np.memmap(caminho_valores, dtype=np.float64, mode="r", shape=(n,))
+        return datas, valores
+
+    def _alinhar(self, nome: str) -> None:
+        """
+        Corta as duas colunas no comprimento comum (em observações inteiras):
+        desfaz o que uma gravação interrompida deixou a mais em uma delas,
+        antes que o próximo acréscimo desalinhe datas e valores.
+        """
+        caminhos = [c for c in self._caminhos(nome) if os.path.exists(c)]
+        tamanhos = [os.path.getsize(c) for c in caminhos]
+        # coluna que nem chegou a ser criada conta como vazia
+        comum = min(tamanhos) // 8 * 8 if len(caminhos) == 2 else 0
+        for caminho, tamanho in zip(caminhos, tamanhos):
+            if tamanho != comum:
+                os.truncate(caminho, comum)
+
+    def _acrescentar(self, nome: str, serie: pd.Series) -> None:
+        caminho_datas, caminho_valores = self._caminhos(nome)
+        dias = serie.index.values.astype("datetime64[D]").astype(np.int64)
+        valores = serie.to_numpy(dtype=np.float64)
+
+        self._alinhar(nome)
+        with open(caminho_valores, "ab") as f:
+            valores.tofile(f)
+        with open(caminho_datas, "ab") as f:
+            dias.tofile(f)
+
+    # -------------------------
+    # Consulta
+    # -------------------------
+
+    def series_disponiveis(self) -> list[str]:
+        return sorted(
+            arq[: -len(".datas.i8")]
+            for arq in os.listdir(self.diretorio)
+            if arq.endswith(".datas.i8")
+        )
+
+    def ultima_data(self, nome: str) -> dt.date | None:
+        """Data da última observação guardada (None se a série está vazia)."""
+        datas, _ = self._colunas(nome)
+        if datas.size == 0:
+            return None
+        return np.datetime64(int(datas[-1]), "D").astype(dt.date)
+
+    def ler(self, nome: str, inicio=None, fim=None) -> pd.Series:
+        """
+        Lê a série no intervalo [inicio, fim] (datas opcionais).
+        Localiza o intervalo por busca binária na coluna de datas mapeada.
+        """
+        datas, valores = self._colunas(nome)
+
+        i = 0 if inicio is None else int(np.searchsorted(datas, _dia(inicio), side="left"))
+        j = datas.size if fim is None else int(np.searchsorted(datas, _dia(fim), side="right"))
+
+        indice = pd.DatetimeIndex(np.asarray(datas[i:j]).astype("datetime64[D]"), name="Data")
+        return pd.Series(np.array(valores[i:j]), index=indice, name=nome.upper())
+
+    def ler_varias(self, nomes, inicio=None, fim=None) -> pd.DataFrame:
+        """Lê várias séries no mesmo intervalo, alinhadas por data (uma coluna por série)."""
+        return pd.concat([self.ler(nome, inicio, fim) for nome in nomes], axis=1).sort_index()
+
+    # -------------------------
+    # Atualização incremental
+    # -------------------------
+
+    def atualizar(self, nome: str, ate: dt.date | None = None) -> int:
+        """
+        Busca na fonte as observações posteriores à última guardada e
+        acrescenta ao armazém. Retorna o número de observações novas.
+        Erros de rede são propagados; o que já está em disco não é alterado.
+        """
+        nome = nome.upper()
+        if ate is None:
+            ate = dt.date.today()
+
+        ultima = self.ultima_data(nome)
+        inicio = DATA_INICIAL_PADRAO if ultima is None else ultima + dt.timedelta(days=1)
+        if inicio > ate:
+            return 0
+
+        if nome in SERIES_BACEN:
+            novas = baixar_sgs(SERIES_BACEN[nome], inicio, ate, url_base=self.url_sgs)
+        elif nome in SERIES_FRED:
+            novas = baixar_fred(SERIES_FRED[nome], inicio, ate, url_base=self.url_fred, api_key=self.api_key_fred)
+        else:
+            raise ValueError(f"Série desconhecida: {nome}")
+
+        novas = novas[~novas.index.duplicated(keep="last")].sort_index()
+        if ultima is not None:
+            novas = novas[novas.index > pd.Timestamp(ultima)]
+
+        if not novas.empty:
+            self._acrescentar(nome, novas)
+        return len(novas)
+
+    def atualizar_todas(self, ate: dt.date | None = None) -> dict[str, int | None]:
+        """
+        Atualiza todas as séries conhecidas (Bacen e FRED).
+        Retorna o número de observações novas por série (None se a fonte falhou).
+        """
+        resultado = {}
+        for nome in list(SERIES_BACEN) + list(SERIES_FRED):
+            try:
+                resultado[nome] = self.atualizar(nome, ate=ate)
+            except Exception:
+                resultado[nome] = None
+        return resultado
@@ -0,0 +1,180 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+# Colunas do fluxo que viram matriz (nome do atributo → coluna do fluxo)
+MEDIDAS = {
+    "pagamento": "Pagamento",
+    "juros": "Juros",
+    "amortizacao": "Amortização",
+    "saldo": "Saldo_Devedor",
+}
+
+# Atributos de contrato usados para fatiar a carteira
+ATRIBUTOS = ["Tipo", "Moeda", "Indexador", "Sistema_Amortização"]
+
+
+@dataclass
+class MatrizesCarteira:
+    """
+    Fluxos da carteira em matrizes densas contratos × meses (em BRL),
+    numa grade mensal comum a todos os contratos:
+    - pagamento, juros, amortizacao: valores pagos em cada mês;
+    - saldo: saldo devedor ao fim de cada mês (do mês da liberação até o
+      último pagamento; entre pagamentos semestrais, o último saldo).
+
+    'contratos' traz uma linha por linha das matrizes (ID e atributos);
+    'meses' é a grade (datetime64[M]). Estoque, muro de vencimentos e
+    recortes por qualquer subconjunto de contratos são reduções de arrays.
+    """
+    contratos: pd.DataFrame
+    meses: np.ndarray
+    pagamento: np.ndarray
+    juros: np.ndarray
+    amortizacao: np.ndarray
+    saldo: np.ndarray
+
+    # -------------------------
+    # Seleção de contratos
+    # -------------------------
+
+    def selecionar(self, **filtros) -> np.ndarray:
+        """
+        Máscara de contratos por atributo, ex.: selecionar(Tipo="Novo",
+        Moeda=["USD", "EUR"]). Sem filtros, todos.
+        """
+        mascara = np.ones(len(self.contratos), dtype=bool)
+        for coluna, valores in filtros.items():
+            if valores is None:
+                continue
+            if isinstance(valores, (str, int, float)):
+                valores = [valores]
+            mascara &= self.contratos[coluna].isin(list(valores)).to_numpy()
+        return mascara
+
+    def _linhas(self, contratos) -> np.ndarray | slice:
+        return slice(None) if contratos is None else np.asarray(contratos)
+
+    # -------------------------
+    # Reduções
+    # -------------------------
+
+    def total_mensal(self, medida: str = "pagamento", contratos=None) -> pd.Series:
+        """Soma de 'medida' no mês, sobre os contratos escolhidos (máscara ou posições)."""
+        valores = getattr(self, medida)[self._linhas(contratos)].sum(axis=0)
+        return pd.Series(valores, index=pd.DatetimeIndex(self.meses.astype("datetime64[us]"), name="Mes"), name=medida)
+
+    def total_anual(self, medida: str = "pagamento", contratos=None) -> pd.Series:
+        """Soma anual de um fluxo (pagamento, juros, amortizacao)."""
+        mensal = getattr(self, medida)[self._linhas(contratos)].sum(axis=0)
+        anos = self.meses.astype("datetime64[Y]").astype(np.int64) + 1970
+        inicio = np.flatnonzero(np.concatenate([[True], anos[1:] != anos[:-1]])) if anos.size else anos
+        return pd.Series(
+            np.add.reduceat(mensal, inicio) if anos.size else mensal,
+            index=pd.Index(anos[inicio], name="Ano"),
+            name=medida,
+        )
+
+    def estoque(self, contratos=None) -> pd.Series:
+        """Saldo devedor da carteira ao fim de cada mês."""
+        return self.total_mensal("saldo", contratos)
+
+    def muro_vencimentos(self, contratos=None) -> pd.Series:
+        """Amortizações por ano (quanto do principal vence em cada ano)."""
+        return self.total_anual("amortizacao", contratos)
+
+    def por_atributo(self, medida: str, atributo: str, contratos=None) -> pd.DataFrame:
+        """
+        'medida' mensal por valor de 'atributo' (colunas = grupos), numa
+        única multiplicação indicadora de grupos × matriz.
+        """
+        linhas = self._linhas(contratos)
+        codigos, grupos = pd.factorize(self.contratos[atributo].to_numpy()[linhas])
+        indicadora = np.zeros((len(grupos), codigos.size))
+        indicadora[codigos, np.arange(codigos.size)] = 1.0
+        valores = indicadora @ getattr(self, medida)[linhas]
+        return pd.DataFrame(
+            valores.T,
+            index=pd.DatetimeIndex(self.meses.astype("datetime64[us]"), name="Mes"),
+            columns=pd.Index(grupos, name=atributo),
+        )
+
+
+def montar_matrizes(resumo: pd.DataFrame, fluxo: pd.DataFrame) -> MatrizesCarteira:
+    """
+    Matrizes contratos × meses a partir das saídas de rodar_modelo
+    (resumo e fluxo, também de rodadas reabertas do armazém).
+
+    Cada linha do fluxo cai na célula (contrato, mês) por aritmética de
+    índices, sem groupby. O saldo é propagado entre pagamentos e, antes do
+    primeiro, vale o saldo de abertura desde o mês da liberação.
+    """
+    contratos = resumo.drop_duplicates("ID").reset_index(drop=True)
+    for coluna in ATRIBUTOS:
+        if coluna not in contratos.columns:
+            contratos[coluna] = "—"
+    contratos = contratos[["ID"] + ATRIBUTOS + [c for c in ["Data_liberacao"] if c in contratos.columns]]
+
+    datas = fluxo["Data"]
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas)
+    mes_pagamento = datas.to_numpy().astype("datetime64[M]")
+
+    linha = pd.Index(contratos["ID"]).get_indexer(fluxo["ID"])
+    if (linha < 0).any():
+        raise ValueError("Fluxo com contratos que não estão no resumo.")
+
+    if "Data_liberacao" in contratos.columns:
+        mes_liberacao = pd.to_datetime(contratos["Data_liberacao"]).to_numpy().astype("datetime64[M]")
+    else:
+        mes_liberacao = np.full(len(contratos), np.datetime64("NaT"), dtype="datetime64[M]")
+
+    todos = np.concatenate([mes_pagamento, mes_liberacao[~np.isnat(mes_liberacao)]])
+    if todos.size == 0:
+        vazio = np.zeros((len(contratos), 0))
+        return MatrizesCarteira(contratos, np.array([], dtype="datetime64[M]"), vazio, vazio, vazio, vazio)
+
+    primeiro, ultimo = todos.min(), todos.max()
+    meses = np.arange(primeiro, ultimo + 1)
+    n, m = len(contratos), meses.size
+    coluna = (mes_pagamento - primeiro).astype(np.int64)
+    celula = linha * m + coluna
+
+    def densa(valores: np.ndarray) -> np.ndarray:
+        return np.bincount(celula, weights=valores, minlength=n * m).reshape(n, m)
+
+    matrizes = {
+        nome: densa(fluxo[col].to_numpy(dtype=float))
+        for nome, col in MEDIDAS.items()
+        if nome != "saldo"
+    }
+
+    # Saldo: valor no mês do pagamento, propagado até o próximo pagamento
+    ordem = np.argsort(datas.to_numpy(), kind="stable")
+    saldo_pagamento = np.full(n * m, np.nan)
+    saldo_pagamento[celula[ordem]] = fluxo["Saldo_Devedor"].to_numpy(dtype=float)[ordem]
+    saldo_pagamento = saldo_pagamento.reshape(n, m)
+
+    tem = ~np.isnan(saldo_pagamento)
+    ultimo_pagamento = np.maximum.accumulate(np.where(tem, np.arange(m)[None, :], -1), axis=1)
+    saldo = np.where(
+        ultimo_pagamento >= 0,
+        saldo_pagamento[np.arange(n)[:, None], np.maximum(ultimo_pagamento, 0)],
+        0.0,
+    )
+
+    # Antes do primeiro pagamento: saldo de abertura (saldo + amortização do 1º pagamento)
+    primeira = np.where(tem.any(axis=1), tem.argmax(axis=1), -1)
+    com_fluxo = primeira >= 0
+    abertura = np.zeros(n)
+    abertura[com_fluxo] = (
+        saldo_pagamento[com_fluxo, primeira[com_fluxo]] + matrizes["amortizacao"][com_fluxo, primeira[com_fluxo]]
+    )
+    inicio = np.where(np.isnat(mes_liberacao), meses[0], mes_liberacao)
+    inicio = (inicio - primeiro).astype(np.int64)
+    antes = (np.arange(m)[None, :] >= inicio[:, None]) & (np.arange(m)[None, :] < primeira[:, None])
+    saldo = np.where(antes, abertura[:, None], saldo)
+
+    return MatrizesCarteira(contratos=contratos, meses=meses, saldo=saldo, **matrizes)
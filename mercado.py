@@ -1,18 +1,38 @@
-import requests
+import datetime as dt
 import json
 import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+
+import requests
 
 
 CACHE_FILE = "cache_mercado.json"
 
+# Disjuntor: após uma falha, a fonte fica "aberta" (sem chamadas de rede)
+# por uma janela que dobra a cada nova falha, até o máximo
+BACKOFF_INICIAL_S = 30.0
+BACKOFF_MAXIMO_S = 15 * 60.0
+
+# Nomes das fontes para exibição (chave do cache → nome)
+NOMES_FONTES = {"12": "CDI", "433": "IPCA", "1178": "SELIC", "SOFR": "SOFR"}
+
+_TRAVA_CACHE = threading.Lock()
+
 
 # ===============================
 # 🔹 Sistema de CACHE LOCAL
 # ===============================
 
 def salvar_cache(dados: dict) -> None:
-    with open(CACHE_FILE, "w") as f:
+    # grava em arquivo temporário e troca: a nova tentativa em segundo
+    # plano e a sessão podem gravar ao mesmo tempo
+    temporario = f"{CACHE_FILE}.{uuid.uuid4().hex}.tmp"
+    with open(temporario, "w") as f:
         json.dump(dados, f)
+    os.replace(temporario, CACHE_FILE)
 
 
 def carregar_cache() -> dict:
@@ -25,6 +45,176 @@ def carregar_cache() -> dict:
     return {}
 
 
+def _gravar_no_cache(chave: str, valor: float) -> None:
+    """
+    Guarda o valor lido e quando foi lido (em '_atualizado'). O cache é
+    só reserva: se não der para gravar (pasta somente leitura, disco
+    cheio), o valor lido continua valendo.
+    """
+    with _TRAVA_CACHE:
+        cache = carregar_cache()
+        cache[chave] = valor
+        cache.setdefault("_atualizado", {})[chave] = dt.datetime.now().isoformat(timespec="seconds")
+        try:
+            salvar_cache(cache)
+        except OSError:
+            pass
+
+
+# ===============================
+# 🔹 Disjuntor por fonte (circuit breaker)
+# ===============================
+
+@dataclass
+class EstadoFonte:
+    """Situação de uma fonte de mercado e de onde veio o último valor servido."""
+    origem: str = "api"  # "api", "cache" ou "padrão"
+    atualizado_em: str | None = None
+    falhas: int = 0
+    aberto_ate: float = 0.0  # time.monotonic()
+    proxima_tentativa: str | None = None
+    religando: bool = False
+
+
+class Disjuntor:
+    """
+    Disjuntor por fonte (endpoint). Fechado: chamadas normais. Após uma
+    falha, abre por BACKOFF_INICIAL_S (dobrando a cada falha seguida, até
+    BACKOFF_MAXIMO_S): enquanto aberto, os pegar_* devolvem cache ou valor
+    padrão na hora, sem esperar timeout, e uma thread em segundo plano
+    tenta a fonte de novo ao fim da janela (até ela conseguir, só essa
+    thread chama a fonte).
+    """
+
+    def __init__(self):
+        self._estados: dict[str, EstadoFonte] = {}
+        self._trava = threading.Lock()
+
+    def _estado(self, chave: str) -> EstadoFonte:
+        return self._estados.setdefault(chave, EstadoFonte())
+
+    def fechado(self, chave: str) -> bool:
+        """
+        Pode chamar a fonte? Com a thread de religamento ativa o disjuntor
+        fica meio aberto: mesmo após a janela, só ela chama a fonte, e
+        quem está em primeiro plano continua recebendo a reserva.
+        """
+        with self._trava:
+            estado = self._estado(chave)
+            return not estado.religando and time.monotonic() >= estado.aberto_ate
+
+    def espera(self, chave: str) -> float:
+        with self._trava:
+            return max(self._estado(chave).aberto_ate - time.monotonic(), 0.0)
+
+    def registrar_sucesso(self, chave: str) -> None:
+        with self._trava:
+            estado = self._estado(chave)
+            estado.origem = "api"
+            estado.atualizado_em = dt.datetime.now().isoformat(timespec="seconds")
+            estado.falhas = 0
+            estado.aberto_ate = 0.0
+            estado.proxima_tentativa = None
+
+    def registrar_falha(self, chave: str) -> None:
+        with self._trava:
+            estado = self._estado(chave)
+            estado.falhas += 1
+            janela = min(BACKOFF_INICIAL_S * 2 ** (estado.falhas - 1), BACKOFF_MAXIMO_S)
+            estado.aberto_ate = time.monotonic() + janela
+            estado.proxima_tentativa = (dt.datetime.now() + dt.timedelta(seconds=janela)).isoformat(timespec="seconds")
+
+    def registrar_reserva(self, chave: str, origem: str, atualizado_em: str | None) -> None:
+        with self._trava:
+            estado = self._estado(chave)
+            estado.origem = origem
+            estado.atualizado_em = atualizado_em
+
+    def religar_em_segundo_plano(self, chave: str, buscar) -> None:
+        """Uma thread por fonte: tenta de novo ao fim de cada janela até a fonte voltar."""
+        with self._trava:
+            estado = self._estado(chave)
+            if estado.religando:
+                return
+            estado.religando = True
+
+        def tentar():
+            # religando volta a False mesmo se algo falhar fora da busca:
+            # senão o disjuntor ficaria meio aberto para sempre
+            try:
+                while True:
+                    time.sleep(self.espera(chave))
+                    try:
+                        valor = buscar()
+                    except Exception:
+                        self.registrar_falha(chave)
+                        continue
+                    self.registrar_sucesso(chave)
+                    _gravar_no_cache(chave, valor)
+                    return
+            finally:
+                with self._trava:
+                    self._estado(chave).religando = False
+
+        threading.Thread(target=tentar, name=f"religar-{chave}", daemon=True).start()
+
+    def situacao(self) -> dict[str, dict]:
+        with self._trava:
+            return {
+                chave: {k: v for k, v in asdict(estado).items() if k not in ("aberto_ate", "religando")}
+                for chave, estado in self._estados.items()
+            }
+
+
+DISJUNTOR = Disjuntor()
+
+
+def _valor_reserva(chave: str, fallback: float) -> float:
+    """Valor do cache local ou, sem cache, o padrão; registra a origem."""
+    cache = carregar_cache()
+    if chave in cache:
+        DISJUNTOR.registrar_reserva(chave, "cache", cache.get("_atualizado", {}).get(chave))
+        return cache[chave]
+    DISJUNTOR.registrar_reserva(chave, "padrão", None)
+    return fallback
+
+
+def _consultar(chave: str, buscar, fallback: float) -> float:
+    """
+    Lê a fonte 'chave' com 'buscar()' protegida pelo disjuntor: com o
+    disjuntor aberto não há chamada de rede; em caso de falha, abre o
+    disjuntor, agenda nova tentativa em segundo plano e serve a reserva.
+    """
+    if not DISJUNTOR.fechado(chave):
+        return _valor_reserva(chave, fallback)
+
+    try:
+        valor = buscar()
+    except Exception:
+        DISJUNTOR.registrar_falha(chave)
+        DISJUNTOR.religar_em_segundo_plano(chave, buscar)
+        return _valor_reserva(chave, fallback)
+
+    _gravar_no_cache(chave, valor)
+    DISJUNTOR.registrar_sucesso(chave)
+    return valor
+
+
+def nome_fonte(chave: str) -> str:
+    if chave.startswith("FX_"):
+        return f"Câmbio {chave[3:]}"
+    return NOMES_FONTES.get(chave, chave)
+
+
+def situacao_fontes() -> dict[str, dict]:
+    """
+    Situação de cada fonte já consultada, por nome (CDI, SOFR, Câmbio USD...):
+    origem do último valor ("api", "cache" ou "padrão"), quando foi lido
+    da fonte ('atualizado_em'), falhas seguidas e próxima tentativa.
+    """
+    return {nome_fonte(chave): estado for chave, estado in DISJUNTOR.situacao().items()}
+
+
 # ===============================
 # 🔹 BACEN API com proteção
 # ===============================
@@ -33,14 +223,11 @@ def pegar_serie_bacen(codigo: int, fallback: float) -> float:
     """
     Retorna taxa da série do Bacen em base 1.0 (ex.: 0.13 = 13% ao ano).
 
-    Se falhar:
+    Se falhar (ou se o disjuntor da série estiver aberto):
     - Tenta cache local.
     - Se não houver, devolve fallback informado.
     """
-    cache = carregar_cache()
-    chave = str(codigo)
-
-    try:
+    def buscar() -> float:
         url = (
             f"https://api.bcb.gov.br/dados/serie/bcdata.sgs."
             f"{codigo}/dados/ultimos/1?formato=json"
@@ -59,15 +246,9 @@ def pegar_serie_bacen(codigo: int, fallback: float) -> float:
         # substitui pelo fallback.
         if valor < 0.01:  # menor que 1% a.a. é claramente irreal
             valor = fallback
-
-        cache[chave] = valor
-        salvar_cache(cache)
-
         return valor
-    except Exception:
-        if chave in cache:
-            return cache[chave]
-        return fallback
+
+    return _consultar(str(codigo), buscar, fallback)
 
 
 # ===============================
@@ -79,8 +260,6 @@ def pegar_cambio(moeda: str) -> float:
     if moeda == "BRL":
         return 1.0
 
-    cache = carregar_cache()
-
     codigos = {
         "USD": 1,
         "EUR": 21619,
@@ -90,9 +269,9 @@ def pegar_cambio(moeda: str) -> float:
 
     codigo = codigos.get(moeda)
     if codigo is None:
-        return cache.get(f"FX_{moeda}", 5.0)
+        return _valor_reserva(f"FX_{moeda}", 5.0)
 
-    try:
+    def buscar() -> float:
         url = (
             f"https://api.bcb.gov.br/dados/serie/bcdata.sgs."
             f"{codigo}/dados/ultimos/1?formato=json"
@@ -100,14 +279,9 @@ def pegar_cambio(moeda: str) -> float:
         r = requests.get(url, timeout=5)
         r.raise_for_status()
         bruto = r.json()[0]["valor"]
-        valor = float(bruto.replace(",", "."))
+        return float(bruto.replace(",", "."))
 
-        cache[f"FX_{moeda}"] = valor
-        salvar_cache(cache)
-
-        return valor
-    except Exception:
-        return cache.get(f"FX_{moeda}", 5.0)
+    return _consultar(f"FX_{moeda}", buscar, 5.0)
 
 
 # ===============================
@@ -143,20 +317,79 @@ def pegar_selic() -> float:
 # ===============================
 
 def pegar_sofr() -> float:
-    cache = carregar_cache()
-
-    try:
+    def buscar() -> float:
         url = (
             "https://api.stlouisfed.org/fred/series/observations"
             "?series_id=SOFR&api_key=fred&file_type=json"
         )
         r = requests.get(url, timeout=5)
         r.raise_for_status()
-        valor = float(r.json()["observations"][-1]["value"]) / 100.0
+        return float(r.json()["observations"][-1]["value"]) / 100.0
 
-        cache["SOFR"] = valor
-        salvar_cache(cache)
+    return _consultar("SOFR", buscar, 0.052)
 
-        return valor
-    except Exception:
-        return cache.get("SOFR", 0.052)
+
+# ===============================
+# 🔹 FOTO DO MERCADO (uma leitura por rodada)
+# ===============================
+
+# Juros de referência de cada moeda (a.a., base 1.0) para a paridade de
+# juros: USD usa a SOFR lida na foto do mercado; as demais, valor fixo.
+INDEXADOR_EXTERNO = {"USD": "SOFR"}
+TAXAS_EXTERNAS_REFERENCIA = {
+    "USD": 0.052,
+    "EUR": 0.03,
+    "GBP": 0.045,
+    "JPY": 0.005,
+}
+
+
+@dataclass
+class FotoMercado:
+    """
+    Taxas (base 1.0, sem choques) e câmbios lidos uma única vez por rodada
+    e compartilhados por todos os contratos. 'fontes' guarda de onde veio
+    cada valor no momento da leitura (ver situacao_fontes).
+    """
+    taxas: dict[str, float]
+    cambios: dict[str, float] = field(default_factory=dict)
+    fontes: dict[str, dict] = field(default_factory=dict)
+
+    def taxa(self, indexador: str) -> float:
+        return self.taxas.get(str(indexador).upper(), 0.0)
+
+    def cambio(self, moeda: str) -> float:
+        moeda = str(moeda).upper()
+        if moeda == "BRL":
+            return 1.0
+        if moeda not in self.cambios:
+            self.cambios[moeda] = pegar_cambio(moeda)
+        return self.cambios[moeda]
+
+    def taxa_externa(self, moeda: str) -> float:
+        """Juros de referência da moeda (para câmbio a termo por paridade)."""
+        moeda = str(moeda).upper()
+        indexador = INDEXADOR_EXTERNO.get(moeda)
+        if indexador is not None and indexador in self.taxas:
+            return self.taxas[indexador]
+        return TAXAS_EXTERNAS_REFERENCIA.get(moeda, 0.0)
+
+    def defasadas(self) -> dict[str, dict]:
+        """Fontes desta foto que não vieram da API (cache ou valor padrão)."""
+        return {nome: info for nome, info in self.fontes.items() if info["origem"] != "api"}
+
+
+def foto_mercado(moedas=()) -> FotoMercado:
+    """Lê CDI, IPCA, SELIC, SOFR e o câmbio das moedas informadas."""
+    foto = FotoMercado(
+        taxas={
+            "CDI": pegar_cdi(),
+            "IPCA": pegar_ipca(),
+            "SELIC": pegar_selic(),
+            "SOFR": pegar_sofr(),
+        }
+    )
+    for moeda in moedas:
+        foto.cambio(moeda)
+    foto.fontes = situacao_fontes()
+    return foto
@@ -1,8 +1,20 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import numpy_financial as npf
 
-from engine_divida import simular_contrato
-from cenarios import CenarioMercado
+from engine_divida import agrupar_cronogramas, cronograma_unitario, montar_cronograma, precificar_cronograma
+from cenarios import CENARIOS_PADRAO, CenarioMercado
+from backtest import carregar_historico, curvas_realizadas
+from calendarios import REGRAS_FERIADOS, obter_calendario
+from contagem_dias import BASES_CALCULO, normalizar_base
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao, para_data, para_numero
+from mercado import FotoMercado, foto_mercado
+from risco import COLUNAS_RISCO, SOMAS_RISCO, indicadores_risco, somas_risco
+from sensibilidades import COLUNAS_SENSIBILIDADE, calcular_sensibilidades
 
 
 def _normalizar_colunas(df: pd.DataFrame) -> pd.DataFrame:
@@ -15,100 +27,487 @@ def _normalizar_colunas(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def rodar_modelo(
-    df: pd.DataFrame | None = None,
-    cenario: CenarioMercado | None = None,
-):
+COLUNAS_OBRIGATORIAS = [
+    "Id",
+    "Tipo",
+    "Descrição",
+    "Moeda",
+    "Valor_Contratado",
+]
+
+
+def _insumos_historico(projecoes, cambios, historico):
+    """Modo backtest: troca projeções e câmbios pelos realizados do histórico."""
+    if historico is None:
+        return projecoes, cambios
+
+    if not isinstance(historico, pd.DataFrame):
+        historico = carregar_historico(historico)
+    projecoes_realizadas, cambios_realizados = curvas_realizadas(historico)
+    return {**(projecoes or {}), **projecoes_realizadas}, {**(cambios or {}), **cambios_realizados}
+
+
+def projetar_cambios(moedas, mercado, curva: CurvaDesconto, cambios: dict[str, CurvaCambio] | None = None) -> dict[str, CurvaCambio]:
     """
-    Roda o modelo de dívida para um conjunto de contratos.
+    Completa 'cambios' com o câmbio a termo por paridade de juros (spot da
+    foto do mercado, curva local 'curva' e juros de referência da moeda)
+    para as moedas estrangeiras que ainda não têm curva. Cada curva é
+    calculada uma vez, dia a dia, e aplicada aos vetores de pagamento.
+    """
+    cambios = dict(cambios or {})
+    for moeda in moedas:
+        moeda = str(moeda).upper()
+        if moeda == "BRL" or moeda in cambios:
+            continue
+        cambios[moeda] = CurvaCambio.paridade(
+            moeda,
+            mercado.cambio(moeda),
+            curva,
+            mercado.taxa_externa(moeda),
+        )
+    return cambios
 
-    Espera colunas mínimas:
-    - Id
-    - Tipo
-    - Descrição
-    - Moeda
-    - Valor_Contratado
+
+# =============================
+# 🔹 Validação prévia dos contratos
+# =============================
+
+# Colunas que montar_cronograma lê de cada contrato
+COLUNAS_CRONOGRAMA = [
+    "Data_contratação",
+    "Data_liberacao",
+    "Prazo",
+    "Carencia",
+    "Periodicidade",
+    "Sistema_Amortização",
+    "Indexador",
+    "Spread",
+    "Fator_indexador",
+]
+
+PERIODICIDADES_VALIDAS = (1, 6)
+SISTEMAS_VALIDOS = ("SAC", "PRICE")
+INDEXADORES_VALIDOS = ("CDI", "IPCA", "SELIC", "SOFR", "VARIAÇÃO CAMBIAL")
+
+COLUNAS_RELATORIO = ["Linha", "Id", "Coluna", "Valor", "Erro"]
+
+COLUNAS_NUMERICAS = ["Valor_Contratado", "Prazo", "Carencia", "Periodicidade", "Spread", "Fator_indexador"]
+COLUNAS_DATA = ["Data_contratação", "Data_liberacao"]
+
+# Células vazias que o motor sempre tratou como padrão (sem spread, 100% do indexador)
+PADROES_VAZIOS = {"Spread": 0.0, "Fator_indexador": 1.0}
+
+
+class ErroValidacao(ValueError):
+    """
+    Planilha de contratos com erros. 'relatorio' traz um erro por linha
+    (Linha da planilha, Id, Coluna, Valor, Erro), todos de uma vez.
     """
-    if cenario is None:
-        cenario = CenarioMercado(nome="Base")
 
-    if df is None:
-        df = pd.read_excel("Contratos.xlsx", engine="openpyxl")
+    def __init__(self, relatorio: pd.DataFrame):
+        self.relatorio = relatorio
+        n_contratos = relatorio["Linha"].nunique()
+        exemplos = "; ".join(
+            f"linha {r.Linha}: {r.Coluna} — {r.Erro}" if pd.notna(r.Linha) else f"{r.Coluna} — {r.Erro}"
+            for r in relatorio.head(5).itertuples()
+        )
+        super().__init__(
+            f"Planilha de contratos com {len(relatorio)} erro(s) em {n_contratos} linha(s). {exemplos}"
+        )
 
-    df = _normalizar_colunas(df)
 
-    colunas_obrigatorias = [
-        "Id",
-        "Tipo",
-        "Descrição",
-        "Moeda",
-        "Valor_Contratado",
-    ]
-    faltando = [c for c in colunas_obrigatorias if c not in df.columns]
+def _validos_opcionais(valores: pd.Series, conferir) -> pd.Series:
+    """
+    Máscara de valores aceitos por 'conferir' (que levanta ValueError se
+    inválido), testando cada valor distinto uma única vez.
+    """
+    distintos = valores.dropna().unique()
+    aceitos = set()
+    for v in distintos:
+        try:
+            conferir(v)
+            aceitos.add(v)
+        except ValueError:
+            pass
+    return valores.isna() | valores.isin(aceitos)
+
+
+def normalizar_contratos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cópia de 'df' com números e datas convertidos como a validação os lê:
+    vírgula decimal (para_numero) e datas ISO ou DD/MM/AAAA (para_data).
+    Spread e Fator_indexador vazios recebem os padrões (PADROES_VAZIOS).
+    O motor recebe essa cópia; valores inválidos viram NaN/NaT.
+    """
+    df = df.copy()
+    vazios = {
+        coluna: df[coluna].isna() | (df[coluna].astype(str).str.strip() == "")
+        for coluna in PADROES_VAZIOS
+        if coluna in df.columns
+    }
+    for coluna in COLUNAS_NUMERICAS:
+        if coluna in df.columns:
+            df[coluna] = para_numero(df[coluna])
+    for coluna in COLUNAS_DATA:
+        if coluna in df.columns:
+            df[coluna] = para_data(df[coluna])
+    for coluna, vazio in vazios.items():
+        df.loc[vazio, coluna] = PADROES_VAZIOS[coluna]
+    return df
+
+
+def validar_contratos(df: pd.DataFrame, projecoes: dict[str, CurvaProjecao] | None = None) -> pd.DataFrame:
+    """
+    Confere a planilha inteira antes de simular, coluna a coluna (sem laço
+    por contrato): colunas obrigatórias, tipos, faixas, datas (liberação
+    >= contratação) e valores aceitos (Moeda, Periodicidade,
+    Sistema_Amortização, Indexador e, se existirem, Base_Calculo e
+    Calendario). Indexadores com curva em 'projecoes' também são aceitos;
+    Spread e Fator_indexador vazios valem 0 e 1 (PADROES_VAZIOS).
+
+    Retorna o relatório de erros (vazio se a planilha está ok), uma linha
+    por problema; 'Linha' é a linha na planilha (cabeçalho = linha 1).
+    """
+    obrigatorias = COLUNAS_OBRIGATORIAS if df.empty else COLUNAS_OBRIGATORIAS + COLUNAS_CRONOGRAMA
+    faltando = [c for c in obrigatorias if c not in df.columns]
     if faltando:
-        raise ValueError(f"Planilha de contratos sem colunas obrigatórias: {faltando}")
+        return pd.DataFrame(
+            {"Linha": None, "Id": None, "Coluna": faltando, "Valor": None, "Erro": "coluna obrigatória ausente"},
+            columns=COLUNAS_RELATORIO,
+        )
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_RELATORIO)
+
+    texto = {c: df[c].astype(str).str.strip().str.upper() for c in ["Moeda", "Sistema_Amortização", "Indexador"]}
+    normalizados = normalizar_contratos(df)
+    numeros = {c: normalizados[c] for c in COLUNAS_NUMERICAS}
+    contratacao = normalizados["Data_contratação"]
+    liberacao = normalizados["Data_liberacao"]
+
+    def fracionario(c):
+        return numeros[c].notna() & (numeros[c] != numeros[c].round())
+
+    indexadores = set(INDEXADORES_VALIDOS) | {str(k).upper() for k in (projecoes or {})}
+    ids = df["Id"]
+
+    # (máscara de linhas com erro, coluna, mensagem)
+    regras = [
+        (ids.isna() | (ids.astype(str).str.strip() == ""), "Id", "vazio"),
+        (ids.notna() & ids.duplicated(keep=False), "Id", "repetido"),
+        (~texto["Moeda"].str.fullmatch(r"[A-Z]{3}"), "Moeda", "código de moeda inválido (ex.: BRL, USD)"),
+        (numeros["Valor_Contratado"].isna(), "Valor_Contratado", "não numérico ou vazio"),
+        (numeros["Valor_Contratado"] <= 0, "Valor_Contratado", "deve ser positivo"),
+        (contratacao.isna(), "Data_contratação", "data inválida ou vazia"),
+        (liberacao.isna(), "Data_liberacao", "data inválida ou vazia"),
+        (liberacao < contratacao, "Data_liberacao", "anterior à Data_contratação"),
+        (numeros["Prazo"].isna(), "Prazo", "não numérico ou vazio"),
+        (fracionario("Prazo"), "Prazo", "deve ser inteiro"),
+        (numeros["Prazo"] < 1, "Prazo", "deve ser ao menos 1"),
+        (numeros["Carencia"].isna(), "Carencia", "não numérico ou vazio"),
+        (fracionario("Carencia"), "Carencia", "deve ser inteiro"),
+        (numeros["Carencia"] < 0, "Carencia", "não pode ser negativa"),
+        (numeros["Carencia"] >= numeros["Prazo"], "Carencia", "deve ser menor que o Prazo"),
+        (~numeros["Periodicidade"].isin(PERIODICIDADES_VALIDAS), "Periodicidade", f"deve ser um de {list(PERIODICIDADES_VALIDAS)}"),
+        (~texto["Sistema_Amortização"].isin(SISTEMAS_VALIDOS), "Sistema_Amortização", f"deve ser um de {list(SISTEMAS_VALIDOS)}"),
+        (~texto["Indexador"].isin(indexadores), "Indexador", f"sem taxa de mercado nem projeção (aceitos: {sorted(indexadores)})"),
+        (numeros["Spread"].isna(), "Spread", "não numérico"),
+        (numeros["Spread"] <= -1, "Spread", "deve ser maior que -100%"),
+        (numeros["Fator_indexador"].isna(), "Fator_indexador", "não numérico"),
+        (numeros["Fator_indexador"] < 0, "Fator_indexador", "não pode ser negativo"),
+    ]
+    if "Base_Calculo" in df.columns:
+        regras.append((~_validos_opcionais(df["Base_Calculo"], normalizar_base), "Base_Calculo", f"deve ser uma de {list(BASES_CALCULO)}"))
+    if "Calendario" in df.columns:
+        regras.append((~_validos_opcionais(df["Calendario"], obter_calendario), "Calendario", f"use {sorted(REGRAS_FERIADOS)}, combinados com '+'"))
+
+    partes = []
+    for mascara, coluna, erro in regras:
+        linhas = np.flatnonzero(mascara.to_numpy(dtype=bool))
+        if linhas.size:
+            partes.append(
+                pd.DataFrame(
+                    {
+                        "Linha": linhas + 2,
+                        "Id": ids.to_numpy()[linhas],
+                        "Coluna": coluna,
+                        "Valor": df[coluna].to_numpy(dtype=object)[linhas],
+                        "Erro": erro,
+                    }
+                )
+            )
+
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS_RELATORIO)
+    return pd.concat(partes, ignore_index=True).sort_values(["Linha", "Coluna"], kind="stable", ignore_index=True)
+
+
+def _exigir_contratos_validos(df: pd.DataFrame, projecoes=None) -> pd.DataFrame:
+    """Valida 'df' (ErroValidacao se houver erros) e o devolve normalizado (normalizar_contratos)."""
+    relatorio = validar_contratos(df, projecoes)
+    if not relatorio.empty:
+        raise ErroValidacao(relatorio)
+    return normalizar_contratos(df)
+
+
+def _resultado_vazio():
+    resumo = pd.DataFrame(
+        columns=[
+            "ID",
+            "Tipo",
+            "Descrição",
+            "Moeda",
+            "Indexador",
+            "Sistema_Amortização",
+            "Valor_Contratado",
+            "Custo_Total",
+            "TIR",
+            "VPL",
+            "Data_liberacao",
+        ]
+        + COLUNAS_RISCO
+    )
+    fluxo = pd.DataFrame(columns=["ID", "Data", "Pagamento"])
+    carteira = pd.DataFrame(
+        [
+            {"Tipo": tipo, "Custo_Total": 0, "VPL": 0, "TIR": 0, **dict.fromkeys(COLUNAS_RISCO, 0)}
+            for tipo in ["Antigo", "Novo", "Diferença"]
+        ]
+    )
+    fluxo_anual = pd.DataFrame(columns=["Ano", "Tipo", "Pagamento"])
+    fluxo_mensal = pd.DataFrame(columns=["Data", "Tipo", "Pagamento"])
+    ranking = pd.DataFrame()
+    return resumo, fluxo, carteira, fluxo_anual, fluxo_mensal, ranking
 
-    resultados = []
-    fluxos = []
 
-    # =============================
-    # 🔹 Simulação contrato a contrato
-    # =============================
-    for _, row in df.iterrows():
-        fluxo_df, tir, vpl = simular_contrato(row, cenario=cenario)
+# =============================
+# 🔹 Progresso e cancelamento
+# =============================
+
+class RodadaCancelada(Exception):
+    """A rodada foi interrompida pelo evento 'cancelar'."""
+
+
+def passos_rodada(n_contratos: int, n_cenarios: int = 1, sensibilidades: bool = True) -> int:
+    """
+    Total de passos do progresso de uma rodada: cada contrato conta uma vez
+    na precificação e, com 'sensibilidades', outra no cálculo de DV01 e
+    delta câmbio (feito depois, em lote).
+    """
+    return n_contratos * n_cenarios * (2 if sensibilidades else 1)
+
+
+def _acompanhamento(total: int, progresso=None, cancelar: threading.Event | None = None):
+    """
+    Função avancar(n=1), chamada a cada n passos concluídos (ver
+    passos_rodada): levanta RodadaCancelada se 'cancelar' foi acionado e
+    informa progresso(feitos, total). Segura entre threads (cenários em
+    paralelo contam no mesmo total).
+    """
+    if progresso is None and cancelar is None:
+        return None
+
+    trava = threading.Lock()
+    feitos = 0
+
+    def avancar(n: int = 1):
+        nonlocal feitos
+        if cancelar is not None and cancelar.is_set():
+            raise RodadaCancelada("Rodada cancelada.")
+        with trava:
+            feitos += n
+            n = feitos
+        if progresso is not None:
+            progresso(n, total)
+
+    return avancar
+
+
+def _montar_cronogramas(df: pd.DataFrame) -> list:
+    """Cronogramas (datas e dias, independentes de taxas) de cada contrato de 'df'."""
+    return [montar_cronograma(row) for _, row in df.iterrows()]
+
+
+# =============================
+# 🔹 Simulação de um lote de contratos
+# =============================
+
+def _simular_lote(
+    df: pd.DataFrame,
+    cenario: CenarioMercado,
+    curva: CurvaDesconto,
+    projecoes,
+    cambios,
+    mercado,
+    sensibilidades: bool,
+    cronogramas: list | None = None,
+    avancar=None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Simula os contratos de 'df' e devolve (resumo, fluxo) do lote,
+    com VPL (e sensibilidades) já calculados em lote.
+    'cronogramas' (opcional): os de _montar_cronogramas(df), já prontos
+    (não dependem do cenário; reaproveitados entre cenários).
+    'avancar' (opcional): chamada a cada contrato precificado e, com
+    'sensibilidades', de novo ao fim delas (ver passos_rodada).
+
+    O fluxo é linear no principal: contratos com termos idênticos (datas,
+    prazo, carência, sistema, indexador, spread, moeda...) que só diferem
+    no Valor_Contratado são precificados uma vez, com principal 1, e o
+    fluxo unitário é escalado por contrato. TIR é a do grupo; VPL,
+    custo, fluxos e sensibilidades escalam com o valor.
+    """
+    if cronogramas is None:
+        cronogramas = _montar_cronogramas(df)
+
+    grupo, representantes = agrupar_cronogramas(cronogramas)
+    unitarios = [cronograma_unitario(cronogramas[i]) for i in representantes]
+    contratos_por_grupo = np.bincount(grupo, minlength=len(unitarios))
+
+    fluxos_unitarios = []
+    tirs = []
+    fluxos_iniciais = []
+
+    for cron, n_contratos in zip(unitarios, contratos_por_grupo):
+        fluxo_df, tir, fluxo_inicial = precificar_cronograma(
+            cron,
+            cenario,
+            projecoes=projecoes,
+            cambios=cambios,
+            mercado=mercado,
+        )
 
         if "Pagamento" not in fluxo_df.columns:
             raise ValueError("Fluxo do contrato não possui coluna 'Pagamento'.")
         if "Data" not in fluxo_df.columns:
             raise ValueError("Fluxo do contrato não possui coluna 'Data'.")
 
-        custo_total = fluxo_df["Pagamento"].sum()
+        fluxos_unitarios.append(fluxo_df)
+        tirs.append(tir)
+        fluxos_iniciais.append(fluxo_inicial)
+
+        if avancar is not None:
+            avancar(int(n_contratos))
+
+    # Fluxo e VPL por unidade de principal de cada grupo
+    unitario = pd.concat(fluxos_unitarios, ignore_index=True)
+    tamanhos = np.array([len(f) for f in fluxos_unitarios], dtype=np.int64)
+    data_liberacao_grupo = pd.Series([c.data_liberacao for c in unitarios])
+    vpl_unitario = curva.vpl_carteira(
+        np.repeat(np.arange(len(unitarios)), tamanhos),
+        unitario["Data"],
+        unitario["Pagamento"],
+        data_liberacao_grupo,
+        fluxos_iniciais,
+    )
+    custo_unitario = np.bincount(
+        np.repeat(np.arange(len(unitarios)), tamanhos),
+        weights=unitario["Pagamento"].to_numpy(dtype=float),
+        minlength=len(unitarios),
+    )
 
-        resultados.append(
-            {
-                "ID": row["Id"],
-                "Tipo": row["Tipo"],
-                "Descrição": row["Descrição"],
-                "Moeda": row["Moeda"],
-                "Valor_Contratado": row["Valor_Contratado"],
-                "Custo_Total": custo_total,
-                "TIR": tir,
-                "VPL": vpl,
-            }
-        )
+    # Escala por contrato: linhas do fluxo unitário do grupo × valor
+    valor = np.array([c.valor for c in cronogramas], dtype=float)
+    inicio_grupo = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])
+    linhas_contrato = tamanhos[grupo]
+    posicoes = (
+        np.repeat(inicio_grupo[grupo] - np.concatenate([[0], np.cumsum(linhas_contrato)[:-1]]), linhas_contrato)
+        + np.arange(linhas_contrato.sum())
+    )
 
-        fluxo_df = fluxo_df.copy()
-        fluxo_df["ID"] = row["Id"]
-        fluxos.append(fluxo_df)
-
-    if not resultados:
-        resumo = pd.DataFrame(
-            columns=[
-                "ID",
-                "Tipo",
-                "Descrição",
-                "Moeda",
-                "Valor_Contratado",
-                "Custo_Total",
-                "TIR",
-                "VPL",
-            ]
-        )
-        fluxo = pd.DataFrame(columns=["ID", "Data", "Pagamento"])
-        carteira = pd.DataFrame(
-            [
-                {"Tipo": "Antigo", "Custo_Total": 0, "VPL": 0, "TIR": 0},
-                {"Tipo": "Novo", "Custo_Total": 0, "VPL": 0, "TIR": 0},
-                {"Tipo": "Diferença", "Custo_Total": 0, "VPL": 0, "TIR": 0},
-            ]
+    fluxo = unitario.take(posicoes).reset_index(drop=True)
+    fluxo["ID"] = np.repeat(df["Id"].to_numpy(), linhas_contrato)
+    escala = np.repeat(valor, linhas_contrato)
+    for col in ["Pagamento", "Amortização", "Juros", "Saldo_Devedor"]:
+        fluxo[col] = fluxo[col].to_numpy(dtype=float) * escala
+
+    resumo = pd.DataFrame(
+        {
+            "ID": df["Id"].to_numpy(),
+            "Tipo": df["Tipo"].to_numpy(),
+            "Descrição": df["Descrição"].to_numpy(),
+            "Moeda": df["Moeda"].to_numpy(),
+            "Indexador": df["Indexador"].to_numpy(),
+            "Sistema_Amortização": df["Sistema_Amortização"].to_numpy(),
+            "Valor_Contratado": df["Valor_Contratado"].to_numpy(),
+            "Custo_Total": custo_unitario[grupo] * valor,
+            "TIR": np.asarray(tirs, dtype=float)[grupo],
+            "VPL": vpl_unitario[grupo] * valor,
+            "Data_liberacao": [c.data_liberacao for c in cronogramas],
+        }
+    )
+
+    # Duration, vida média e prazos: fluxos a vencer após a data-base da curva
+    contrato_linha = np.repeat(np.arange(len(cronogramas)), linhas_contrato)
+    somas = somas_risco(fluxo, contrato_linha, resumo["TIR"].to_numpy()[contrato_linha], curva.data_base)
+    risco = indicadores_risco(somas.reindex(range(len(cronogramas)), fill_value=0.0))
+    for col in COLUNAS_RISCO:
+        resumo[col] = risco[col].to_numpy()
+
+    # Sensibilidades (DV01 e delta câmbio, em lote): também lineares no principal
+    if sensibilidades:
+        sens = calcular_sensibilidades(
+            unitarios,
+            cenario,
+            curva,
+            projecoes=projecoes,
+            cambios=cambios,
+            mercado=mercado,
         )
-        fluxo_anual = pd.DataFrame(columns=["Ano", "Tipo", "Pagamento"])
-        fluxo_mensal = pd.DataFrame(columns=["Data", "Tipo", "Pagamento"])
-        ranking = pd.DataFrame()
-        return resumo, fluxo, carteira, fluxo_anual, fluxo_mensal, ranking
+        for col in COLUNAS_SENSIBILIDADE:
+            resumo[col] = sens[col].to_numpy()[grupo] * valor
+
+        if avancar is not None:
+            avancar(len(cronogramas))
+
+    if not pd.api.types.is_datetime64_any_dtype(fluxo["Data"]):
+        fluxo["Data"] = pd.to_datetime(fluxo["Data"])
+    fluxo["Ano"] = fluxo["Data"].dt.year
+
+    return resumo, fluxo
 
-    resumo = pd.DataFrame(resultados)
-    fluxo = pd.concat(fluxos, ignore_index=True)
+
+# =============================
+# 🔹 Agregações parciais (somáveis entre lotes)
+# =============================
+
+def _agregar_lote(resumo: pd.DataFrame, fluxo: pd.DataFrame, data_base) -> tuple[pd.Series, pd.Series, pd.DataFrame, pd.DataFrame]:
+    """
+    Agregados de um lote que podem ser somados aos de outros lotes:
+    - pagamentos por (Ano, Tipo) e por (Data, Tipo);
+    - pico anual e ano do pico de cada contrato do lote;
+    - somas por Tipo dos indicadores de risco (risco.somas_risco).
+    """
+    contratos = resumo.drop_duplicates("ID").set_index("ID")
+    tipos = fluxo["ID"].map(contratos["Tipo"])
+    risco = somas_risco(fluxo, tipos, fluxo["ID"].map(contratos["TIR"]), data_base)
+
+    anual = fluxo["Pagamento"].groupby([fluxo["Ano"], tipos.rename("Tipo")]).sum()
+    mensal = fluxo["Pagamento"].groupby([fluxo["Data"], tipos.rename("Tipo")]).sum()
+
+    # fluxo anual por ID (contrato) e ano
+    fluxo_anual_id = (
+        fluxo.groupby(["Ano", "ID"])["Pagamento"]
+        .sum()
+        .reset_index()
+    )
+
+    # para cada contrato, identificar valor do pico e o ano correspondente
+    pico_info = (
+        fluxo_anual_id.sort_values(["ID", "Pagamento"], ascending=[True, False])
+        .groupby("ID")
+        .first()
+        .reset_index()
+        .rename(columns={"Pagamento": "Pico_Anual", "Ano": "Ano_Pico"})
+    )
+    return anual, mensal, pico_info, risco
+
+
+def _somar(acumulado: pd.Series | pd.DataFrame | None, parcial: pd.Series | pd.DataFrame) -> pd.Series | pd.DataFrame:
+    return parcial if acumulado is None else acumulado.add(parcial, fill_value=0.0)
+
+
+def _consolidar(resumo: pd.DataFrame, anual: pd.Series, mensal: pd.Series, pico_info: pd.DataFrame, risco: pd.DataFrame):
+    """Carteira, fluxos anual/mensal por Tipo e ranking a partir dos agregados."""
 
     # =============================
     # 🔹 CONSOLIDAÇÃO CARTEIRA
@@ -133,6 +532,11 @@ def rodar_modelo(
             carteira = pd.concat([carteira, pd.DataFrame([linha])], ignore_index=True)
 
     carteira = carteira.set_index("Tipo")
+
+    # Duration, vida média e prazos da carteira: das somas de todos os contratos
+    indicadores = indicadores_risco(risco.reindex(columns=SOMAS_RISCO, fill_value=0.0))
+    carteira = carteira.join(indicadores.reindex(carteira.index, fill_value=0.0))
+
     atual = carteira.loc["Antigo"]
     novo = carteira.loc["Novo"]
 
@@ -142,6 +546,7 @@ def rodar_modelo(
             "Custo_Total": [atual["Custo_Total"] - novo["Custo_Total"]],
             "VPL": [atual["VPL"] - novo["VPL"]],
             "TIR": [atual["TIR"] - novo["TIR"]],
+            **{col: [atual[col] - novo[col]] for col in COLUNAS_RISCO},
         }
     )
 
@@ -149,72 +554,351 @@ def rodar_modelo(
     carteira = pd.concat([carteira, carteira_dif], ignore_index=True)
 
     # =============================
-    # 🔹 FLUXO ANUAL
+    # 🔹 FLUXO ANUAL E MENSAL
     # =============================
 
-    fluxo = fluxo.copy()
-    if not pd.api.types.is_datetime64_any_dtype(fluxo["Data"]):
-        fluxo["Data"] = pd.to_datetime(fluxo["Data"])
+    fluxo_anual = anual.sort_index().rename("Pagamento").reset_index()
+    fluxo_mensal = mensal.sort_index().rename("Pagamento").reset_index()
 
-    fluxo["Ano"] = fluxo["Data"].dt.year
+    # =============================
+    # 🔹 RANKING (CUSTO E PICO ANUAL + ANO DO PICO)
+    # =============================
 
-    fluxo_anual = (
-        fluxo.groupby(["Ano", "ID"])["Pagamento"]
-        .sum()
-        .reset_index()
-        .merge(resumo[["ID", "Tipo"]], on="ID")
-    )
+    ranking = resumo.merge(pico_info, on="ID", how="left")
+    ranking["Pico_Anual"] = ranking["Pico_Anual"].fillna(0)
+    ranking["Ano_Pico"] = ranking["Ano_Pico"].fillna(0).astype(int)
 
-    fluxo_anual = (
-        fluxo_anual.groupby(["Ano", "Tipo"])["Pagamento"]
-        .sum()
-        .reset_index()
-    )
+    # mantém ordenação por custo total (como estava antes)
+    ranking = ranking.sort_values(by="Custo_Total", ascending=False)
 
-    # =============================
-    # 🔹 FLUXO MENSAL
-    # =============================
+    return carteira, fluxo_anual, fluxo_mensal, ranking
 
-    fluxo_mensal = (
-        fluxo.groupby(["Data", "ID"])["Pagamento"]
-        .sum()
-        .reset_index()
-        .merge(resumo[["ID", "Tipo"]], on="ID")
-    )
 
-    fluxo_mensal = (
-        fluxo_mensal.groupby(["Data", "Tipo"])["Pagamento"]
-        .sum()
-        .reset_index()
+# =============================
+# 🔹 Rodada completa (em memória)
+# =============================
+
+def rodar_modelo(
+    df: pd.DataFrame | None = None,
+    cenario: CenarioMercado | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    historico=None,
+    sensibilidades: bool = True,
+    cambio_paridade: bool = False,
+    mercado: FotoMercado | None = None,
+    progresso=None,
+    cancelar: threading.Event | None = None,
+):
+    """
+    Roda o modelo de dívida para um conjunto de contratos.
+
+    Espera colunas mínimas:
+    - Id
+    - Tipo
+    - Descrição
+    - Moeda
+    - Valor_Contratado
+    e as do cronograma (COLUNAS_CRONOGRAMA). A planilha é validada por
+    inteiro antes de simular (validar_contratos); com erros, levanta
+    ErroValidacao com o relatório completo em '.relatorio'.
+
+    O VPL é descontado pela 'curva' informada (ex.: curva pré de DI futuro).
+    Sem curva, usa uma curva plana no CDI atual, montada uma vez por rodada.
+
+    'projecoes' (opcional) traz curvas de projeção por indexador
+    (ex.: carregar_projecoes do Focus); indexadores sem curva usam a taxa
+    atual de mercado, constante. 'cambios' (opcional) traz o câmbio por
+    data de cada moeda. Com 'cambio_paridade', moedas sem curva em
+    'cambios' usam o câmbio a termo por paridade de juros (projetar_cambios)
+    em vez do spot constante.
+
+    Modo backtest: 'historico' (arquivo local ou DataFrame de séries diárias
+    realizadas: CDI, SELIC, IPCA, SOFR, USD, ...) substitui taxas e câmbio
+    pelos realizados; períodos após a última observação usam o último valor.
+
+    Com 'sensibilidades', acrescenta a resumo/ranking as colunas de DV01
+    (CDI, IPCA, spread) e delta de câmbio do VPL e do pico anual.
+
+    'mercado' (opcional): foto do mercado já lida (ex.: a mesma usada na
+    chave do armazém de rodadas); sem ela, lê as fontes uma vez.
+
+    'progresso' (opcional): função progresso(feitos, total) chamada a cada
+    contrato simulado; com 'sensibilidades', o total reserva um passo por
+    contrato para elas (passos_rodada). 'cancelar' (opcional):
+    threading.Event; acionado, a rodada para no próximo passo com
+    RodadaCancelada (ver tarefas.py para rodar em segundo plano).
+
+    Mantém o fluxo detalhado de todos os contratos em memória; para
+    carteiras muito grandes, ver rodar_modelo_streaming.
+    """
+    if cenario is None:
+        cenario = CenarioMercado(nome="Base")
+
+    df, curva, projecoes, cambios, mercado = _preparar_rodada(
+        df, curva, projecoes, cambios, historico, cambio_paridade, mercado
     )
+    if df.empty:
+        return _resultado_vazio()
 
-    # =============================
-    # 🔹 RANKING (CUSTO E PICO ANUAL + ANO DO PICO)
-    # =============================
+    avancar = _acompanhamento(passos_rodada(len(df), 1, sensibilidades), progresso, cancelar)
+    return _rodar_cenario(df, cenario, curva, projecoes, cambios, mercado, sensibilidades, avancar=avancar)
 
-    # fluxo anual por ID (contrato) e ano
-    fluxo_anual_id = (
-        fluxo.groupby(["Ano", "ID"])["Pagamento"]
-        .sum()
-        .reset_index()
+
+def _preparar_rodada(df, curva, projecoes, cambios, historico, cambio_paridade, mercado):
+    """
+    Parte da rodada que não depende do cenário: planilha validada,
+    insumos do histórico, foto do mercado, curva de desconto e câmbios
+    projetados. Retorna (df, curva, projecoes, cambios, mercado).
+    """
+    projecoes, cambios = _insumos_historico(projecoes, cambios, historico)
+
+    if df is None:
+        df = pd.read_excel("Contratos.xlsx", engine="openpyxl")
+
+    # Validação da planilha inteira antes de qualquer simulação
+    df = _exigir_contratos_validos(_normalizar_colunas(df), projecoes)
+
+    # Taxas e câmbios de mercado: uma leitura por rodada
+    if mercado is None:
+        mercado = foto_mercado(df["Moeda"].astype(str).str.upper().unique())
+
+    if curva is None:
+        curva = CurvaDesconto.plana(mercado.taxa("CDI"))
+
+    if cambio_paridade:
+        cambios = projetar_cambios(df["Moeda"].unique(), mercado, curva, cambios)
+
+    return df, curva, projecoes, cambios, mercado
+
+
+def _rodar_cenario(df, cenario, curva, projecoes, cambios, mercado, sensibilidades, cronogramas=None, avancar=None):
+    """As seis saídas de rodar_modelo para um cenário, a partir da rodada preparada."""
+    resumo, fluxo = _simular_lote(df, cenario, curva, projecoes, cambios, mercado, sensibilidades, cronogramas, avancar)
+    carteira, fluxo_anual, fluxo_mensal, ranking = _consolidar(resumo, *_agregar_lote(resumo, fluxo, curva.data_base))
+
+    return resumo, fluxo, carteira, fluxo_anual, fluxo_mensal, ranking
+
+
+# =============================
+# 🔹 Vários cenários de uma vez
+# =============================
+
+def rodar_cenarios(
+    df: pd.DataFrame | None = None,
+    cenarios: list[CenarioMercado] | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    historico=None,
+    sensibilidades: bool = True,
+    cambio_paridade: bool = False,
+    mercado: FotoMercado | None = None,
+    max_workers: int | None = None,
+    progresso=None,
+    cancelar: threading.Event | None = None,
+) -> dict[str, tuple]:
+    """
+    Roda a mesma carteira em vários cenários (padrão: Base, Estresse e
+    Otimista), com as mesmas opções de rodar_modelo.
+
+    O que não depende do cenário é feito uma vez só: validação, leitura
+    do mercado, câmbios projetados e os cronogramas de todos os contratos
+    (datas e dias úteis). Os cenários são então precificados em paralelo,
+    em threads que compartilham esses cronogramas.
+
+    'progresso' e 'cancelar' como em rodar_modelo; o total é o de
+    passos_rodada para contratos × cenários.
+
+    Retorna {nome do cenário: saídas de rodar_modelo}, na ordem de 'cenarios'.
+    """
+    if cenarios is None:
+        cenarios = CENARIOS_PADRAO
+    nomes = [c.nome for c in cenarios]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError(f"Nomes de cenário repetidos: {nomes}")
+
+    df, curva, projecoes, cambios, mercado = _preparar_rodada(
+        df, curva, projecoes, cambios, historico, cambio_paridade, mercado
     )
+    if df.empty:
+        return {c.nome: _resultado_vazio() for c in cenarios}
 
-    # para cada contrato, identificar valor do pico e o ano correspondente
-    pico_info = (
-        fluxo_anual_id.sort_values(["ID", "Pagamento"], ascending=[True, False])
-        .groupby("ID")
-        .first()
-        .reset_index()
-        .rename(columns={"Pagamento": "Pico_Anual", "Ano": "Ano_Pico"})
+    cronogramas = _montar_cronogramas(df)
+    avancar = _acompanhamento(passos_rodada(len(df), len(cenarios), sensibilidades), progresso, cancelar)
+
+    def rodar(cenario):
+        return _rodar_cenario(df, cenario, curva, projecoes, cambios, mercado, sensibilidades, cronogramas, avancar)
+
+    if max_workers == 1 or len(cenarios) == 1:
+        saidas = [rodar(c) for c in cenarios]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers or len(cenarios)) as executor:
+            saidas = list(executor.map(rodar, cenarios))
+
+    return dict(zip(nomes, saidas))
+
+
+# =============================
+# 🔹 Rodada em streaming (memória constante)
+# =============================
+
+def _lotes_de_contratos(contratos, tamanho_lote: int):
+    """
+    Normaliza a entrada em DataFrames de até 'tamanho_lote' contratos:
+    aceita um DataFrame, um iterável de DataFrames (ex.: read_csv com
+    chunksize) ou um iterável de linhas (dicts / Series).
+    """
+    if isinstance(contratos, pd.DataFrame):
+        for i in range(0, len(contratos), tamanho_lote):
+            yield contratos.iloc[i : i + tamanho_lote]
+        return
+
+    linhas = []
+    for item in contratos:
+        if isinstance(item, pd.DataFrame):
+            if linhas:
+                yield pd.DataFrame(linhas)
+                linhas = []
+            for i in range(0, len(item), tamanho_lote):
+                yield item.iloc[i : i + tamanho_lote]
+            continue
+
+        linhas.append(item)
+        if len(linhas) >= tamanho_lote:
+            yield pd.DataFrame(linhas)
+            linhas = []
+
+    if linhas:
+        yield pd.DataFrame(linhas)
+
+
+def rodar_modelo_streaming(
+    contratos,
+    cenario: CenarioMercado | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    historico=None,
+    sensibilidades: bool = True,
+    tamanho_lote: int = 500,
+    diretorio_fluxo: str | None = None,
+    cambio_paridade: bool = False,
+):
+    """
+    Mesmo resultado de rodar_modelo, com memória constante no número de períodos.
+
+    'contratos' pode ser um gerador: os contratos são simulados em lotes de
+    'tamanho_lote' e cada lote é dobrado em acumuladores (pagamentos por
+    ano/Tipo e por data/Tipo, pico anual por contrato) e descartado.
+    Só o resumo (uma linha por contrato) cresce com a carteira.
+
+    O fluxo detalhado por período só é guardado se 'diretorio_fluxo' for
+    informado: cada lote vira um arquivo CSV no diretório (ver
+    ler_fluxo_detalhado). No lugar do DataFrame 'fluxo', retorna a lista
+    desses arquivos (vazia sem 'diretorio_fluxo').
+
+    Retorna (resumo, arquivos_fluxo, carteira, fluxo_anual, fluxo_mensal, ranking).
+    """
+    if cenario is None:
+        cenario = CenarioMercado(nome="Base")
+
+    projecoes, cambios = _insumos_historico(projecoes, cambios, historico)
+
+    # Moedas não são conhecidas de antemão: câmbios lidos sob demanda
+    mercado = foto_mercado()
+
+    if curva is None:
+        curva = CurvaDesconto.plana(mercado.taxa("CDI"))
+
+    if diretorio_fluxo is not None:
+        os.makedirs(diretorio_fluxo, exist_ok=True)
+
+    resumos = []
+    arquivos_fluxo = []
+    anual = None
+    mensal = None
+    risco = None
+    picos = []
+
+    # DataFrame: validado inteiro antes do primeiro lote; geradores, lote a lote
+    if isinstance(contratos, pd.DataFrame):
+        contratos = _exigir_contratos_validos(_normalizar_colunas(contratos), projecoes)
+
+    for lote in _lotes_de_contratos(contratos, tamanho_lote):
+        lote = _exigir_contratos_validos(_normalizar_colunas(lote), projecoes)
+        if lote.empty:
+            continue
+
+        if cambio_paridade:
+            cambios = projetar_cambios(lote["Moeda"].unique(), mercado, curva, cambios)
+
+        resumo_lote, fluxo_lote = _simular_lote(lote, cenario, curva, projecoes, cambios, mercado, sensibilidades)
+        anual_lote, mensal_lote, pico_lote, risco_lote = _agregar_lote(resumo_lote, fluxo_lote, curva.data_base)
+
+        anual = _somar(anual, anual_lote)
+        mensal = _somar(mensal, mensal_lote)
+        risco = _somar(risco, risco_lote)
+        picos.append(pico_lote)
+        resumos.append(resumo_lote)
+
+        if diretorio_fluxo is not None:
+            arquivo = os.path.join(diretorio_fluxo, f"fluxo_{len(arquivos_fluxo):05d}.csv")
+            fluxo_lote.to_csv(arquivo, index=False)
+            arquivos_fluxo.append(arquivo)
+
+    if not resumos:
+        resumo, _, carteira, fluxo_anual, fluxo_mensal, ranking = _resultado_vazio()
+        return resumo, arquivos_fluxo, carteira, fluxo_anual, fluxo_mensal, ranking
+
+    resumo = pd.concat(resumos, ignore_index=True)
+    carteira, fluxo_anual, fluxo_mensal, ranking = _consolidar(
+        resumo, anual, mensal, pd.concat(picos, ignore_index=True), risco
     )
+    return resumo, arquivos_fluxo, carteira, fluxo_anual, fluxo_mensal, ranking
 
-    ranking = resumo.merge(pico_info, on="ID", how="left")
-    ranking["Pico_Anual"] = ranking["Pico_Anual"].fillna(0)
-    ranking["Ano_Pico"] = ranking["Ano_Pico"].fillna(0).astype(int)
 
-    # mantém ordenação por custo total (como estava antes)
-    ranking = ranking.sort_values(by="Custo_Total", ascending=False)
+def ler_fluxo_detalhado(arquivos, ids=None) -> pd.DataFrame:
+    """
+    Lê o fluxo detalhado gravado por rodar_modelo_streaming,
+    opcionalmente só dos contratos em 'ids' (lido arquivo a arquivo).
+    """
+    partes = []
+    for arquivo in arquivos:
+        parte = pd.read_csv(arquivo, parse_dates=["Data"])
+        if ids is not None:
+            parte = parte[parte["ID"].isin(ids)]
+        partes.append(parte)
 
-    return resumo, fluxo, carteira, fluxo_anual, fluxo_mensal, ranking
+    if not partes:
+        return pd.DataFrame(columns=["ID", "Data", "Pagamento"])
+    return pd.concat(partes, ignore_index=True)
+
+
+# =============================
+# 🔹 Índice do fluxo por contrato
+# =============================
+
+def indexar_fluxo(fluxo: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    Ordena o fluxo por contrato (estável, mantendo a ordem das datas) e
+    devolve (fluxo_ordenado, faixas), com faixas[ID] = (inicio, fim):
+    o fluxo do contrato é fluxo_ordenado.iloc[inicio:fim], sem varrer a tabela.
+    """
+    if fluxo.empty:
+        return fluxo.reset_index(drop=True), {}
+
+    codigos, ids = pd.factorize(fluxo["ID"])
+    ordem = np.argsort(codigos, kind="stable")
+    fim = np.cumsum(np.bincount(codigos, minlength=len(ids)))
+    inicio = fim - np.bincount(codigos, minlength=len(ids))
+
+    faixas = {i: (int(a), int(b)) for i, a, b in zip(ids, inicio, fim)}
+    return fluxo.iloc[ordem].reset_index(drop=True), faixas
 
 
+def fluxo_do_contrato(fluxo_ordenado: pd.DataFrame, faixas: dict, id_contrato) -> pd.DataFrame:
+    """Fluxo de um contrato a partir do índice de indexar_fluxo (vazio se ausente)."""
+    inicio, fim = faixas.get(id_contrato, (0, 0))
+    return fluxo_ordenado.iloc[inicio:fim]
@@ -0,0 +1,273 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cenarios import CenarioMercado
+from contagem_dias import BASE_PADRAO
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao, para_data
+from engine_divida import (
+    amortizar_lote,
+    calcular_pmt,
+    cambios_periodo,
+    codigo_sistema,
+    fatores_indexador,
+    montar_cronograma,
+    somas_anuais_lote,
+    spread_anual,
+    taxa_spread_dia_util,
+    vpl_lote,
+)
+from mercado import FotoMercado, foto_mercado
+from modelo_divida import projetar_cambios
+
+
+OBJETIVOS = ("VPL", "Custo_Total")
+
+# Abaixo disso o custo de subir processos supera o ganho
+MIN_GRUPOS_PARALELO = 8
+
+
+def _pontuar_grupo(tarefa: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Avalia todos os candidatos de um mesmo cronograma de datas só com arrays.
+
+    Recebe vetores do cronograma (um valor por período) e vetores dos
+    candidatos (sistema, spread diário e anual); as matrizes candidatos ×
+    períodos são montadas aqui por broadcasting, então a tarefa é pequena
+    para enviar a outro processo. Função de módulo para rodar em processos separados.
+
+    Como em taxas_periodo: em DU/252 o spread capitaliza por dia útil; nas
+    demais bases ('juros_simples'), entra linear na fração de ano.
+    """
+    k = tarefa["sistema"].size
+    dias_acumulacao = tarefa["dias_acumulacao"]
+    fator_spread = 1 + tarefa["spread_dia"]
+
+    if tarefa["juros_simples"]:
+        fatores = tarefa["fator_indexador"][None, :] + tarefa["spread_anual"][:, None] * (dias_acumulacao / 252)[None, :]
+        log_total = np.log(fatores).sum(axis=1)
+    else:
+        fatores = tarefa["fator_indexador"][None, :] * fator_spread[:, None] ** dias_acumulacao[None, :]
+        log_total = np.log(tarefa["fator_indexador"]).sum() + dias_acumulacao.sum() * np.log(fator_spread)
+    if dias_acumulacao.sum() > 0:
+        taxa_media = np.exp(log_total / dias_acumulacao.sum()) - 1
+    else:
+        taxa_media = fator_spread - 1
+
+    valor = np.full(k, tarefa["valor"])
+    prazo = np.full(k, tarefa["prazo"])
+    carencia = tarefa["carencia"]
+
+    pmt = calcular_pmt(
+        valor,
+        prazo,
+        carencia,
+        tarefa["sistema"],
+        taxa_media,
+        np.full(k, tarefa["dias_uteis_entre_pagamentos"]),
+    )
+    _, _, pagamento, _ = amortizar_lote(valor, fatores, prazo, carencia, tarefa["sistema"], pmt)
+    pagamento_brl = pagamento * tarefa["cambio"][None, :]
+
+    vpl = vpl_lote(
+        pagamento_brl,
+        tarefa["fd"],
+        np.full(k, tarefa["fd_liberacao"]),
+        np.full(k, tarefa["fluxo_inicial"]),
+    )
+    custo = pagamento_brl.sum(axis=1)
+
+    anuais = somas_anuais_lote(
+        np.broadcast_to(tarefa["anos"], pagamento_brl.shape),
+        pagamento_brl,
+        np.ones(pagamento_brl.shape, dtype=bool),
+        tarefa["ano_inicial"],
+        tarefa["n_anos"],
+    ) + tarefa["existente"]
+    posicao = anuais.argmax(axis=1)
+    pico = anuais[np.arange(k), posicao]
+
+    return vpl, custo, pico, tarefa["ano_inicial"] + posicao
+
+
+def _anual_existente(fluxo_anual_existente) -> pd.Series:
+    """Pagamentos anuais já contratados (Series por Ano ou DataFrame Ano/Pagamento)."""
+    if fluxo_anual_existente is None:
+        return pd.Series(dtype=float)
+    if isinstance(fluxo_anual_existente, pd.DataFrame):
+        return fluxo_anual_existente.groupby("Ano")["Pagamento"].sum()
+    return pd.Series(fluxo_anual_existente, dtype=float)
+
+
+def avaliar_candidatos(
+    base,
+    prazos,
+    carencias,
+    sistemas=("SAC", "PRICE"),
+    periodicidades=(1,),
+    spreads=(0.0,),
+    fluxo_anual_existente=None,
+    cenario: CenarioMercado | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    mercado: FotoMercado | None = None,
+    max_workers: int | None = None,
+    cambio_paridade: bool = False,
+) -> pd.DataFrame:
+    """
+    Avalia todas as combinações de termos para a tranche "Novo".
+
+    - 'base': linha da planilha (dict/Series) com os termos fixos
+      (Id, Valor_Contratado, datas, Moeda, Indexador, Fator_indexador...);
+    - prazos, carencias (em períodos), sistemas, periodicidades, spreads
+      (base 1.0): grades de termos candidatos; combinações com
+      carência >= prazo são descartadas.
+    - 'fluxo_anual_existente' (opcional): pagamentos anuais do restante
+      da carteira, somados aos do candidato no cálculo do pico anual.
+    - 'cambio_paridade': câmbio a termo por paridade de juros (como em
+      rodar_modelo) quando a moeda não tem curva em 'cambios'.
+
+    As datas não dependem de carência, sistema nem spread: o cronograma
+    (e câmbio, descontos, fator do indexador) é montado uma vez por
+    (prazo, periodicidade), e os demais termos variam dentro do grupo,
+    avaliado numa única amortização em lote.
+    Grupos são pontuados em paralelo ('max_workers=1' força serial).
+
+    Retorna uma linha por candidato com VPL, Custo_Total, Pico_Anual e Ano_Pico.
+    """
+    if cenario is None:
+        cenario = CenarioMercado(nome="Base")
+
+    base = pd.Series(base).copy()
+    moeda = str(base["Moeda"]).upper()
+    if mercado is None:
+        mercado = foto_mercado([moeda])
+    if curva is None:
+        curva = CurvaDesconto.plana(mercado.taxa("CDI"))
+
+    if cambio_paridade:
+        cambios = projetar_cambios([moeda], mercado, curva, cambios)
+
+    existente = _anual_existente(fluxo_anual_existente)
+
+    # Datas parseadas uma vez, não a cada cronograma
+    for coluna in ("Data_contratação", "Data_liberacao"):
+        base[coluna] = pd.Timestamp(para_data(pd.Series([base[coluna]])).iloc[0])
+
+    candidatos = []
+    tarefas = []
+    for prazo, periodicidade in itertools.product(prazos, periodicidades):
+        termos = [
+            (int(carencia), str(sistema).upper(), float(spread))
+            for carencia, sistema, spread in itertools.product(carencias, sistemas, spreads)
+            if int(carencia) < int(prazo)
+        ]
+        if not termos:
+            continue
+
+        row = base.copy()
+        row["Prazo"] = int(prazo)
+        row["Carencia"] = termos[0][0]
+        row["Periodicidade"] = int(periodicidade)
+        cron = montar_cronograma(row)
+
+        # Tudo que não depende de sistema/spread: calculado uma vez por grupo
+        cambio, cambio_liberacao = cambios_periodo(cron, cenario, cambios, mercado)
+        anos = cron.datas.year.to_numpy()
+        ano_inicial = int(min(anos.min(), existente.index.min() if len(existente) else anos.min()))
+        ano_final = int(max(anos.max(), existente.index.max() if len(existente) else anos.max()))
+
+        tarefas.append(
+            {
+                "valor": cron.valor,
+                "prazo": cron.prazo,
+                "carencia": np.array([carencia for carencia, _, _ in termos]),
+                "dias_acumulacao": cron.dias_acumulacao,
+                "dias_uteis_entre_pagamentos": cron.dias_uteis_entre_pagamentos,
+                "fator_indexador": fatores_indexador(cron, cenario, projecoes, mercado),
+                "sistema": np.array([codigo_sistema(sistema) for _, sistema, _ in termos]),
+                "spread_dia": taxa_spread_dia_util(np.array([spread for _, _, spread in termos]), cenario),
+                "spread_anual": spread_anual(np.array([spread for _, _, spread in termos]), cenario),
+                "juros_simples": cron.base_calculo != BASE_PADRAO,
+                "cambio": cambio,
+                "fd": curva.fator_desconto(cron.datas),
+                "fd_liberacao": float(curva.fator_desconto([cron.data_liberacao])[0]),
+                "fluxo_inicial": -cron.valor * cambio_liberacao,
+                "anos": anos,
+                "ano_inicial": ano_inicial,
+                "n_anos": ano_final - ano_inicial + 1,
+                "existente": existente.reindex(range(ano_inicial, ano_final + 1), fill_value=0.0).to_numpy(),
+            }
+        )
+        candidatos.extend(
+            {
+                "Prazo": int(prazo),
+                "Carencia": carencia,
+                "Periodicidade": int(periodicidade),
+                "Sistema_Amortização": sistema,
+                "Spread": spread,
+            }
+            for carencia, sistema, spread in termos
+        )
+
+    colunas = ["Prazo", "Carencia", "Periodicidade", "Sistema_Amortização", "Spread",
+               "VPL", "Custo_Total", "Pico_Anual", "Ano_Pico"]
+    if not tarefas:
+        return pd.DataFrame(columns=colunas)
+
+    if max_workers == 1 or len(tarefas) < MIN_GRUPOS_PARALELO:
+        resultados = [_pontuar_grupo(t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            resultados = list(executor.map(_pontuar_grupo, tarefas, chunksize=max(1, len(tarefas) // 64)))
+
+    tabela = pd.DataFrame(candidatos)
+    tabela["VPL"] = np.concatenate([r[0] for r in resultados])
+    tabela["Custo_Total"] = np.concatenate([r[1] for r in resultados])
+    tabela["Pico_Anual"] = np.concatenate([r[2] for r in resultados])
+    tabela["Ano_Pico"] = np.concatenate([r[3] for r in resultados]).astype(int)
+    return tabela[colunas]
+
+
+def otimizar_reestruturacao(
+    base,
+    prazos,
+    carencias,
+    sistemas=("SAC", "PRICE"),
+    periodicidades=(1,),
+    spreads=(0.0,),
+    objetivo: str = "VPL",
+    teto_pico_anual: float | None = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Busca os termos da tranche "Novo" que minimizam 'objetivo'
+    ("VPL" ou "Custo_Total") respeitando o teto de pagamentos anuais.
+
+    Recebe as mesmas grades e opções de avaliar_candidatos. Retorna todos os
+    candidatos com a coluna 'Viavel' (Pico_Anual <= teto), ordenados:
+    viáveis primeiro, do melhor para o pior objetivo. A primeira linha é
+    a recomendação (se 'Viavel').
+    """
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f"Objetivo inválido: {objetivo}. Use um de {list(OBJETIVOS)}.")
+
+    tabela = avaliar_candidatos(
+        base,
+        prazos,
+        carencias,
+        sistemas=sistemas,
+        periodicidades=periodicidades,
+        spreads=spreads,
+        **kwargs,
+    )
+
+    if teto_pico_anual is None:
+        tabela["Viavel"] = True
+    else:
+        tabela["Viavel"] = tabela["Pico_Anual"] <= teto_pico_anual
+
+    return tabela.sort_values(["Viavel", objetivo], ascending=[False, True], kind="stable").reset_index(drop=True)
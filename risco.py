@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from curvas import contar_dias_uteis
+
+
+# Indicadores de risco de refinanciamento (como no PAF), em anos e em %
+COLUNAS_RISCO = [
+    "Duration_Macaulay",
+    "Duration_Modificada",
+    "Vida_Media",
+    "Prazo_Medio",
+    "Pct_Vence_12m",
+]
+
+# Somas que compõem os indicadores (somáveis entre contratos e lotes)
+SOMAS_RISCO = [
+    "VP",
+    "VP_Prazo",
+    "VP_Prazo_Modificado",
+    "Amortizacao",
+    "Amortizacao_Prazo",
+    "Amortizacao_12m",
+    "Pagamento",
+    "Pagamento_Prazo",
+]
+
+
+def somas_risco(fluxo: pd.DataFrame, chaves, tir, data_base) -> pd.DataFrame:
+    """
+    Somas por 'chaves' (um valor por linha do fluxo: contrato, Tipo...)
+    dos pagamentos ainda por vencer após 'data_base', no mesmo eixo de
+    tempo do desconto (dias úteis ANBIMA / 252):
+    - VP, VP × prazo e VP × prazo / (1 + TIR): valor presente à TIR do
+      contrato ('tir', em % a.a., um valor por linha);
+    - amortização e pagamento, simples e × prazo;
+    - amortização que vence em até 12 meses.
+    As somas de vários lotes podem ser adicionadas antes de indicadores_risco.
+    """
+    datas = pd.to_datetime(fluxo["Data"]).to_numpy().astype("datetime64[D]")
+    base = np.datetime64(pd.Timestamp(data_base).date(), "D")
+    limite_12m = np.datetime64((pd.Timestamp(base) + pd.DateOffset(months=12)).date(), "D")
+
+    a_vencer = datas > base
+    prazo = np.where(a_vencer, contar_dias_uteis(np.full(datas.size, base), datas) / 252, 0.0)
+    taxa = np.asarray(tir, dtype=float) / 100
+
+    pagamento = np.where(a_vencer, fluxo["Pagamento"].to_numpy(dtype=float), 0.0)
+    amortizacao = np.where(a_vencer, fluxo["Amortização"].to_numpy(dtype=float), 0.0)
+    vp = pagamento * (1 + taxa) ** -prazo
+
+    parcelas = pd.DataFrame(
+        {
+            "VP": vp,
+            "VP_Prazo": vp * prazo,
+            "VP_Prazo_Modificado": vp * prazo / (1 + taxa),
+            "Amortizacao": amortizacao,
+            "Amortizacao_Prazo": amortizacao * prazo,
+            "Amortizacao_12m": np.where(datas <= limite_12m, amortizacao, 0.0),
+            "Pagamento": pagamento,
+            "Pagamento_Prazo": pagamento * prazo,
+        }
+    )
+    return parcelas.groupby(np.asarray(chaves)).sum()
+
+
+def indicadores_risco(somas: pd.DataFrame) -> pd.DataFrame:
+    """
+    Indicadores a partir das somas (mesmo índice):
+    - Duration_Macaulay / Duration_Modificada (anos), ponderadas pelo VP;
+    - Vida_Media (anos): prazo médio ponderado pela amortização;
+    - Prazo_Medio (anos): prazo médio ponderado pelos pagamentos;
+    - Pct_Vence_12m (%): parcela do saldo a vencer nos próximos 12 meses.
+    Sem fluxo a vencer, os indicadores são zero.
+    """
+    def razao(numerador, denominador):
+        numerador = somas[numerador].to_numpy(dtype=float)
+        denominador = somas[denominador].to_numpy(dtype=float)
+        return np.divide(numerador, denominador, out=np.zeros(len(somas)), where=denominador > 0)
+
+    return pd.DataFrame(
+        {
+            "Duration_Macaulay": razao("VP_Prazo", "VP"),
+            "Duration_Modificada": razao("VP_Prazo_Modificado", "VP"),
+            "Vida_Media": razao("Amortizacao_Prazo", "Amortizacao"),
+            "Prazo_Medio": razao("Pagamento_Prazo", "Pagamento"),
+            "Pct_Vence_12m": razao("Amortizacao_12m", "Amortizacao") * 100,
+        },
+        index=somas.index,
+    )
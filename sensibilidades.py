@@ -0,0 +1,152 @@
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from cenarios import CenarioMercado
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao
+from engine_divida import (
+    LoteCronogramas,
+    amortizar_cronogramas,
+    cambios_lote,
+    descontos_lote,
+    fatores_lote,
+    pico_anual_lote,
+    vpl_lote,
+)
+from mercado import FotoMercado
+
+
+COLUNAS_SENSIBILIDADE = [
+    "VPL_DV01_CDI",
+    "VPL_DV01_IPCA",
+    "VPL_DV01_Spread",
+    "VPL_Delta_FX",
+    "Pico_DV01_CDI",
+    "Pico_DV01_IPCA",
+    "Pico_DV01_Spread",
+    "Pico_Delta_FX",
+]
+
+
+def _choques_1bp(cenario: CenarioMercado) -> dict[str, tuple[CenarioMercado, tuple[str, ...] | None]]:
+    """
+    Cenários com +1 bp em cada fator e os indexadores afetados
+    (None = todos os contratos). SELIC acompanha o choque de CDI.
+    """
+    return {
+        "CDI": (replace(cenario, choque_cdi_bps=cenario.choque_cdi_bps + 1), ("CDI", "SELIC")),
+        "IPCA": (replace(cenario, choque_ipca_bps=cenario.choque_ipca_bps + 1), ("IPCA",)),
+        "Spread": (replace(cenario, choque_spread_bps=cenario.choque_spread_bps + 1), None),
+    }
+
+
+def _sensibilidades_bloco(
+    lote: LoteCronogramas,
+    cenario: CenarioMercado,
+    curva: CurvaDesconto,
+    projecoes,
+    cambios,
+    mercado,
+) -> pd.DataFrame:
+    n = len(lote.cronogramas)
+    indexadores = np.array([str(c.indexador).upper() for c in lote.cronogramas])
+
+    # Base + contratos afetados por cada choque, empilhados numa única amortização
+    linhas = [np.arange(n)]
+    fatores, taxa_media = fatores_lote(lote, cenario, projecoes, mercado)
+    blocos_fatores = [fatores]
+    blocos_taxa = [taxa_media]
+
+    choques = _choques_1bp(cenario)
+    afetados = {}
+    for nome, (cenario_choque, alvo) in choques.items():
+        idx = np.arange(n) if alvo is None else np.flatnonzero(np.isin(indexadores, alvo))
+        afetados[nome] = idx
+        f, t = fatores_lote(lote, cenario_choque, projecoes, mercado, linhas=idx)
+        linhas.append(idx)
+        blocos_fatores.append(f)
+        blocos_taxa.append(t)
+
+    linhas = np.concatenate(linhas)
+    _, _, pagamento, _ = amortizar_cronogramas(
+        lote,
+        np.vstack(blocos_fatores),
+        np.concatenate(blocos_taxa),
+        linhas,
+    )
+
+    # Câmbio, fatores de desconto e anos: calculados uma vez por contrato
+    cambio, cambio_liberacao = cambios_lote(lote, cenario, cambios, mercado)
+    fd, fd_liberacao = descontos_lote(lote, curva)
+
+    pagamento_brl = pagamento * cambio[linhas]
+    vpl = vpl_lote(
+        pagamento_brl,
+        fd[linhas],
+        fd_liberacao[linhas],
+        -lote.valor[linhas] * cambio_liberacao[linhas],
+    )
+    pico, _ = pico_anual_lote(lote.anos[linhas], pagamento_brl, lote.mascara[linhas])
+
+    vpl_base = vpl[:n]
+    pico_base = pico[:n]
+
+    resultado = {"ID": [c.id for c in lote.cronogramas]}
+    inicio = n
+    for nome in choques:
+        idx = afetados[nome]
+        fim = inicio + idx.size
+
+        delta_vpl = np.zeros(n)
+        delta_pico = np.zeros(n)
+        delta_vpl[idx] = vpl[inicio:fim] - vpl_base[idx]
+        delta_pico[idx] = pico[inicio:fim] - pico_base[idx]
+
+        resultado[f"VPL_DV01_{nome}"] = delta_vpl
+        resultado[f"Pico_DV01_{nome}"] = delta_pico
+        inicio = fim
+
+    # Fluxo em BRL é linear no câmbio: +1% no câmbio = +1% no VPL e no pico
+    estrangeira = np.array([c.moeda != "BRL" for c in lote.cronogramas])
+    resultado["VPL_Delta_FX"] = np.where(estrangeira, 0.01 * vpl_base, 0.0)
+    resultado["Pico_Delta_FX"] = np.where(estrangeira, 0.01 * pico_base, 0.0)
+
+    return pd.DataFrame(resultado)[["ID"] + COLUNAS_SENSIBILIDADE]
+
+
+def calcular_sensibilidades(
+    cronogramas: list,
+    cenario: CenarioMercado,
+    curva: CurvaDesconto,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    mercado: FotoMercado | None = None,
+    tamanho_bloco: int = 1000,
+) -> pd.DataFrame:
+    """
+    Sensibilidades por contrato, em R$:
+    - VPL_DV01_* / Pico_DV01_*: variação do VPL e do pico anual de
+      pagamentos para +1 bp no CDI (e SELIC), no IPCA e no spread;
+    - VPL_Delta_FX / Pico_Delta_FX: variação para +1% no câmbio.
+
+    Reaproveita os cronogramas já montados (datas e dias úteis): os choques
+    são empilhados numa única amortização em lote, sem rodar o modelo de
+    novo. A curva de desconto é mantida fixa. Processa em blocos de
+    'tamanho_bloco' contratos para limitar memória.
+    """
+    if not cronogramas:
+        return pd.DataFrame(columns=["ID"] + COLUNAS_SENSIBILIDADE)
+
+    blocos = [
+        _sensibilidades_bloco(
+            LoteCronogramas.de_cronogramas(cronogramas[i : i + tamanho_bloco]),
+            cenario,
+            curva,
+            projecoes,
+            cambios,
+            mercado,
+        )
+        for i in range(0, len(cronogramas), tamanho_bloco)
+    ]
+    return pd.concat(blocos, ignore_index=True)
@@ -0,0 +1,385 @@
+import numpy as np
+import pandas as pd
+
+from backtest import MOEDAS_HISTORICO, carregar_historico
+from cenarios import CenarioMercado
+from contagem_dias import BASE_PADRAO
+from curvas import CurvaCambio, CurvaDesconto, CurvaProjecao, contar_dias_uteis
+from engine_divida import (
+    LoteCronogramas,
+    agrupar_cronogramas,
+    amortizar_lote,
+    calcular_pmt,
+    cambios_lote,
+    choque_indexador,
+    cronograma_unitario,
+    descontos_lote,
+    somas_anuais_lote,
+    spread_anual,
+    taxa_anual_equivalente,
+    taxa_indexador_anual,
+    taxa_spread_dia_util,
+    vpl_lote,
+)
+from mercado import FotoMercado
+from modelo_divida import _montar_cronogramas, _preparar_rodada
+
+
+# Fator de choque de cada indexador (SELIC acompanha o CDI, como nos cenários)
+FATOR_INDEXADOR = {"CDI": "CDI_bps", "SELIC": "CDI_bps", "IPCA": "IPCA_bps"}
+
+NIVEIS_PADRAO = (0.95, 0.99)
+
+
+# ===============================
+# 🔹 Choques históricos
+# ===============================
+
+def choques_historicos(historico, horizonte_meses: int = 12, frequencia: str | None = None) -> pd.DataFrame:
+    """
+    Variações observadas em 'horizonte_meses' nas séries do histórico
+    (arquivo local ou DataFrame de carregar_historico), uma linha por
+    data observada (fim da janela):
+    - CDI_bps: variação da taxa anual do CDI (base 252), em bps;
+    - IPCA_bps: variação do IPCA acumulado em 12 meses, em bps;
+    - USD, EUR, ...: variação relativa do câmbio (0.10 = +10%).
+
+    As janelas se sobrepõem (uma por dia observado); com 'frequencia'
+    (ex.: "ME"), fica só a última data de cada período. Só entram datas
+    com todas as séries presentes no arquivo.
+    """
+    if not isinstance(historico, pd.DataFrame):
+        historico = carregar_historico(historico)
+    if "Data" in historico.columns:
+        historico = historico.set_index("Data")
+    historico = historico.sort_index()
+
+    niveis = {}
+    if "CDI" in historico.columns:
+        niveis["CDI_bps"] = ((1 + historico["CDI"].dropna() / 100.0) ** 252 - 1) * 10000
+    if "IPCA" in historico.columns:
+        ipca = historico["IPCA"].dropna()
+        niveis["IPCA_bps"] = ((1 + ipca / 100.0).rolling(12).apply(np.prod, raw=True) - 1).dropna() * 10000
+    for moeda in MOEDAS_HISTORICO:
+        if moeda in historico.columns:
+            niveis[moeda] = historico[moeda].dropna()
+    niveis = {nome: serie for nome, serie in niveis.items() if not serie.empty}
+    if not niveis:
+        raise ValueError("Histórico sem séries para choques: informe CDI, IPCA e/ou câmbio (USD, EUR, ...).")
+
+    # Datas observadas das séries diárias (o IPCA mensal só entra pelo último valor)
+    diarias = [s for nome, s in niveis.items() if nome != "IPCA_bps"] or list(niveis.values())
+    datas = pd.DatetimeIndex(sorted(set().union(*(s.index for s in diarias))))
+    if frequencia is not None:
+        datas = pd.DatetimeIndex(pd.Series(datas, index=datas).resample(frequencia).last().dropna())
+    anteriores = datas - pd.DateOffset(months=horizonte_meses)
+
+    choques = {}
+    for nome, serie in niveis.items():
+        atual = serie.reindex(datas, method="ffill").to_numpy()
+        anterior = serie.reindex(anteriores, method="ffill").to_numpy()
+        anterior = np.where(anteriores < serie.index[0], np.nan, anterior)
+        choques[nome] = atual / anterior - 1 if nome in MOEDAS_HISTORICO else atual - anterior
+
+    choques = pd.DataFrame(choques, index=datas.rename("Data")).dropna()
+    if choques.empty:
+        raise ValueError(f"Histórico curto demais: nenhuma janela completa de {horizonte_meses} meses.")
+    return choques
+
+
+# ===============================
+# 🔹 Pagamentos em lote por nível de choque
+# ===============================
+
+class _PrecificadorChoques:
+    """
+    Cronogramas (unitários) empilhados com tudo o que não depende do choque
+    no indexador: dias de acumulação, spread, câmbio, fatores de desconto e
+    a taxa do indexador (única, ou a de cada dia útil da projeção).
+    pagamentos(linhas, choque) reprecifica qualquer combinação contrato ×
+    choque numa única amortização em lote. Fora de DU/252, juros simples
+    como em taxas_periodo.
+    """
+
+    def __init__(self, cronogramas, cenario, curva, projecoes, cambios, mercado):
+        self.lote = LoteCronogramas.de_cronogramas(cronogramas)
+        n, p = self.lote.mascara.shape
+
+        self.dias = self.lote.espalhar([c.dias_acumulacao for c in cronogramas])
+        self.total_dias = self.dias.sum(axis=1)
+        self.fracao = self.dias / 252
+        self.simples = np.array([c.base_calculo != BASE_PADRAO for c in cronogramas], dtype=bool)
+        self.fator = np.array([c.fator for c in cronogramas], dtype=float)
+        spread = np.array([c.spread for c in cronogramas], dtype=float)
+        self.taxa_spread_dia = taxa_spread_dia_util(spread, cenario)
+        self.spread_anual = spread_anual(spread, cenario)
+        self.cambio, self.cambio_liberacao = cambios_lote(self.lote, cenario, cambios, mercado)
+        self.fd, self.fd_liberacao = descontos_lote(self.lote, curva)
+        self.anos = self.lote.anos
+
+        # Indexador: taxa anual única (sem projeção) ou a de cada dia útil
+        # do período (com projeção), já com o choque do cenário
+        self.taxa_unica = np.zeros(n)
+        self.com_projecao = np.zeros(n, dtype=bool)
+        self.du_curva = np.zeros((n, p))
+        taxas, periodos, pesos = [], [], []
+        for i, cron in enumerate(cronogramas):
+            projecao = (projecoes or {}).get(str(cron.indexador).upper())
+            if projecao is None:
+                self.taxa_unica[i] = taxa_indexador_anual(cron.indexador, cenario, mercado)
+                taxas.append(np.zeros(0))
+                periodos.append(np.zeros(0, dtype=np.int64))
+                pesos.append(np.zeros(0))
+                continue
+
+            self.com_projecao[i] = True
+            taxas_dia, periodo, sinal = projecao.taxas_diarias(cron.inicios, cron.datas)
+            # dias seguidos com a mesma taxa (ex.: projeção mensal) viram
+            # uma entrada só, com o número de dias como peso
+            novo = np.ones(taxas_dia.size, dtype=bool)
+            novo[1:] = (np.diff(taxas_dia) != 0) | (np.diff(periodo) != 0)
+            inicio = np.flatnonzero(novo)
+            taxas.append(taxas_dia[inicio] + choque_indexador(cron.indexador, cenario))
+            periodos.append(periodo[inicio])
+            pesos.append(sinal[inicio] * np.diff(np.append(inicio, taxas_dia.size)))
+            if self.simples[i]:
+                self.du_curva[i, : cron.prazo] = contar_dias_uteis(cron.inicios, cron.datas)
+
+        self.trechos_por_contrato = np.array([t.size for t in taxas], dtype=np.int64)
+        self.inicio_trechos = np.concatenate([[0], np.cumsum(self.trechos_por_contrato)[:-1]])
+        self.taxa_dia = np.concatenate(taxas) if taxas else np.zeros(0)
+        self.periodo_dia = np.concatenate(periodos) if periodos else np.zeros(0, dtype=np.int64)
+        self.peso_dia = np.concatenate(pesos) if pesos else np.zeros(0)
+
+    def _log_indexador(self, linhas: np.ndarray, choque: np.ndarray) -> np.ndarray:
+        """Log do fator do indexador capitalizado por dia útil (dias úteis da curva, com projeção)."""
+        r, p = linhas.size, self.dias.shape[1]
+        fator = self.fator[linhas]
+        unica = self.dias[linhas] * (np.log1p((self.taxa_unica[linhas] + choque) * fator) / 252)[:, None]
+
+        # trechos de dias úteis de cada linha, reunidos a partir das posições do contrato
+        tamanhos = self.trechos_por_contrato[linhas]
+        linha_dia = np.repeat(np.arange(r), tamanhos)
+        posicao = np.repeat(self.inicio_trechos[linhas] - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+        projetada = np.bincount(
+            linha_dia * p + self.periodo_dia[posicao],
+            weights=self.peso_dia[posicao] * np.log1p((self.taxa_dia[posicao] + choque[linha_dia]) * fator[linha_dia]) / 252,
+            minlength=r * p,
+        ).reshape(r, p)
+        return np.where(self.com_projecao[linhas][:, None], projetada, unica)
+
+    def _log_fatores(self, linhas: np.ndarray, choque: np.ndarray) -> np.ndarray:
+        """Log do fator (indexador + spread) de cada período, como em taxas_periodo."""
+        log_indexador = self._log_indexador(linhas, choque)
+        composto = log_indexador + self.dias[linhas] * np.log1p(self.taxa_spread_dia[linhas])[:, None]
+
+        simples = self.simples[linhas][:, None]
+        if not simples.any():
+            return composto
+        taxa_anual = np.where(
+            self.com_projecao[linhas][:, None],
+            taxa_anual_equivalente(log_indexador, self.du_curva[linhas]),
+            ((self.taxa_unica[linhas] + choque) * self.fator[linhas])[:, None],
+        )
+        fatores = 1 + (taxa_anual + self.spread_anual[linhas][:, None]) * self.fracao[linhas]
+        return np.where(simples, np.log(np.where(simples, fatores, 1.0)), composto)
+
+    def pagamentos(self, linhas: np.ndarray, choque: np.ndarray) -> np.ndarray:
+        """
+        Pagamentos em BRL (linhas × períodos) dos contratos 'linhas' com
+        'choque' (base 1.0 a.a., um por linha) somado à taxa do indexador.
+        """
+        lote = self.lote
+        log_fatores = self._log_fatores(linhas, choque)
+        total_dias = self.total_dias[linhas]
+        taxa_media = np.where(
+            total_dias > 0,
+            np.exp(log_fatores.sum(axis=1) / np.where(total_dias > 0, total_dias, 1.0)) - 1,
+            self.taxa_spread_dia[linhas],
+        )
+
+        valor, prazo, carencia, sistema = lote.valor[linhas], lote.prazo[linhas], lote.carencia[linhas], lote.sistema[linhas]
+        pmt = calcular_pmt(valor, prazo, carencia, sistema, taxa_media, lote.dias_uteis_entre_pagamentos[linhas])
+        _, _, pagamento, _ = amortizar_lote(valor, np.exp(log_fatores), prazo, carencia, sistema, pmt)
+        return pagamento * self.cambio[linhas]
+
+    def vpl(self, linhas: np.ndarray, pagamento_brl: np.ndarray) -> np.ndarray:
+        return vpl_lote(
+            pagamento_brl,
+            self.fd[linhas],
+            self.fd_liberacao[linhas],
+            -self.lote.valor[linhas] * self.cambio_liberacao[linhas],
+        )
+
+
+# ===============================
+# 🔹 VaR de fluxo por simulação histórica
+# ===============================
+
+def _rotulo(nivel: float) -> str:
+    return f"VaR_{nivel * 100:g}"
+
+
+def var_historico(
+    contratos: pd.DataFrame,
+    historico=None,
+    choques: pd.DataFrame | None = None,
+    cenario: CenarioMercado | None = None,
+    curva: CurvaDesconto | None = None,
+    projecoes: dict[str, CurvaProjecao] | None = None,
+    cambios: dict[str, CurvaCambio] | None = None,
+    cambio_paridade: bool = False,
+    mercado: FotoMercado | None = None,
+    horizonte_meses: int = 12,
+    frequencia: str | None = None,
+    niveis=NIVEIS_PADRAO,
+    cronogramas: list | None = None,
+    tamanho_bloco: int = 2000,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    VaR de fluxo por simulação histórica: cada variação observada em
+    'horizonte_meses' de CDI, IPCA e câmbio (choques_historicos do
+    'historico', ou 'choques' já prontos) é aplicada como um cenário sobre
+    o 'cenario' da rodada (padrão: Base), com as demais opções como em
+    rodar_modelo. CDI também move SELIC; o câmbio de cada moeda varia pelo
+    choque da própria moeda (sem coluna no histórico, não varia). A curva
+    de desconto fica fixa, como nas sensibilidades.
+
+    Perda = aumento em relação ao cenário sem choque (VPL maior = dívida
+    mais cara; pagamento maior = mais pressão no caixa).
+
+    Cenários são centenas a milhares, mas contratos e choques se repetem:
+    - contratos com termos idênticos são precificados uma vez, com
+      principal 1 (como em rodar_modelo), e pesados pelo valor de cada Tipo;
+    - cada grupo só é reprecificado nos níveis distintos do choque do seu
+      indexador (arredondados a 0,01 bp); indexadores sem choque, uma vez;
+    - o câmbio entra por multiplicação (fluxo linear no câmbio).
+    A amortização roda em lote, em blocos de até 'tamanho_bloco' linhas
+    grupo × choque.
+
+    Retorna (var_vpl, var_anual, simulacoes):
+    - var_vpl: por Tipo, VPL sem choque, perda média, VaR em cada nível
+      de 'niveis' (quantil da perda), perda máxima e data do pior cenário;
+    - var_anual: o mesmo por Tipo e ano, para os pagamentos do ano;
+    - simulacoes: choques de cada data e VPL / perda por Tipo.
+    """
+    if cenario is None:
+        cenario = CenarioMercado(nome="Base")
+    if choques is None:
+        if historico is None:
+            raise ValueError("Informe o 'historico' (arquivo ou DataFrame) ou os 'choques'.")
+        choques = choques_historicos(historico, horizonte_meses, frequencia)
+    if choques.empty:
+        raise ValueError("Nenhum cenário histórico para simular.")
+    niveis = [float(q) for q in niveis]
+    if any(not 0 < q < 1 for q in niveis):
+        raise ValueError(f"Níveis de VaR devem estar entre 0 e 1: {niveis}")
+
+    df, curva, projecoes, cambios, mercado = _preparar_rodada(
+        contratos, curva, projecoes, cambios, None, cambio_paridade, mercado
+    )
+    if cronogramas is None:
+        cronogramas = _montar_cronogramas(df)
+    elif len(cronogramas) != len(df):
+        raise ValueError("'cronogramas' deve ter um cronograma por contrato.")
+    if not cronogramas:
+        raise ValueError("Nenhum contrato para simular.")
+
+    # Grupos de termos idênticos, com o valor de cada Tipo como peso
+    grupo, representantes = agrupar_cronogramas(cronogramas)
+    unitarios = [cronograma_unitario(cronogramas[i]) for i in representantes]
+    tipos, tipo = np.unique(df["Tipo"].astype(str).to_numpy(), return_inverse=True)
+    g, t = len(unitarios), len(tipos)
+    pesos = np.bincount(
+        grupo * t + tipo, weights=np.array([c.valor for c in cronogramas], dtype=float), minlength=g * t
+    ).reshape(g, t)
+
+    precificador = _PrecificadorChoques(unitarios, cenario, curva, projecoes, cambios, mercado)
+    mascara = precificador.lote.mascara
+    ano_inicial = int(precificador.anos[mascara].min())
+    n_anos = int(precificador.anos[mascara].max()) - ano_inicial + 1
+
+    # Níveis distintos de cada fator (o zero é o cenário sem choque)
+    s = len(choques)
+    niveis_fator, codigos = {}, {}
+    for fator in set(FATOR_INDEXADOR.values()):
+        valores = np.round(choques[fator].to_numpy(dtype=float), 2) if fator in choques.columns else np.zeros(s)
+        niveis_fator[fator], codigos[fator] = np.unique(np.append(valores, 0.0), return_inverse=True)
+
+    vpl = np.zeros((s, t))
+    anual = np.zeros((s, t, n_anos))
+    vpl_base = np.zeros(t)
+    anual_base = np.zeros((t, n_anos))
+
+    # Grupos reunidos por (fator do indexador, moeda): mesmos cenários, mesmo câmbio
+    fator_grupo = np.array([FATOR_INDEXADOR.get(str(c.indexador).upper(), "") for c in unitarios])
+    moeda_grupo = np.array([str(c.moeda).upper() for c in unitarios])
+    for fator, moeda in sorted(set(zip(fator_grupo, moeda_grupo))):
+        membros = np.flatnonzero((fator_grupo == fator) & (moeda_grupo == moeda))
+        if fator:
+            escala, codigo = niveis_fator[fator], codigos[fator]
+        else:
+            escala, codigo = np.zeros(1), np.zeros(s + 1, dtype=np.int64)
+        u = escala.size
+
+        # Somas por Tipo em cada nível de choque, bloco a bloco
+        vpl_nivel = np.zeros((u, t))
+        anual_nivel = np.zeros((u, t, n_anos))
+        por_bloco = max(1, tamanho_bloco // u)
+        for inicio in range(0, membros.size, por_bloco):
+            bloco = membros[inicio : inicio + por_bloco]
+            linhas = np.repeat(bloco, u)
+            choque = np.tile(escala / 10000.0, bloco.size)
+            pagamento = precificador.pagamentos(linhas, choque)
+
+            v = precificador.vpl(linhas, pagamento).reshape(bloco.size, u)
+            a = somas_anuais_lote(
+                precificador.anos[linhas], pagamento, mascara[linhas], ano_inicial, n_anos
+            ).reshape(bloco.size, u, n_anos)
+            vpl_nivel += np.einsum("gu,gt->ut", v, pesos[bloco])
+            anual_nivel += np.einsum("guy,gt->uty", a, pesos[bloco])
+
+        # Cenários: nível do choque de cada data × variação do câmbio da moeda
+        if moeda != "BRL" and moeda in choques.columns:
+            cambio = 1 + choques[moeda].to_numpy(dtype=float)
+        else:
+            cambio = np.ones(s)
+        vpl += cambio[:, None] * vpl_nivel[codigo[:s]]
+        anual += cambio[:, None, None] * anual_nivel[codigo[:s]]
+        vpl_base += vpl_nivel[codigo[s]]
+        anual_base += anual_nivel[codigo[s]]
+
+    perda_vpl = vpl - vpl_base
+    perda_anual = anual - anual_base
+    datas = choques.index
+
+    def estatisticas(base, perdas):
+        """Base, média, quantis e pior cenário das perdas (cenários no eixo 0)."""
+        colunas = {"Base": base, "Perda_Media": perdas.mean(axis=0)}
+        for nivel in niveis:
+            colunas[_rotulo(nivel)] = np.quantile(perdas, nivel, axis=0)
+        colunas["Perda_Maxima"] = perdas.max(axis=0)
+        colunas["Data_Pior"] = np.asarray(datas)[perdas.argmax(axis=0)]
+        return colunas
+
+    var_vpl = pd.DataFrame(estatisticas(vpl_base, perda_vpl), index=pd.Index(tipos, name="Tipo"))
+    var_vpl = var_vpl.rename(columns={"Base": "VPL_Base"}).reset_index()
+
+    colunas_anual = estatisticas(anual_base.reshape(-1), perda_anual.reshape(s, -1))
+    var_anual = pd.DataFrame(
+        {
+            "Tipo": np.repeat(tipos, n_anos),
+            "Ano": np.tile(np.arange(ano_inicial, ano_inicial + n_anos), t),
+            **colunas_anual,
+        }
+    ).rename(columns={"Base": "Pagamento_Base"})
+    # anos sem pagamento em nenhum cenário não entram
+    var_anual = var_anual[(var_anual["Pagamento_Base"] != 0) | (np.abs(perda_anual.reshape(s, -1)).max(axis=0) > 0)]
+    var_anual = var_anual.sort_values(["Ano", "Tipo"]).reset_index(drop=True)
+
+    simulacoes = choques.reset_index().loc[np.repeat(np.arange(s), t)].reset_index(drop=True)
+    simulacoes["Tipo"] = np.tile(tipos, s)
+    simulacoes["VPL"] = vpl.reshape(-1)
+    simulacoes["Perda_VPL"] = perda_vpl.reshape(-1)
+
+    return var_vpl, var_anual, simulacoes
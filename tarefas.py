@@ -0,0 +1,194 @@
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+from modelo_divida import RodadaCancelada
+
+
+# Estados de uma tarefa
+NA_FILA = "na fila"
+RODANDO = "rodando"
+CONCLUIDA = "concluída"
+CANCELADA = "cancelada"
+ERRO = "erro"
+
+ESTADOS_FINAIS = (CONCLUIDA, CANCELADA, ERRO)
+TRABALHADORES_PADRAO = 2
+
+
+# ===============================
+# 🔹 Tarefa (uma rodada em segundo plano)
+# ===============================
+
+@dataclass
+class Tarefa:
+    """
+    Uma rodada submetida à fila: estado, progresso (passos feitos /
+    total), resultado ou erro. 'cancelar' é o evento repassado à rodada;
+    'feitos' e 'total' são atualizados pela própria rodada (progresso).
+    """
+    id: str
+    descricao: str
+    total: int = 0
+    feitos: int = 0
+    estado: str = NA_FILA
+    criada_em: float = field(default_factory=time.time)
+    inicio: float | None = None
+    fim: float | None = None
+    resultado: Any = None
+    erro: BaseException | None = None
+    detalhe_erro: str = ""
+    cancelar: threading.Event = field(default_factory=threading.Event, repr=False)
+    futuro: Future | None = field(default=None, repr=False)
+
+    @property
+    def terminada(self) -> bool:
+        return self.estado in ESTADOS_FINAIS
+
+    @property
+    def fracao(self) -> float:
+        """Fração concluída (0 a 1)."""
+        if self.estado == CONCLUIDA:
+            return 1.0
+        return min(self.feitos / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def decorrido(self) -> float:
+        """Segundos desde o início (até o fim, se terminada)."""
+        if self.inicio is None:
+            return 0.0
+        return (self.fim or time.time()) - self.inicio
+
+    @property
+    def eta(self) -> float | None:
+        """Segundos restantes estimados pelo ritmo até agora (None sem base)."""
+        if self.estado != RODANDO or not self.feitos or not self.total:
+            return None
+        ritmo = self.decorrido / self.feitos
+        return ritmo * max(self.total - self.feitos, 0)
+
+    def progresso(self, feitos: int, total: int) -> None:
+        """Callback de progresso entregue a rodar_modelo / rodar_cenarios."""
+        self.feitos = feitos
+        self.total = total
+
+
+def formatar_duracao(segundos: float | None) -> str:
+    """Duração legível: '45 s', '3 min 20 s', '1 h 05 min'."""
+    if segundos is None:
+        return "—"
+    segundos = int(round(segundos))
+    if segundos < 60:
+        return f"{segundos} s"
+    minutos, segundos = divmod(segundos, 60)
+    if minutos < 60:
+        return f"{minutos} min {segundos:02d} s"
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas} h {minutos:02d} min"
+
+
+# ===============================
+# 🔹 Fila de tarefas (pool de trabalhadores)
+# ===============================
+
+class FilaTarefas:
+    """
+    Fila de rodadas em segundo plano, num pool de threads do processo.
+
+    - submeter(id, descricao, funcao, ...) agenda funcao(..., progresso=,
+      cancelar=) e devolve a Tarefa na hora; o app não fica bloqueado.
+    - Tarefas são guardadas pelo id (ex.: as chaves das rodadas): submeter
+      de novo o mesmo id devolve a tarefa existente, em andamento ou já
+      concluída; resultados sobrevivem a reruns e à troca de página
+      enquanto o processo viver (no app, a fila é um st.cache_resource).
+    - cancelar(id) aciona o evento da tarefa: na fila, ela nem começa;
+      rodando, para no próximo contrato (RodadaCancelada).
+    """
+
+    def __init__(self, max_workers: int = TRABALHADORES_PADRAO, max_terminadas: int = 20):
+        self.max_terminadas = max_terminadas
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rodada")
+        self._tarefas: dict[str, Tarefa] = {}
+        self._trava = threading.Lock()
+
+    def submeter(self, id: str, descricao: str, funcao, *args, total: int = 0, **kwargs) -> Tarefa:
+        """
+        Agenda funcao(*args, progresso=..., cancelar=..., **kwargs). Se já
+        houver tarefa com o mesmo id (que não tenha sido cancelada nem
+        falhado), devolve essa em vez de rodar de novo.
+        """
+        with self._trava:
+            existente = self._tarefas.get(id)
+            if existente is not None and existente.estado not in (CANCELADA, ERRO):
+                return existente
+
+            tarefa = Tarefa(id=id, descricao=descricao, total=total)
+            self._tarefas[id] = tarefa
+            self._descartar_antigas()
+            tarefa.futuro = self._executor.submit(self._executar, tarefa, funcao, args, kwargs)
+        return tarefa
+
+    def _executar(self, tarefa: Tarefa, funcao, args, kwargs) -> None:
+        if tarefa.cancelar.is_set():
+            tarefa.estado = CANCELADA
+            tarefa.fim = time.time()
+            return
+
+        tarefa.estado = RODANDO
+        tarefa.inicio = time.time()
+        try:
+            tarefa.resultado = funcao(*args, progresso=tarefa.progresso, cancelar=tarefa.cancelar, **kwargs)
+            tarefa.estado = CONCLUIDA
+        except RodadaCancelada:
+            tarefa.estado = CANCELADA
+        except Exception as e:
+            tarefa.erro = e
+            tarefa.detalhe_erro = traceback.format_exc()
+            tarefa.estado = ERRO
+        finally:
+            tarefa.fim = time.time()
+
+    def _descartar_antigas(self) -> None:
+        """Mantém só as 'max_terminadas' tarefas terminadas mais recentes."""
+        terminadas = sorted(
+            (t for t in self._tarefas.values() if t.terminada),
+            key=lambda t: t.fim or t.criada_em,
+        )
+        for tarefa in terminadas[: max(len(terminadas) - self.max_terminadas, 0)]:
+            del self._tarefas[tarefa.id]
+
+    def cancelar(self, id: str) -> bool:
+        """Pede o cancelamento; False se a tarefa não existe ou já terminou."""
+        tarefa = self._tarefas.get(id)
+        if tarefa is None or tarefa.terminada:
+            return False
+        tarefa.cancelar.set()
+        if tarefa.futuro is not None and tarefa.futuro.cancel():
+            # ainda não tinha começado
+            tarefa.estado = CANCELADA
+            tarefa.fim = time.time()
+        return True
+
+    def tarefa(self, id: str) -> Tarefa | None:
+        return self._tarefas.get(id)
+
+    def tarefas(self) -> list[Tarefa]:
+        """Todas as tarefas conhecidas, da mais recente para a mais antiga."""
+        return sorted(self._tarefas.values(), key=lambda t: t.criada_em, reverse=True)
+
+    def remover(self, id: str) -> None:
+        """Esquece uma tarefa terminada (ex.: resultado já consumido)."""
+        with self._trava:
+            tarefa = self._tarefas.get(id)
+            if tarefa is not None and tarefa.terminada:
+                del self._tarefas[id]
+
+    def encerrar(self, esperar: bool = True) -> None:
+        """Cancela o que estiver pendente e fecha o pool."""
+        for tarefa in list(self._tarefas.values()):
+            if not tarefa.terminada:
+                tarefa.cancelar.set()
+        self._executor.shutdown(wait=esperar, cancel_futures=True)
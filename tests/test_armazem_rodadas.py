@@ -0,0 +1,65 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from armazem_rodadas import ArmazemRodadas
+
+
+def _saidas(n: int):
+    df = pd.DataFrame({"Tipo": ["Antigo", "Novo"], "VPL": [float(n), -float(n)]})
+    return (df,) * 6
+
+
+def _salvar_varias(diretorio: str, processo: int, n: int) -> None:
+    armazem = ArmazemRodadas(diretorio)
+    for i in range(n):
+        armazem.salvar(f"p{processo}_{i}", _saidas(i), descricao=f"{processo}/{i}")
+        armazem.abrir(f"p{processo}_{i}")
+
+
+def test_salvamentos_simultaneos_nao_perdem_entradas(tmp_path):
+    processos = [
+        multiprocessing.Process(target=_salvar_varias, args=(str(tmp_path), p, 15)) for p in range(4)
+    ]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join()
+        assert processo.exitcode == 0
+
+    rodadas = ArmazemRodadas(str(tmp_path)).rodadas()
+    assert len(rodadas) == 60
+    assert set(rodadas["Chave"]) == {f"p{p}_{i}" for p in range(4) for i in range(15)}
+
+
+def test_limite_conta_todas_as_rodadas(tmp_path):
+    armazem = ArmazemRodadas(str(tmp_path))
+    armazem.salvar("a", _saidas(1))
+    tamanho = int(armazem.rodadas()["Bytes"].iloc[0])
+
+    armazem.limite_bytes = 2 * tamanho
+    armazem.salvar("b", _saidas(2))
+    armazem.abrir("a")
+    armazem.salvar("c", _saidas(3))
+
+    # 'b' foi a menos acessada: sai do manifesto e do disco
+    assert set(armazem.rodadas()["Chave"]) == {"a", "c"}
+    assert armazem.abrir("b") is None
+
+
+def test_abrir_nao_copia_colunas_numericas(tmp_path):
+    armazem = ArmazemRodadas(str(tmp_path))
+    df = pd.DataFrame(np.random.default_rng(0).random((200_000, 3)), columns=["a", "b", "c"])
+    df["Tipo"] = "Novo"
+    armazem.salvar("k", (df,) * 6)
+
+    antes = pa.total_allocated_bytes()
+    saidas = armazem.abrir("k")
+    # 6 × 4,8 MB de floats: nada disso é alocado pelo Arrow, fica no mapa
+    assert pa.total_allocated_bytes() - antes < 1_000_000
+
+    coluna = saidas[0]["a"].to_numpy()
+    assert not coluna.flags.owndata
+    np.testing.assert_array_equal(coluna, df["a"].to_numpy())
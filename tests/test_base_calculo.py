@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cenarios import CenarioMercado
+from contagem_dias import fracao_ano
+from curvas import CurvaProjecao, contar_dias_uteis
+from engine_divida import montar_cronograma, taxas_periodo
+from mercado import FotoMercado
+
+
+MERCADO = FotoMercado(taxas={"CDI": 0.12, "SOFR": 0.05}, cambios={"USD": 5.0})
+
+
+def _contrato(base, indexador="SOFR", moeda="USD"):
+    return pd.Series(
+        {
+            "Id": 1,
+            "Moeda": moeda,
+            "Valor_Contratado": 1_000_000.0,
+            "Data_contratação": pd.Timestamp("2024-01-10"),
+            "Data_liberacao": pd.Timestamp("2024-01-15"),
+            "Prazo": 6,
+            "Carencia": 0,
+            "Periodicidade": 6,
+            "Sistema_Amortização": "SAC",
+            "Indexador": indexador,
+            "Spread": 0.02,
+            "Fator_indexador": 1.0,
+            "Base_Calculo": base,
+        }
+    )
+
+
+@pytest.mark.parametrize("base", ["ACT/360", "ACT/365", "30/360"])
+def test_juros_simples_fora_de_du252(base):
+    cron = montar_cronograma(_contrato(base))
+    cenario = CenarioMercado(nome="Base", choque_spread_bps=50)
+    fatores, _, _ = taxas_periodo(cron, cenario, mercado=MERCADO)
+
+    fracao = fracao_ano(cron.inicios, cron.datas, base)
+    np.testing.assert_allclose(fatores, 1 + (0.05 + 0.02 + 0.005) * fracao, rtol=1e-12)
+
+
+def test_juros_simples_com_projecao():
+    cron = montar_cronograma(_contrato("ACT/360", indexador="CDI", moeda="BRL"))
+    curva = CurvaProjecao("CDI", pd.date_range("2024-01-01", periods=60, freq="MS"), np.linspace(0.12, 0.09, 60))
+    fatores, _, _ = taxas_periodo(cron, CenarioMercado(nome="Base"), projecoes={"CDI": curva}, mercado=MERCADO)
+
+    # taxa anual equivalente da projeção em cada período (base 252) + spread, linear na fração ACT/360
+    du = contar_dias_uteis(cron.inicios, cron.datas)
+    taxa_cdi = curva.fator_periodo(cron.inicios, cron.datas) ** (252 / du) - 1
+    fracao = fracao_ano(cron.inicios, cron.datas, "ACT/360")
+    np.testing.assert_allclose(fatores, 1 + (taxa_cdi + 0.02) * fracao, rtol=1e-12)
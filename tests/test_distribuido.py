@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import distribuido
+from cenarios import CENARIOS_PADRAO
+from distribuido import (
+    FALHAS,
+    PENDENTES,
+    consolidar_rodada_distribuida,
+    preparar_rodada_distribuida,
+    rodar_distribuido_local,
+    trabalhar,
+)
+from mercado import FotoMercado
+from modelo_divida import rodar_modelo
+
+
+MERCADO = FotoMercado(
+    taxas={"CDI": 0.12, "IPCA": 0.045, "SELIC": 0.1175, "SOFR": 0.05},
+    cambios={"USD": 5.0},
+)
+
+
+def _contratos(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    linhas = []
+    for i in range(n):
+        liberacao = pd.Timestamp("2024-01-15") + pd.Timedelta(days=int(rng.integers(0, 700)))
+        periodicidade = (1, 6)[i % 2]
+        prazo = int(rng.integers(12, 60)) if periodicidade == 1 else int(rng.integers(4, 12))
+        linhas.append(
+            {
+                "Id": i + 1,
+                "Tipo": ("Antigo", "Novo")[i % 2],
+                "Descrição": f"Contrato {i + 1}",
+                "Moeda": ("BRL", "BRL", "USD")[i % 3],
+                "Valor_Contratado": float(rng.integers(1, 50)) * 1e6,
+                "Data_contratação": liberacao - pd.Timedelta(days=20),
+                "Data_liberacao": liberacao,
+                "Prazo": prazo,
+                "Carencia": int(rng.integers(0, prazo // 3 + 1)),
+                "Periodicidade": periodicidade,
+                "Sistema_Amortização": ("SAC", "PRICE")[i % 2],
+                "Indexador": ("CDI", "IPCA", "SOFR")[i % 3],
+                "Spread": float(rng.integers(0, 300)) / 10000,
+                "Fator_indexador": 1.0,
+            }
+        )
+    return pd.DataFrame(linhas)
+
+
+def test_local_com_varios_trabalhadores_igual_a_rodar_modelo(tmp_path):
+    contratos = _contratos(14)
+    saidas = rodar_distribuido_local(
+        str(tmp_path), contratos, n_trabalhadores=3, tamanho_lote=5, mercado=MERCADO
+    )
+    assert list(saidas) == [c.nome for c in CENARIOS_PADRAO]
+
+    for cenario in CENARIOS_PADRAO:
+        resumo, _, carteira, fluxo_anual, fluxo_mensal, ranking = saidas[cenario.nome]
+        esperado = rodar_modelo(contratos, cenario, mercado=MERCADO)
+        pd.testing.assert_frame_equal(resumo, esperado[0])
+        pd.testing.assert_frame_equal(carteira, esperado[2])
+        pd.testing.assert_frame_equal(fluxo_anual, esperado[3])
+        pd.testing.assert_frame_equal(fluxo_mensal, esperado[4])
+        pd.testing.assert_frame_equal(ranking, esperado[5])
+
+
+def test_tarefa_com_erro_volta_a_fila_e_depois_vai_para_falhas(tmp_path, monkeypatch):
+    diretorio = str(tmp_path)
+    tarefas = preparar_rodada_distribuida(
+        diretorio, _contratos(6), cenarios=CENARIOS_PADRAO[:1], sensibilidades=False, mercado=MERCADO, tamanho_lote=3
+    )
+    instavel, quebrada = tarefas
+    executar = distribuido._executar_tarefa
+    tentativas = {instavel: 0, quebrada: 0}
+
+    def executar_com_falhas(diretorio, tarefa, rodada, contexto):
+        tentativas[tarefa["id"]] += 1
+        if tarefa["id"] == quebrada or tentativas[tarefa["id"]] == 1:
+            raise RuntimeError(f"falha em {tarefa['id']}")
+        executar(diretorio, tarefa, rodada, contexto)
+
+    monkeypatch.setattr(distribuido, "_executar_tarefa", executar_com_falhas)
+    assert trabalhar(diretorio, "t", espera=0.01, max_tentativas=2) == 1
+
+    # a instável falhou uma vez, voltou a 'pendentes/' (só de lá as tarefas
+    # são pegas) e concluiu na segunda; a quebrada esgotou as 2 tentativas
+    assert tentativas == {instavel: 2, quebrada: 2}
+    assert not os.listdir(os.path.join(diretorio, PENDENTES))
+    assert os.listdir(os.path.join(diretorio, FALHAS)) == [f"{quebrada}.json"]
+
+    with pytest.raises(ValueError, match="esgotaram as tentativas"):
+        consolidar_rodada_distribuida(diretorio, esperar=False)
+
@@ -0,0 +1,143 @@
+import datetime as dt
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from historico import ArmazemSeries
+
+
+# Séries servidas pelo stub: CDI (SGS 12) em dias úteis e SOFR (FRED)
+CDI = pd.Series(
+    np.linspace(0.04, 0.05, 300),
+    index=pd.bdate_range("2023-01-02", periods=300),
+)
+SOFR = pd.Series(
+    np.linspace(5.0, 5.3, 300),
+    index=pd.bdate_range("2023-01-02", periods=300),
+)
+
+
+class _StubFontes(BaseHTTPRequestHandler):
+    """API SGS (/dados/serie/bcdata.sgs.<codigo>/dados) e FRED (/fred/...) locais."""
+
+    consultas: list = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        type(self).consultas.append((url.path, params))
+
+        if url.path == "/dados/serie/bcdata.sgs.12/dados":
+            inicio = pd.to_datetime(params["dataInicial"], format="%d/%m/%Y")
+            fim = pd.to_datetime(params["dataFinal"], format="%d/%m/%Y")
+            janela = CDI[(CDI.index >= inicio) & (CDI.index <= fim)]
+            if janela.empty:
+                return self._responder(404, {"erro": "sem dados"})
+            corpo = [{"data": d.strftime("%d/%m/%Y"), "valor": f"{v:.8f}".replace(".", ",")} for d, v in janela.items()]
+            return self._responder(200, corpo)
+
+        if url.path == "/fred/series/observations":
+            inicio, fim = pd.Timestamp(params["observation_start"]), pd.Timestamp(params["observation_end"])
+            janela = SOFR[(SOFR.index >= inicio) & (SOFR.index <= fim)]
+            corpo = {"observations": [{"date": d.strftime("%Y-%m-%d"), "value": f"{v:.4f}"} for d, v in janela.items()]}
+            return self._responder(200, corpo)
+
+        self._responder(404, {})
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    _StubFontes.consultas = []
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _StubFontes)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def armazem(stub, tmp_path):
+    return ArmazemSeries(
+        str(tmp_path),
+        url_sgs=stub + "/dados/serie/bcdata.sgs.{codigo}/dados",
+        url_fred=stub + "/fred/series/observations",
+        api_key_fred="teste",
+    )
+
+
+def test_atualizar_incremental_sgs(armazem):
+    corte = CDI.index[149].date()
+    assert armazem.atualizar("CDI", ate=corte) == 150
+    assert armazem.ultima_data("CDI") == corte
+
+    _StubFontes.consultas.clear()
+    assert armazem.atualizar("CDI", ate=CDI.index[-1].date()) == 150
+    # só o que falta é pedido à fonte
+    inicios = [pd.to_datetime(p["dataInicial"], format="%d/%m/%Y").date() for _, p in _StubFontes.consultas]
+    assert min(inicios) == corte + dt.timedelta(days=1)
+
+    # nada novo: nenhuma observação acrescentada
+    assert armazem.atualizar("CDI", ate=CDI.index[-1].date()) == 0
+
+    lida = armazem.ler("CDI")
+    np.testing.assert_array_equal(lida.index.values, CDI.index.values)
+    np.testing.assert_allclose(lida.to_numpy(), CDI.to_numpy(), rtol=0, atol=1e-8)
+
+
+def test_atualizar_fred(armazem):
+    assert armazem.atualizar("SOFR", ate=SOFR.index[99].date()) == 100
+    assert armazem.atualizar("SOFR", ate=SOFR.index[-1].date()) == 200
+    lida = armazem.ler("SOFR")
+    np.testing.assert_allclose(lida.to_numpy(), SOFR.to_numpy(), atol=1e-4)
+
+
+def test_leitura_por_intervalo(armazem):
+    armazem.atualizar("CDI", ate=CDI.index[-1].date())
+    armazem.atualizar("SOFR", ate=SOFR.index[-1].date())
+
+    # limites em fim de semana e inclusivos nas datas observadas
+    lida = armazem.ler("CDI", inicio="2023-03-04", fim=CDI.index[100])
+    esperada = CDI[(CDI.index >= "2023-03-04") & (CDI.index <= CDI.index[100])]
+    np.testing.assert_array_equal(lida.index.values, esperada.index.values)
+
+    assert armazem.ler("CDI", inicio="2030-01-01").empty
+    assert armazem.ler("CDI", fim="2020-01-01").empty
+
+    varias = armazem.ler_varias(["CDI", "SOFR"], inicio=CDI.index[10], fim=CDI.index[20])
+    assert list(varias.columns) == ["CDI", "SOFR"]
+    assert len(varias) == 11 and not varias.isna().any().any()
+
+
+def test_gravacao_interrompida_nao_desalinha(armazem):
+    armazem.atualizar("CDI", ate=CDI.index[99].date())
+    caminho_datas, caminho_valores = armazem._caminhos("CDI")
+
+    # valores gravados e datas não (e meio registro a mais): queda no meio do acréscimo
+    with open(caminho_valores, "ab") as f:
+        np.array([9.0, 9.0], dtype=np.float64).tofile(f)
+        f.write(b"\x00\x01\x02")
+    assert armazem.ultima_data("CDI") == CDI.index[99].date()
+
+    assert armazem.atualizar("CDI", ate=CDI.index[-1].date()) == 200
+    assert os.path.getsize(caminho_datas) == os.path.getsize(caminho_valores) == 300 * 8
+
+    lida = armazem.ler("CDI")
+    np.testing.assert_array_equal(lida.index.values, CDI.index.values)
+    np.testing.assert_allclose(lida.to_numpy(), CDI.to_numpy(), atol=1e-8)
@@ -0,0 +1,26 @@
+import time
+
+import mercado
+from mercado import Disjuntor
+
+
+def test_religamento_sobrevive_a_falha_no_cache(monkeypatch):
+    def salvar_cache(dados):
+        raise OSError("somente leitura")
+
+    monkeypatch.setattr(mercado, "salvar_cache", salvar_cache)
+    monkeypatch.setattr(mercado, "carregar_cache", lambda: {})
+
+    disjuntor = Disjuntor()
+    disjuntor.registrar_falha("X")
+    with disjuntor._trava:
+        disjuntor._estado("X").aberto_ate = 0.0
+    disjuntor.religar_em_segundo_plano("X", lambda: 0.1)
+
+    limite = time.monotonic() + 5
+    while not disjuntor.fechado("X") and time.monotonic() < limite:
+        time.sleep(0.01)
+
+    # a fonte voltou: disjuntor fechado mesmo sem conseguir gravar o cache
+    assert disjuntor.fechado("X")
+    assert disjuntor.situacao()["X"]["origem"] == "api"
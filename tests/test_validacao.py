@@ -0,0 +1,64 @@
+import pandas as pd
+
+from engine_divida import montar_cronograma
+from modelo_divida import _exigir_contratos_validos, validar_contratos
+
+
+def _planilha():
+    return pd.DataFrame(
+        {
+            "Id": [1, 2],
+            "Tipo": ["Antigo", "Novo"],
+            "Descrição": ["a", "b"],
+            "Moeda": ["BRL", "BRL"],
+            "Valor_Contratado": ["1.000.000,00", 500000],
+            "Data_contratação": ["10/05/2024", "2024-06-05"],
+            "Data_liberacao": ["05/06/2024", "2024-06-05"],
+            "Prazo": [24, "12"],
+            "Carencia": [0, 2],
+            "Periodicidade": [1, 1],
+            "Sistema_Amortização": ["SAC", "PRICE"],
+            "Indexador": ["CDI", "IPCA"],
+            "Spread": ["0,02", 0.01],
+            "Fator_indexador": [1, "1,1"],
+        }
+    )
+
+
+def test_motor_le_as_celulas_como_a_validacao():
+    planilha = _planilha()
+    assert validar_contratos(planilha).empty
+
+    normalizada = _exigir_contratos_validos(planilha)
+    cron = montar_cronograma(normalizada.iloc[0])
+    # DD/MM/AAAA: 05/06/2024 é 5 de junho, não 6 de maio
+    assert cron.data_liberacao == pd.Timestamp("2024-06-05")
+    assert cron.spread == 0.02
+    assert cron.valor == 1_000_000.0
+    # células já numéricas numa coluna com texto "0,02" não são reinterpretadas
+    assert normalizada.iloc[1]["Spread"] == 0.01
+    assert normalizada.iloc[1]["Valor_Contratado"] == 500000.0
+    assert montar_cronograma(normalizada.iloc[1]).fator == 1.1
+
+
+def test_vazios_usam_os_padroes():
+    planilha = _planilha()
+    planilha.loc[0, "Spread"] = None
+    planilha.loc[1, "Fator_indexador"] = " "
+    planilha.loc[1, "Tipo"] = "Renegociado"
+    assert validar_contratos(planilha).empty
+
+    normalizada = _exigir_contratos_validos(planilha)
+    assert normalizada["Spread"].tolist() == [0.0, 0.01]
+    assert normalizada["Fator_indexador"].tolist() == [1.0, 1.0]
+
+    planilha.loc[0, "Spread"] = "abc"
+    assert validar_contratos(planilha)["Coluna"].tolist() == ["Spread"]
+
+
+def test_carencia_igual_ao_prazo_rejeitada():
+    planilha = _planilha()
+    planilha.loc[1, "Carencia"] = 12
+    relatorio = validar_contratos(planilha)
+    assert list(relatorio["Coluna"]) == ["Carencia"]
+    assert relatorio["Linha"].tolist() == [3]